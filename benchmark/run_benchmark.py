@@ -0,0 +1,383 @@
+"""we_wish_the_perfect_weather の処理ごとの所要時間を合成データで計測する
+
+使い方（リポジトリのルートで実行する）:
+    python benchmark/run_benchmark.py
+    python benchmark/run_benchmark.py --rows 10000000 --save benchmark/baseline.json
+    python benchmark/run_benchmark.py --compare benchmark/baseline.json --threshold 0.2
+
+--compare を指定した場合、ベースラインより p50 が threshold の割合を超えて遅くなったケースを
+回帰として報告し、終了コード1で終了する
+"""
+
+import argparse
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+REPOSITORY_PATH = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPOSITORY_PATH / "src"))
+sys.path.insert(0, str(REPOSITORY_PATH / "tests"))
+
+import fixtures  # noqa: E402
+import openmeteo_requests  # noqa: E402
+
+from we_wish_the_perfect_weather.criteria import CRITERIA_COLUMNS  # noqa: E402
+from we_wish_the_perfect_weather.manager import Manager  # noqa: E402
+from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher  # noqa: E402
+from we_wish_the_perfect_weather.pollen_count_fetcher import PollenCountFetcher  # noqa: E402
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController  # noqa: E402
+
+# main.py の記録済判定までの import の所要時間の上限[s]と、読み込んではいけないモジュール
+IMPORT_BUDGET = 0.5
+IMPORT_FORBIDDEN_MODULES = [
+    "sqlalchemy",
+    "numpy",
+    "httpx",
+    "jinja2",
+    "openmeteo_requests",
+    "requests_cache",
+    "we_wish_the_perfect_weather.manager",
+]
+# deferred_stats の中で1レコードずつ upsert する場合の、upsert ごとに集計し直す場合に対する p50 の比の上限
+DEFERRED_UPSERT_RATIO = 0.5
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    items: int  # 1回の呼び出しで処理する件数
+    repeat: int
+    p50_ms: float
+    p99_ms: float
+    throughput: float  # [items/s]（p50 から計算）
+
+
+def measure(
+    name: str, func: Callable[[], object], items: int = 1, repeat: int = 20, warmup: int = 2
+) -> BenchmarkResult:
+    """func を repeat 回呼び出して所要時間を計測する
+
+    Args:
+        name (str): ケース名
+        func (Callable[[], object]): 計測対象（引数なし）
+        items (int): 1回の呼び出しで処理する件数
+        repeat (int): 計測回数
+        warmup (int): 計測前に捨てる呼び出し回数
+
+    Returns:
+        BenchmarkResult: 計測結果
+    """
+    for _ in range(warmup):
+        func()
+    elapsed_list = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func()
+        elapsed_list.append(time.perf_counter_ns() - start)
+    return summarize(name, [elapsed / 1e6 for elapsed in elapsed_list], items)
+
+
+def summarize(name: str, elapsed_ms_list: list[float], items: int = 1) -> BenchmarkResult:
+    """計測した所要時間[ms]のリストから p50/p99 とスループットを計算して表示する"""
+    p50, p99 = np.percentile(np.array(elapsed_ms_list, dtype=np.float64), [50, 99])
+    result = BenchmarkResult(
+        name=name,
+        items=items,
+        repeat=len(elapsed_ms_list),
+        p50_ms=float(p50),
+        p99_ms=float(p99),
+        throughput=float(items / (p50 / 1e3)) if p50 > 0 else float("inf"),
+    )
+    print(f"{name:<44} {result.p50_ms:>10.3f} {result.p99_ms:>10.3f} {result.throughput:>14,.0f}", flush=True)
+    return result
+
+
+def build_config(work_path: Path, n_locations: int) -> dict:
+    """計測用の設定辞書を作成して work_path/config/config.json に書き出す"""
+    config = orjson.loads((REPOSITORY_PATH / "config" / "config_sample.json").read_bytes())
+    config["locations"] = fixtures.get_locations(n_locations)
+    config["db"] = {"save_path": str(work_path / "db"), "save_file_name": "PW_DB.db"}
+    config["discord_webhook_url"]["is_post_discord_notify"] = False
+    (work_path / "db").mkdir(parents=True, exist_ok=True)
+    (work_path / "config").mkdir(parents=True, exist_ok=True)
+    (work_path / "config" / "config.json").write_bytes(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+    (work_path / "log").mkdir(parents=True, exist_ok=True)
+    shutil.copy(REPOSITORY_PATH / "log" / "msg.html", work_path / "log" / "msg.html")
+    return config
+
+
+def bench_open_meteo(config: dict, n_locations: int, repeat: int) -> list[BenchmarkResult]:
+    fetcher = OpenMeteoFetcher(config)
+    # ネットワークの代わりに合成した FlatBuffers のレスポンスを返す
+    fetcher.open_meteo = openmeteo_requests.Client(session=fixtures.PayloadSession())
+    locations = fixtures.get_locations(n_locations)
+    target_date = fixtures.BASE_DATE.isoformat()
+
+    result_list = [
+        measure(f"open_meteo.fetch[{n_locations}]", lambda: fetcher.fetch(locations), n_locations, repeat),
+    ]
+    name_list = [location["name"] for location in locations]
+
+    def interpret_all():
+        for name in name_list:
+            fetcher.interpret(target_date, "forecast", name)
+
+    result_list.append(measure(f"open_meteo.interpret[{n_locations}]", interpret_all, n_locations, repeat))
+    return result_list
+
+
+def bench_pollen_count(config: dict, repeat: int) -> list[BenchmarkResult]:
+    fetcher = PollenCountFetcher(config)
+    result_list = []
+    for n_days in [2, 31, 365]:
+        csv = fixtures.build_pollen_csv(n_days)
+
+        def parse(csv=csv):
+            return fetcher.aggregate_daily(fetcher.parse_csv(csv))
+
+        result_list.append(measure(f"pollen_count.parse[{n_days * 24} lines]", parse, n_days * 24, repeat))
+
+    fetcher.daily_data["tokyo"] = parse()
+    date_list = fetcher.daily_data["tokyo"]["date_list"].astype(str).tolist()
+
+    def interpret_all():
+        for target_date in date_list:
+            fetcher.interpret(target_date, "actual", "tokyo")
+
+    result_list.append(measure(f"pollen_count.interpret[{len(date_list)}]", interpret_all, len(date_list), repeat))
+    return result_list
+
+
+def bench_check_perfection(manager: Manager, repeat: int) -> list[BenchmarkResult]:
+    record_list = fixtures.build_records(10_000)
+
+    def check_each():
+        for record in record_list[:1000]:
+            manager.check_perfection(record)
+
+    columns = {column: [record[column] for record in record_list] for column in CRITERIA_COLUMNS}
+    return [
+        measure("manager.check_perfection[1000]", check_each, 1000, repeat),
+        measure(
+            "manager.check_perfection_batch[10000]",
+            lambda: manager.check_perfection_batch(columns),
+            len(record_list),
+            repeat,
+        ),
+    ]
+
+
+def bench_weather_db(work_path: Path, n_rows: int, repeat: int) -> tuple[list[BenchmarkResult], list[str]]:
+    """WeatherDBController の書き込みと読み出しを計測する
+
+    Notes:
+        deferred_stats の中での upsert（抜けるときの集計を含む）が、upsert ごとに集計し直す場合の
+        DEFERRED_UPSERT_RATIO 倍を超えた場合は違反として返す
+
+    Returns:
+        tuple[list[BenchmarkResult], list[str]]: (計測結果, 違反内容のリスト)
+    """
+    print(f"# building weather db ({n_rows:,} rows) ...", flush=True)
+    start = time.perf_counter()
+    db_fullpath = fixtures.build_weather_db(work_path / "db" / f"bench_{n_rows}.db", n_rows)
+    print(f"# done ({time.perf_counter() - start:.1f}s)", flush=True)
+
+    weather_db = WeatherDBController(db_fullpath)
+    # 既存のレコードを更新する upsert と、新規の地点を追加する upsert の両方を計測する
+    existing_list = fixtures.build_records(min(n_rows, 1000), start_index=0, seed=fixtures.SEED + 1)
+    # insert は呼び出しごとに未登録の地点のレコードを使う（計測後のDBの件数は増える）
+    new_iter = iter([
+        fixtures.build_records(1000, start_index=n_rows + 1000 * i, seed=fixtures.SEED + 1) for i in range(repeat + 2)
+    ])
+    target_list = [(record["target_date"], record["record_type"], record["location"]) for record in existing_list]
+
+    def upsert_each():
+        for record in existing_list[:100]:
+            weather_db.upsert(record)
+
+    def upsert_deferred():
+        with weather_db.deferred_stats():
+            upsert_each()
+
+    def select_by_target_date_each():
+        for target_date, record_type, location in target_list[:100]:
+            weather_db.select_by_target_date(target_date, record_type, location)
+
+    def select_stats_each():
+        for _, _, location in target_list[:100]:
+            weather_db.select_monthly_stats(location)
+            weather_db.select_streak(location)
+
+    upsert_result = measure("weather_db.upsert[100]", upsert_each, 100, repeat)
+    deferred_result = measure("weather_db.upsert[deferred 100]", upsert_deferred, 100, repeat)
+    violation_list = []
+    if deferred_result.p50_ms > upsert_result.p50_ms * DEFERRED_UPSERT_RATIO:
+        violation_list.append(
+            f"weather_db.upsert[deferred 100] {deferred_result.p50_ms:.1f}ms exceeds "
+            f"{DEFERRED_UPSERT_RATIO} x weather_db.upsert[100] {upsert_result.p50_ms:.1f}ms"
+        )
+    return [
+        upsert_result,
+        deferred_result,
+        measure("weather_db.upsert_many[update 1000]", lambda: weather_db.upsert_many(existing_list), 1000, repeat),
+        measure("weather_db.upsert_many[insert 1000]", lambda: weather_db.upsert_many(next(new_iter)), 1000, repeat),
+        measure("weather_db.select[300]", lambda: weather_db.select(300), 300, repeat),
+        measure("weather_db.select_records[10000]", lambda: weather_db.select_records(10000), 10000, repeat),
+        measure("weather_db.select_by_target_date[100]", select_by_target_date_each, 100, repeat),
+        measure("weather_db.select_stats[100]", select_stats_each, 100, repeat),
+    ], violation_list
+
+
+def bench_render(manager: Manager, repeat: int) -> list[BenchmarkResult]:
+    record_list = fixtures.build_records(1000)
+    check_matrix, _ = manager.check_perfection_batch({
+        column: [record[column] for record in record_list] for column in CRITERIA_COLUMNS
+    })
+    check_list = [[bool(c) for c in check] for check in check_matrix.tolist()]
+    template = manager.msg_template
+
+    def render_all():
+        for record, check in zip(record_list, check_list):
+            template.render(record=record, base=Manager.PW_BASE, check=check)
+
+    return [measure("manager.msg_template.render[1000]", render_all, len(record_list), repeat)]
+
+
+def bench_import(repeat: int) -> tuple[list[BenchmarkResult], list[str]]:
+    """main.py の記録済判定までに必要なモジュールの読み込み時間を計測する
+
+    Notes:
+        読み込みは別プロセスで行い、所要時間が IMPORT_BUDGET を超えた場合や
+        IMPORT_FORBIDDEN_MODULES が読み込まれた場合は違反として返す
+
+    Returns:
+        tuple[list[BenchmarkResult], list[str]]: (計測結果, 違反内容のリスト)
+    """
+    code = "\n".join([
+        "import sys, time",
+        "start = time.perf_counter()",
+        "import orjson",
+        "from we_wish_the_perfect_weather.done_check import is_already_done",
+        "from we_wish_the_perfect_weather.process_lock import ProcessLock",
+        "elapsed = time.perf_counter() - start",
+        f"loaded = [m for m in {IMPORT_FORBIDDEN_MODULES!r} if m in sys.modules]",
+        "print(orjson.dumps({'elapsed': elapsed, 'loaded': loaded}).decode())",
+    ])
+    env = os.environ | {"PYTHONPATH": str(REPOSITORY_PATH / "src")}
+    elapsed_ms_list, loaded = [], []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, check=True)
+        output = orjson.loads(completed.stdout)
+        elapsed_ms_list.append(output["elapsed"] * 1e3)
+        loaded = output["loaded"]
+    result = summarize("main.import_fast_path", elapsed_ms_list)
+
+    violation_list = [f"main.import_fast_path loads {m}" for m in loaded]
+    if result.p50_ms > IMPORT_BUDGET * 1e3:
+        violation_list.append(f"main.import_fast_path {result.p50_ms:.1f}ms exceeds {IMPORT_BUDGET * 1e3:.0f}ms")
+    return [result], violation_list
+
+
+def compare(result_list: list[BenchmarkResult], baseline_path: Path, threshold: float) -> list[str]:
+    """ベースラインと比較して、p50 が threshold の割合を超えて遅くなったケースを返す
+
+    Args:
+        result_list (list[BenchmarkResult]): 今回の計測結果
+        baseline_path (Path): save で保存したベースラインのパス
+        threshold (float): 許容する悪化の割合（0.2 なら 20%）
+
+    Returns:
+        list[str]: 回帰したケースの説明のリスト
+    """
+    baseline = {r["name"]: r for r in orjson.loads(baseline_path.read_bytes())["results"]}
+    regression_list = []
+    print(f"\n{'name':<44} {'base p50':>10} {'p50':>10} {'ratio':>8}")
+    for result in result_list:
+        if result.name not in baseline:
+            print(f"{result.name:<44} {'-':>10} {result.p50_ms:>10.3f} {'new':>8}")
+            continue
+        base_p50 = baseline[result.name]["p50_ms"]
+        ratio = result.p50_ms / base_p50 if base_p50 > 0 else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  <- REGRESSION"
+            regression_list.append(f"{result.name} p50 {base_p50:.3f}ms -> {result.p50_ms:.3f}ms (x{ratio:.2f})")
+        print(f"{result.name:<44} {base_p50:>10.3f} {result.p50_ms:>10.3f} {ratio:>8.2f}{mark}")
+    return regression_list
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="we_wish_the_perfect_weather benchmark.")
+    parser.add_argument("--rows", type=int, default=10_000, help="事前に登録しておくDBのレコード数 (10k ~ 10M)")
+    parser.add_argument("--locations", type=int, default=100, help="open_meteo.fetch で1回に取得する地点数")
+    parser.add_argument("--repeat", type=int, default=20, help="ケースごとの計測回数")
+    parser.add_argument("--work-dir", type=Path, default=None, help="合成DB等の作業ディレクトリ（指定時は再利用する）")
+    parser.add_argument("--save", type=Path, default=None, help="計測結果をベースラインとして保存するパス")
+    parser.add_argument("--compare", type=Path, default=None, help="比較するベースラインのパス")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回帰とみなす p50 の悪化の割合")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.work_dir is None:
+        temp_dir = tempfile.TemporaryDirectory(prefix="pw_benchmark_")
+        work_path = Path(temp_dir.name)
+    else:
+        work_path = args.work_dir.resolve()
+        work_path.mkdir(parents=True, exist_ok=True)
+
+    current_path = Path.cwd()
+    try:
+        config = build_config(work_path, args.locations)
+        # Manager は設定とテンプレートを作業ディレクトリからの相対パスで読む
+        os.chdir(work_path)
+        manager = Manager()
+
+        print(f"{'name':<44} {'p50[ms]':>10} {'p99[ms]':>10} {'items/s':>14}")
+        result_list = []
+        result_list.extend(bench_open_meteo(config, args.locations, args.repeat))
+        result_list.extend(bench_pollen_count(config, args.repeat))
+        result_list.extend(bench_check_perfection(manager, args.repeat))
+        weather_db_result_list, violation_list = bench_weather_db(work_path, args.rows, args.repeat)
+        result_list.extend(weather_db_result_list)
+        result_list.extend(bench_render(manager, args.repeat))
+        import_result_list, import_violation_list = bench_import(min(args.repeat, 5))
+        result_list.extend(import_result_list)
+        violation_list.extend(import_violation_list)
+    finally:
+        os.chdir(current_path)
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": args.rows,
+            "locations": args.locations,
+            "results": [asdict(result) for result in result_list],
+        }
+        args.save.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+        print(f"\nbaseline saved: {args.save}")
+
+    regression_list = []
+    if args.compare:
+        regression_list = compare(result_list, args.compare, args.threshold)
+
+    for message in violation_list + regression_list:
+        print(f"NG: {message}")
+    return 1 if violation_list or regression_list else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,35 +1,121 @@
+import argparse
 import logging.config
 from logging import INFO, getLogger
 from pathlib import Path
 
-from we_wish_the_perfect_weather.manager import Manager
+import orjson
+
+from we_wish_the_perfect_weather.done_check import is_already_done
+from we_wish_the_perfect_weather.process_lock import ProcessLock
+
+
+def is_own_log(record: logging.LogRecord) -> bool:
+    """自分のログかどうかを返す（自分以外のすべてのライブラリのログ出力を抑制するハンドラのフィルタ）
+
+    Notes:
+        httpx, sqlalchemy 等は必要になった時点で読み込むため、ここで既存のロガーを無効にしても抑制できない
+        出力先のハンドラでロガー名から絞り込み、後から作られるロガーのログも抑制する
+    """
+    return record.name == __name__ or "we_wish_the_perfect_weather" in record.name
+
 
 logging.config.fileConfig("./log/logging.ini", disable_existing_loggers=False)
-for name in logging.root.manager.loggerDict:
-    # 自分以外のすべてのライブラリのログ出力を抑制
-    if "we_wish_the_perfect_weather" not in name:
-        getLogger(name).disabled = True
+for handler in logging.root.handlers:
+    handler.addFilter(is_own_log)
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
 PREVENT_MULTIPLE_RUN_PATH = "./prevent_multiple_run"
+CONFIG_PATH = "./config/config.json"
+# ロックを取得せずに実行するサブコマンド（DBの読み取りのみ）
+READONLY_COMMANDS = ["query", "accuracy", "export"]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="We wish the perfect weather.")
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill", help="過去の実測値を期間指定で記録する")
+    backfill_parser.add_argument("--from", dest="from_date", required=True, help="開始日 (YYYY-MM-DD)")
+    backfill_parser.add_argument("--to", dest="to_date", required=True, help="終了日 (YYYY-MM-DD)")
+    replay_parser = subparsers.add_parser("replay", help="保存済の1時間ごとの値から期間内のレコードを作り直す")
+    replay_parser.add_argument("--from", dest="from_date", required=True, help="開始日 (YYYY-MM-DD)")
+    replay_parser.add_argument("--to", dest="to_date", required=True, help="終了日 (YYYY-MM-DD)")
+    subparsers.add_parser("rescore", help="現行の判定基準で記録済のレコードを再判定する")
+    subparsers.add_parser("rebuild-stats", help="集計テーブルを記録済の全レコードから作り直す")
+    query_parser = subparsers.add_parser("query", help='期間内の "完璧な気候" の日を閾値のプロファイルで検索する')
+    query_parser.add_argument("--from", dest="from_date", required=True, help="開始日 (YYYY-MM-DD)")
+    query_parser.add_argument("--to", dest="to_date", required=True, help="終了日 (YYYY-MM-DD)")
+    query_parser.add_argument("--location", default=None, help="観測地点名（省略時は全地点）")
+    query_parser.add_argument("--profile", default="", help="設定 profiles のプロファイル名（省略時は既定の閾値）")
+    query_parser.add_argument("--record-type", default="actual", choices=["actual", "forecast"], help="レコードタイプ")
+    accuracy_parser = subparsers.add_parser("accuracy", help="期間内の予報値を実測値と比較して予報の精度を出力する")
+    accuracy_parser.add_argument("--from", dest="from_date", required=True, help="開始日 (YYYY-MM-DD)")
+    accuracy_parser.add_argument("--to", dest="to_date", required=True, help="終了日 (YYYY-MM-DD)")
+    accuracy_parser.add_argument("--location", default=None, help="観測地点名（省略時は全地点）")
+    export_parser = subparsers.add_parser("export", help="記録済のレコードをファイルに書き出す")
+    export_parser.add_argument("--format", dest="export_format", required=True, choices=["csv", "jsonl", "parquet"])
+    export_parser.add_argument("--output", required=True, help="出力先のパス")
+    export_parser.add_argument("--from", dest="from_date", default=None, help="開始日 (YYYY-MM-DD)")
+    export_parser.add_argument("--to", dest="to_date", default=None, help="終了日 (YYYY-MM-DD)")
+    export_parser.add_argument("--record-type", default=None, choices=["actual", "forecast"], help="レコードタイプ")
+    subparsers.add_parser("daemon", help="常駐して定期的に記録する")
+    args = parser.parse_args()
+
     horizontal_line = "-" * 100
     logger.info(horizontal_line)
     logger.info("We wish the perfect weather run -> start.")
-    p = Path(PREVENT_MULTIPLE_RUN_PATH)
+    # 多重起動防止はOSのファイルロックで行う（異常終了してもロックは残らない）
+    lock = ProcessLock(PREVENT_MULTIPLE_RUN_PATH)
     try:
-        if not p.exists():
-            p.touch()
+        if args.command is None and is_already_done(orjson.loads(Path(CONFIG_PATH).read_bytes())):
+            # 記録済なら Manager を構築せずに終了する
+            logger.info("Target date is already done.")
+        elif args.command in READONLY_COMMANDS:
+            # 読み取りのみのため、常駐中の実行がロックを保持していても実行できるようにする
+            # ただし、DBを開く際にスキーマの作成・移行（書き込み）が必要な場合はロックを取得してから行う
+            from we_wish_the_perfect_weather.manager import Manager
+            from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
             manager = Manager()
-            manager.run()
+            if WeatherDBController.is_migration_needed(manager.db_fullpath) and not lock.acquire():
+                logger.info("DB schema migration is required, but another run holds the lock -> abort.")
+            elif args.command == "query":
+                record_list = manager.select_perfect_days(
+                    args.from_date, args.to_date, args.location, args.profile, args.record_type
+                )
+                for record in record_list:
+                    print(orjson.dumps(record).decode())
+                logger.info(f"{len(record_list)} perfect day(s) found.")
+            elif args.command == "accuracy":
+                result = manager.forecast_accuracy(args.from_date, args.to_date, args.location)
+                print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+                logger.info(f"{result['n_pairs']} forecast/actual pair(s) compared.")
+            elif args.command == "export":
+                manager.export(args.output, args.export_format, args.from_date, args.to_date, args.record_type)
+        elif lock.acquire():
+            # 重いモジュールの読み込みは実行が必要な場合のみ行う
+            from we_wish_the_perfect_weather.manager import Manager
+
+            manager = Manager()
+            if args.command == "backfill":
+                manager.backfill(args.from_date, args.to_date)
+            elif args.command == "replay":
+                manager.replay(args.from_date, args.to_date)
+            elif args.command == "rescore":
+                manager.rescore()
+            elif args.command == "rebuild-stats":
+                manager.rebuild_stats()
+            elif args.command == "daemon":
+                from we_wish_the_perfect_weather.daemon import Daemon
+
+                Daemon(manager).run_forever()
+            else:
+                manager.run()
         else:
             logger.info("Multiple run -> abort.")
     except Exception as e:
         logger.exception(e)
     finally:
-        p.unlink(missing_ok=True)
+        lock.release()
     logger.info("We wish the perfect weather run -> done.")
     logger.info(horizontal_line)
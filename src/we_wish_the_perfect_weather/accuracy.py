@@ -0,0 +1,174 @@
+from logging import INFO, getLogger
+
+import numpy as np
+
+from we_wish_the_perfect_weather.criteria import MISSING_VALUE
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# 予報値と実測値の誤差を評価する列
+ACCURACY_COLUMNS = [
+    "maximum_temperature",
+    "minimum_temperature",
+    "maximum_humidity",
+    "minimum_humidity",
+    "maximum_wind_speed",
+    "maximum_pollen_count",
+]
+
+
+def evaluate_accuracy(pairs: dict[str, list]) -> dict:
+    """予報値と実測値の組から、列ごとの誤差と is_perfect の的中の件数を計算する
+
+    Notes:
+        全体と地点ごとの集計を、列ごとの配列に対する NumPy の演算でまとめて行う
+        （地点ごとの集計は np.unique の逆引きと np.bincount で行い、レコードごとのループは行わない）
+        誤差は 予報値 - 実測値 とし、bias は誤差の平均、mae は絶対誤差の平均、rmse は二乗誤差の平均の平方根
+        is_perfect は予報を陽性として tp: 予報 完璧/実測 完璧, fp: 予報 完璧/実測 否,
+        fn: 予報 否/実測 完璧, tn: 予報 否/実測 否 の件数を数える
+
+    Args:
+        pairs (dict[str, list]): WeatherDBController.select_forecast_pairs の返り値
+                                 （ACCURACY_COLUMNS と is_perfect の列を含む）
+
+    Returns:
+        dict: 以下の形式の辞書（件数が0の値は None）
+            {
+                "n_pairs": (int),
+                "fields": {
+                    列名: {"n": (int), "bias": (float), "mae": (float), "rmse": (float), "max_abs_error": (float)},
+                },
+                "perfection": {
+                    "tp": (int), "fp": (int), "fn": (int), "tn": (int),
+                    "precision": (float), "recall": (float), "accuracy": (float),
+                },
+                "locations": {
+                    観測地点名: {"n_pairs": (int), "fields": {列名: {"n", "bias", "mae"}}, "perfection": {...}},
+                },
+            }
+    """
+    location_list, location_index = np.unique(np.asarray(pairs["location"], dtype=str), return_inverse=True)
+    n_locations = len(location_list)
+    n_pairs = len(location_index)
+
+    field_dict = {}
+    location_field_list = [{} for _ in range(n_locations)]
+    for column in ACCURACY_COLUMNS:
+        forecast = np.asarray(pairs[f"forecast_{column}"], dtype=np.float64)
+        actual = np.asarray(pairs[f"actual_{column}"], dtype=np.float64)
+        # 予報値と実測値のどちらかが取得できなかった値の組は、その列の誤差の評価から除く
+        valid = (forecast != MISSING_VALUE) & (actual != MISSING_VALUE)
+        error = np.where(valid, forecast - actual, 0.0)
+        n = int(valid.sum())
+        field_dict[column] = {
+            "n": n,
+            "bias": float(error.sum() / n) if n else None,
+            "mae": float(np.abs(error).sum() / n) if n else None,
+            "rmse": float(np.sqrt(np.square(error).sum() / n)) if n else None,
+            "max_abs_error": float(np.abs(error).max()) if n else None,
+        }
+
+        n_by_location = np.bincount(location_index, weights=valid, minlength=n_locations)
+        error_by_location = np.bincount(location_index, weights=error, minlength=n_locations)
+        abs_error_by_location = np.bincount(location_index, weights=np.abs(error), minlength=n_locations)
+        for i in range(n_locations):
+            n = int(n_by_location[i])
+            location_field_list[i][column] = {
+                "n": n,
+                "bias": float(error_by_location[i] / n) if n else None,
+                "mae": float(abs_error_by_location[i] / n) if n else None,
+            }
+
+    # 予報/実測の is_perfect の組を 0: tp, 1: fp, 2: fn, 3: tn に割り当てて数える
+    forecast_perfect = np.asarray(pairs["forecast_is_perfect"], dtype=bool)
+    actual_perfect = np.asarray(pairs["actual_is_perfect"], dtype=bool)
+    outcome = (~forecast_perfect).astype(np.int64) * 2 + (~actual_perfect).astype(np.int64)
+    confusion = np.bincount(location_index * 4 + outcome, minlength=n_locations * 4).reshape(n_locations, 4)
+
+    return {
+        "n_pairs": n_pairs,
+        "fields": field_dict,
+        "perfection": summarize_confusion(confusion.sum(axis=0)),
+        "locations": {
+            str(location): {
+                "n_pairs": int(confusion[i].sum()),
+                "fields": location_field_list[i],
+                "perfection": summarize_confusion(confusion[i]),
+            }
+            for i, location in enumerate(location_list)
+        },
+    }
+
+
+def summarize_confusion(confusion: np.ndarray) -> dict:
+    """[tp, fp, fn, tn] の件数から、件数と適合率・再現率・正解率の辞書を返す"""
+    tp, fp, fn, tn = (int(count) for count in confusion)
+    n = tp + fp + fn + tn
+    return {
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "tn": tn,
+        # 予報が "完璧な気候" だったときに、実測も "完璧な気候" だった割合
+        "precision": tp / (tp + fp) if tp + fp else None,
+        # 実測が "完璧な気候" だったときに、予報も "完璧な気候" だった割合
+        "recall": tp / (tp + fn) if tp + fn else None,
+        "accuracy": (tp + tn) / n if n else None,
+    }
+
+
+class ForecastAccuracy:
+    """予報値と実測値を比較して、予報の精度を評価する
+
+    Notes:
+        期間内の予報値と実測値の組を1つのクエリで取得し、evaluate_accuracy でまとめて計算する
+        結果は (開始日, 終了日, 観測地点名) をキーにキャッシュし、
+        weather_db.write_count が変わった（このプロセスからDBに書き込んだ）場合は計算し直す
+        別のプロセスが書き込んだ場合は反映されないため、必要なら clear を呼ぶ
+    """
+
+    def __init__(self, weather_db: WeatherDBController):
+        self.weather_db = weather_db
+        # (開始日, 終了日, 観測地点名) -> (計算時の write_count, 結果)
+        self.cache: dict[tuple[str, str, str | None], tuple[int, dict]] = {}
+
+    def evaluate(self, start_date: str, end_date: str, location: str | None = None) -> dict:
+        """期間内の予報の精度を返す
+
+        Args:
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
+            location (str | None): 観測地点名、None なら全地点
+
+        Returns:
+            dict: evaluate_accuracy の返り値に "start_date", "end_date", "location" を付加した辞書
+        """
+        key = (start_date, end_date, location)
+        write_count = self.weather_db.write_count
+        if key in self.cache and self.cache[key][0] == write_count:
+            return self.cache[key][1]
+
+        pairs = self.weather_db.select_forecast_pairs(
+            start_date, end_date, [*ACCURACY_COLUMNS, "is_perfect"], location
+        )
+        result = {"start_date": start_date, "end_date": end_date, "location": location} | evaluate_accuracy(pairs)
+        self.cache[key] = (write_count, result)
+        return result
+
+    def clear(self) -> None:
+        """キャッシュをすべて破棄する"""
+        self.cache.clear()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+
+    import orjson
+
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    db_fullpath = Path(config["db"]["save_path"]) / config["db"]["save_file_name"]
+    accuracy = ForecastAccuracy(WeatherDBController(db_fullpath))
+    result = accuracy.evaluate("2025-01-01", "2025-12-31")
+    print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
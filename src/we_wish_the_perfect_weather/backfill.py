@@ -0,0 +1,172 @@
+from datetime import date
+from logging import INFO, getLogger
+from pathlib import Path
+
+import numpy as np
+
+from we_wish_the_perfect_weather.criteria import MISSING_VALUE, criteria_version, evaluate_perfection
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.open_meteo_archive_fetcher import OpenMeteoArchiveFetcher
+from we_wish_the_perfect_weather.util import chunked, get_locations, get_yesterday, month_range_list
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class Backfiller:
+    """過去の実測値を期間指定で取得して、actual レコードとしてDBに記録する
+
+    Notes:
+        期間を月ごと、地点を chunk_size ごとに分割し、分割単位で
+        取得 → 日ごとの集計 → 判定 → upsert_many（1トランザクション）を行う
+        登録済の日付はスキップするため、中断しても再実行すれば続きから再開できる
+    """
+
+    RECORD_TYPE = "actual"
+    # 花粉飛散数は過去分を取得できないため、欠測値とする（取得元が提供しない値なので、花粉飛散数の基準は判定しない）
+    POLLEN_COUNT_MISSING = MISSING_VALUE
+
+    def __init__(self, config: dict, weather_db: WeatherDBController, base: dict, registered_at: str):
+        self.config = config
+        self.locations = get_locations(config)
+        self.weather_db = weather_db
+        self.base = base
+        self.registered_at = registered_at
+        self.is_store_hourly = bool(config["db"].get("is_store_hourly", True))
+        self.fetcher = OpenMeteoArchiveFetcher(config)
+
+    def run(self, from_date: str, to_date: str) -> int:
+        """期間内の実測値をDBに記録する
+
+        Args:
+            from_date (str): 開始日 "%Y-%m-%d"形式
+            to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む、昨日より後は昨日に丸める）
+
+        Returns:
+            int: 記録したレコード数
+        """
+        yesterday = get_yesterday()[:10]
+        if to_date > yesterday:
+            to_date = yesterday
+        if from_date > to_date:
+            raise ValueError(f"Invalid date range, from={from_date} to={to_date}.")
+
+        count = 0
+        # 集計テーブルは月・チャンクごとではなく、最後に更新した (地点, 月) と地点についてまとめて集計し直す
+        with self.weather_db.deferred_stats():
+            for start_date, end_date in month_range_list(from_date, to_date):
+                for locations in chunked(self.locations, self.fetcher.chunk_size):
+                    count += self.backfill_chunk(locations, start_date, end_date)
+        return count
+
+    def backfill_chunk(self, locations: list[dict], start_date: str, end_date: str) -> int:
+        """1チャンク分（1か月 × chunk_size 地点）を取得してDBに記録する
+
+        Args:
+            locations (list[dict]): 観測地点辞書のリスト
+            start_date (str): 開始日 "%Y-%m-%d"形式
+            end_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+
+        Returns:
+            int: 記録したレコード数
+        """
+        n_days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days + 1
+        name_list = [location["name"] for location in locations]
+        registered = self.weather_db.select_target_dates(name_list, Backfiller.RECORD_TYPE, start_date, end_date)
+        pending = [location for location in locations if len(registered[location["name"]]) < n_days]
+        if not pending:
+            logger.info(f"Backfill [{start_date}, {end_date}] {len(locations)} location(s) -> already done.")
+            return 0
+
+        # チャンクごとに取得結果を破棄して、メモリ使用量を一定に保つ
+        self.fetcher.fetched_data.clear()
+        self.fetcher.daily_data.clear()
+        self.fetcher.set_date_range(start_date, end_date)
+        with instrumentation.span("fetch", fetcher=type(self.fetcher).__name__):
+            self.fetcher.fetch(pending)
+
+        record_list = []
+        with instrumentation.span("interpret"):
+            for location in pending:
+                name = location["name"]
+                if name not in self.fetcher.daily_data:
+                    continue
+                record_list.extend(self.build_records(name, self.fetcher.daily_data[name], registered[name]))
+
+        with instrumentation.span("upsert"):
+            count = self.weather_db.upsert_many(record_list)
+            if self.is_store_hourly:
+                self.weather_db.upsert_hourly_many(self.fetcher.dump_hourly_records(record_list))
+        instrumentation.add("rows_written", count)
+        logger.info(f"Backfill [{start_date}, {end_date}] {len(pending)} location(s) -> {count} record(s).")
+        return count
+
+    def build_records(self, location: str, daily_data: dict, registered: set[str]) -> list[dict]:
+        """日ごとの集計値から、登録用のレコードをまとめて組み立てる
+
+        Notes:
+            欠測(NaN)を含む日は登録しない（次回の実行で再取得する）
+
+        Args:
+            location (str): 観測地点名
+            daily_data (dict): OpenMeteoFetcher.aggregate_daily の返り値
+            registered (set[str]): 登録済の target_date の集合
+
+        Returns:
+            list[dict]: レコード辞書のリスト
+        """
+        date_list = daily_data["date_list"].astype(str).tolist()
+        float_columns = [
+            "maximum_temperature",
+            "minimum_temperature",
+            "maximum_precipitation",
+            "maximum_wind_speed",
+        ]
+        int_columns = [
+            "maximum_humidity",
+            "minimum_humidity",
+            "maximum_precipitation_probability",
+        ]
+        valid = ~np.isnan(np.stack([daily_data[column] for column in float_columns + int_columns])).any(axis=0)
+
+        columns = {column: daily_data[column] for column in float_columns + int_columns}
+        columns["maximum_pollen_count"] = np.full(len(date_list), Backfiller.POLLEN_COUNT_MISSING)
+        _, is_perfect_list = evaluate_perfection(columns, self.base)
+
+        # 組み立て前にまとめて Python 標準の型に変換しておく
+        values = {column: daily_data[column].tolist() for column in float_columns}
+        for column in int_columns:
+            values[column] = np.where(valid, daily_data[column], 0).astype(np.int64).tolist()
+        is_perfect_list = is_perfect_list.tolist()
+        version = criteria_version(self.base)
+
+        record_list = []
+        for i, target_date in enumerate(date_list):
+            if not valid[i] or target_date in registered:
+                continue
+            record = {
+                "location": location,
+                "target_date": target_date,
+                "record_type": Backfiller.RECORD_TYPE,
+                "is_perfect": is_perfect_list[i],
+                "maximum_pollen_count": Backfiller.POLLEN_COUNT_MISSING,
+                "registered_at": self.registered_at,
+                "criteria_version": version,
+            }
+            for column, value_list in values.items():
+                record[column] = value_list[i]
+            record_list.append(record)
+        return record_list
+
+
+if __name__ == "__main__":
+    import orjson
+
+    from we_wish_the_perfect_weather.manager import Manager
+    from we_wish_the_perfect_weather.util import get_now
+
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    db_fullpath = Path(config["db"]["save_path"]) / config["db"]["save_file_name"]
+    backfiller = Backfiller(config, WeatherDBController(db_fullpath), Manager.PW_BASE, get_now())
+    print(backfiller.run("2025-05-01", "2025-05-31"))
@@ -0,0 +1,167 @@
+import sqlite3
+import time
+from contextlib import closing
+from logging import INFO, getLogger
+from pathlib import Path
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが open のため、リクエストを送信しなかった"""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"circuit breaker is open for {endpoint}")
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    """上流のAPIのエンドポイントごとのサーキットブレーカー
+
+    Notes:
+        状態はディスク(SQLite)に保存し、実行やプロセス（ShardedRunner のワーカー等）をまたいで共有する
+        closed: 通常通りリクエストする、連続して failure_threshold 回失敗したら open にする
+        open: リクエストを送信せずに失敗とする、open にしてから reset_timeout 秒経ったら half_open にして
+              1つのリクエストだけを試行として通す
+        half_open: 試行が成功したら closed に、失敗したら open に戻す、試行中の他のリクエストは通さない
+                   （試行したプロセスが結果を記録せずに終了した場合に備え、reset_timeout 秒経ったら次の試行を通す）
+        状態の読み書きに失敗してもリクエストは通す（ブレーカーが無い場合と同じ扱いとする）
+    """
+
+    PATH = "~/.cache/we-wish-the-perfect-weather/circuit_breaker.db"
+    FAILURE_THRESHOLD = 5  # open にする連続失敗回数
+    RESET_TIMEOUT = 300  # open にしてから試行を通すまでの時間[s]
+
+    def __init__(
+        self, path: str | Path = PATH, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT
+    ):
+        self.path = Path(path).expanduser().resolve()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(self.connect()) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS circuit (
+                        endpoint TEXT PRIMARY KEY,
+                        state TEXT NOT NULL,
+                        failures INTEGER NOT NULL,
+                        changed_at REAL NOT NULL
+                    )
+                """)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Circuit breaker is unavailable, {e}.")
+
+    def connect(self) -> sqlite3.Connection:
+        # 状態の読み取りと更新を1つの書き込みトランザクションで行うため、トランザクションは自前で開始する
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def state(self, endpoint: str) -> str:
+        """エンドポイントの現在の状態 [CLOSED, OPEN, HALF_OPEN] を返す（記録が無ければ CLOSED）"""
+        try:
+            with closing(self.connect()) as conn:
+                row = conn.execute("SELECT state FROM circuit WHERE endpoint = ?", (endpoint,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker read failed, {e}.")
+            return CLOSED
+        return CLOSED if row is None else row[0]
+
+    def allow_request(self, endpoint: str) -> bool:
+        """エンドポイントにリクエストを送信してよいかを返す
+
+        Notes:
+            open にしてから reset_timeout 秒経っていれば half_open にして True を返す
+            （このリクエストが試行となり、結果を record_success / record_failure で記録すること）
+
+        Args:
+            endpoint (str): エンドポイントのURL
+
+        Returns:
+            bool: 送信してよい場合True
+        """
+        now = time.time()
+        try:
+            with closing(self.connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT state, changed_at FROM circuit WHERE endpoint = ?", (endpoint,)
+                    ).fetchone()
+                    if row is None or row[0] == CLOSED:
+                        return True
+                    if now - row[1] < self.reset_timeout:
+                        return False
+                    conn.execute(
+                        "UPDATE circuit SET state = ?, changed_at = ? WHERE endpoint = ?", (HALF_OPEN, now, endpoint)
+                    )
+                finally:
+                    conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker read failed, {e}.")
+            return True
+        logger.info(f"Circuit breaker for {endpoint} -> half_open, probing.")
+        return True
+
+    def record_success(self, endpoint: str) -> None:
+        """リクエストの成功を記録し、closed に戻す"""
+        try:
+            with closing(self.connect()) as conn:
+                # closed のままなら書き込まない（成功のたびに書き込みのロックを取らない）
+                cursor = conn.execute(
+                    "UPDATE circuit SET state = ?, failures = 0, changed_at = ? "
+                    "WHERE endpoint = ? AND (state != ? OR failures != 0)",
+                    (CLOSED, time.time(), endpoint, CLOSED),
+                )
+                if cursor.rowcount:
+                    logger.info(f"Circuit breaker for {endpoint} -> closed.")
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker write failed, {e}.")
+
+    def record_failure(self, endpoint: str) -> None:
+        """リクエストの失敗を記録し、連続失敗回数が failure_threshold に達したか試行が失敗した場合は open にする"""
+        now = time.time()
+        try:
+            with closing(self.connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT state, failures, changed_at FROM circuit WHERE endpoint = ?", (endpoint,)
+                    ).fetchone()
+                    state, failures, changed_at = row if row is not None else (CLOSED, 0, now)
+                    failures += 1
+                    if state == OPEN:
+                        # open にする前に送信したリクエストの失敗は、open にした時刻を変えない
+                        new_state = OPEN
+                    elif state == HALF_OPEN or failures >= self.failure_threshold:
+                        new_state, changed_at = OPEN, now
+                    else:
+                        new_state = CLOSED
+                    conn.execute(
+                        "INSERT OR REPLACE INTO circuit VALUES (?, ?, ?, ?)",
+                        (endpoint, new_state, failures, changed_at),
+                    )
+                finally:
+                    conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning(f"Circuit breaker write failed, {e}.")
+            return
+        if new_state == OPEN and state != OPEN:
+            logger.warning(f"Circuit breaker for {endpoint} -> open ({failures} consecutive failure(s)).")
+
+
+if __name__ == "__main__":
+    breaker = CircuitBreaker("./cache/circuit_breaker.db", failure_threshold=2, reset_timeout=1)
+    endpoint = "https://example.com/api"
+    for _ in range(2):
+        breaker.record_failure(endpoint)
+    print(breaker.state(endpoint), breaker.allow_request(endpoint))
+    time.sleep(1)
+    print(breaker.allow_request(endpoint), breaker.state(endpoint))
+    breaker.record_success(endpoint)
+    print(breaker.state(endpoint))
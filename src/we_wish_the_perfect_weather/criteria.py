@@ -0,0 +1,159 @@
+import hashlib
+import operator
+
+import numpy as np
+import orjson
+
+# "完璧な気候" の判定の閾値の既定値（Manager.PW_BASE はこれを参照する）
+PW_BASE = {
+    "maximum_temperature": 28,
+    "minimum_temperature": 18,
+    "maximum_humidity": 70,
+    "minimum_humidity": 40,
+    "maximum_precipitation_probability": 10,
+    "maximum_precipitation": 0,
+    "maximum_wind_speed": 3,
+    "maximum_pollen_count": 10,
+}
+
+# "完璧な気候" の判定基準
+# 基準ごとに (対象列, 比較演算子, 閾値のキー) の組を持ち、組をすべて満たすときその基準を満たすとする
+# 並びは Manager.check_perfection の返り値の並びと一致させる
+PERFECTION_CRITERIA: list[list[tuple[str, str, str]]] = [
+    [("maximum_temperature", ">=", "minimum_temperature"), ("maximum_temperature", "<=", "maximum_temperature")],
+    [("minimum_temperature", ">=", "minimum_temperature"), ("minimum_temperature", "<=", "maximum_temperature")],
+    [("maximum_humidity", "<=", "maximum_humidity")],
+    [("minimum_humidity", ">=", "minimum_humidity")],
+    [("maximum_precipitation_probability", "<=", "maximum_precipitation_probability")],
+    [("maximum_precipitation", "<=", "maximum_precipitation")],
+    [("maximum_wind_speed", "<=", "maximum_wind_speed")],
+    [("maximum_pollen_count", "<", "maximum_pollen_count")],
+]
+# 値が無いことを表す値（PollenCountFetcher.fallback, Backfiller.POLLEN_COUNT_MISSING）
+# 取得に失敗したレコード（is_stale）では、対象列がこの値の基準は満たさない（値が分からない日を "完璧な気候" としない）
+# 取得元が提供しない値（明日の花粉飛散数、過去の花粉飛散数）のレコードでは、その基準は判定しない（満たすものとする）
+MISSING_VALUE = -9999
+CRITERIA_COLUMNS = list(dict.fromkeys([column for criterion in PERFECTION_CRITERIA for column, _, _ in criterion]))
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def resolve_base(overrides: dict | None = None) -> dict:
+    """PW_BASE の一部を上書きした閾値辞書を返す
+
+    Args:
+        overrides (dict | None): 上書きする閾値辞書、None なら PW_BASE のまま
+
+    Returns:
+        dict: PW_BASE と同じキーを持つ閾値辞書
+
+    Raises:
+        ValueError: PW_BASE に無いキーや数値でない閾値が含まれる場合
+    """
+    overrides = overrides or {}
+    unknown_list = [key for key in overrides if key not in PW_BASE]
+    if unknown_list:
+        raise ValueError(f"unknown threshold key: {', '.join(unknown_list)}.")
+    for key, value in overrides.items():
+        if isinstance(value, bool) or not isinstance(value, int | float):
+            raise ValueError(f"threshold {key} must be a number.")
+    return PW_BASE | overrides
+
+
+def evaluate_perfection(columns: dict, base: dict) -> tuple[np.ndarray, np.ndarray]:
+    """列ごとの配列で与えられた複数レコードについて、"完璧な気候" かどうかをまとめて判定する
+
+    Notes:
+        対象列が MISSING_VALUE の基準は、is_stale のレコードでは満たさず、それ以外のレコードでは満たすものとする
+
+    Args:
+        columns (dict): CRITERIA_COLUMNS の各列名をキー、同じ長さの配列を値に持つ辞書
+            （"is_stale" キーがあればその配列も使う、無ければすべて False とする）
+        base (dict): 判定の閾値辞書（Manager.PW_BASE と同じキーを持つ）
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]:
+            (基準ごとの判定結果 bool[n_records, 8], 全基準を満たすかどうか bool[n_records])
+    """
+    if not all(column in columns for column in CRITERIA_COLUMNS):
+        raise ValueError("columns structure is invalid.")
+
+    arrays = {column: np.asarray(columns[column]) for column in CRITERIA_COLUMNS}
+    n = len(arrays[CRITERIA_COLUMNS[0]])
+    is_stale = np.asarray(columns.get("is_stale", np.zeros(n, dtype=bool)), dtype=bool)
+    if not all(array.shape == (n,) for array in [*arrays.values(), is_stale]):
+        raise ValueError("columns must be 1-D arrays of the same length.")
+
+    check = np.ones((n, len(PERFECTION_CRITERIA)), dtype=bool)
+    for i, criterion in enumerate(PERFECTION_CRITERIA):
+        for column, op, base_key in criterion:
+            array = arrays[column]
+            check[:, i] &= np.where(array == MISSING_VALUE, ~is_stale, OPERATORS[op](array, base[base_key]))
+    return check, check.all(axis=1)
+
+
+def evaluate_perfection_one(record: dict, base: dict) -> list[bool]:
+    """1レコードについて、"完璧な気候" かどうかを判定する
+
+    Notes:
+        evaluate_perfection と同じ判定を、配列を作らずに Python の比較のみで行う（1レコードずつ判定する場合に使う）
+
+    Args:
+        record (dict): CRITERIA_COLUMNS の各列名をキーに持つ辞書（"is_stale" キーが無ければ False とする）
+        base (dict): 判定の閾値辞書（Manager.PW_BASE と同じキーを持つ）
+
+    Returns:
+        list[bool]: 基準ごとの判定結果（evaluate_perfection の判定結果の1行と同じ並び）
+    """
+    is_stale = bool(record.get("is_stale", False))
+    return [
+        all(
+            not is_stale if record[column] == MISSING_VALUE else bool(OPERATORS[op](record[column], base[base_key]))
+            for column, op, base_key in criterion
+        )
+        for criterion in PERFECTION_CRITERIA
+    ]
+
+
+def criteria_version(base: dict) -> str:
+    """判定基準と閾値の組から、判定のバージョンを表すハッシュ文字列を返す
+
+    Notes:
+        Weather.criteria_version に記録し、基準や閾値を変更した後の再判定で
+        現行の判定と異なるレコードのみを対象にするために使う
+
+    Args:
+        base (dict): 判定の閾値辞書（Manager.PW_BASE と同じキーを持つ）
+
+    Returns:
+        str: 16文字の16進数文字列
+    """
+    used_base = {base_key: base[base_key] for criterion in PERFECTION_CRITERIA for _, _, base_key in criterion}
+    source = orjson.dumps(
+        {"criteria": PERFECTION_CRITERIA, "base": used_base, "missing": [MISSING_VALUE, "is_stale"]},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha1(source).hexdigest()[:16]
+
+
+if __name__ == "__main__":
+    from we_wish_the_perfect_weather.manager import Manager
+
+    rng = np.random.default_rng(0)
+    n = 5
+    columns = {
+        "maximum_temperature": rng.uniform(15, 30, n),
+        "minimum_temperature": rng.uniform(10, 25, n),
+        "maximum_humidity": rng.integers(30, 90, n),
+        "minimum_humidity": rng.integers(20, 60, n),
+        "maximum_precipitation_probability": rng.integers(0, 30, n),
+        "maximum_precipitation": rng.choice([0.0, 0.5], n),
+        "maximum_wind_speed": rng.uniform(0, 6, n),
+        "maximum_pollen_count": rng.integers(0, 20, n),
+    }
+    print(evaluate_perfection(columns, Manager.PW_BASE))
+    print(criteria_version(Manager.PW_BASE))
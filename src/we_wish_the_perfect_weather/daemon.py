@@ -0,0 +1,103 @@
+import signal
+import threading
+from datetime import datetime, time, timedelta
+from logging import INFO, getLogger
+from zoneinfo import ZoneInfo
+
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.util import Result
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class Daemon:
+    """常駐して、地点の現地時刻に合わせて Manager.run を定期実行する
+
+    Notes:
+        Manager（DBのエンジン、HTTPセッション、テンプレート）は起動時に一度だけ構築して使い回す
+        観測地点はタイムゾーンごとにまとめ、各タイムゾーンの run_times の時刻に実行する
+        起動直後は取りこぼしを防ぐため、全タイムゾーンについて一度実行する
+        （記録済の日付は Manager.run 側でスキップされる）
+    """
+
+    RUN_TIMES = ["07:00", "13:00"]  # 午前の実行で昨日/今日、午後の実行で今日/明日を記録する
+    POLL_INTERVAL = 30  # [s]
+
+    def __init__(self, manager: Manager):
+        self.manager = manager
+        daemon_config = manager.config.get("daemon", {})
+        self.run_times = [time.fromisoformat(t) for t in daemon_config.get("run_times", Daemon.RUN_TIMES)]
+        self.poll_interval = float(daemon_config.get("poll_interval", Daemon.POLL_INTERVAL))
+        self.stop_event = threading.Event()
+
+        # タイムゾーンごとに地点をまとめる
+        self.location_dict: dict[str, list[dict]] = {}
+        for location in manager.locations:
+            self.location_dict.setdefault(location["timezone"], []).append(location)
+        self.next_run_at: dict[str, datetime] = {}
+
+    def get_next_run_at(self, timezone: str, now: datetime) -> datetime:
+        """now より後で、timezone の現地時刻で次に実行する日時を返す
+
+        Args:
+            timezone (str): タイムゾーン名
+            now (datetime): 基準日時（タイムゾーン付き）
+
+        Returns:
+            datetime: 次に実行する日時（timezone の現地時刻）
+        """
+        tz = ZoneInfo(timezone)
+        local_now = now.astimezone(tz)
+        candidate_list = []
+        for days in [0, 1]:
+            day = local_now.date() + timedelta(days=days)
+            for run_time in self.run_times:
+                candidate = datetime.combine(day, run_time, tzinfo=tz)
+                if candidate > local_now:
+                    candidate_list.append(candidate)
+        return min(candidate_list)
+
+    def run_once(self, timezone: str) -> Result:
+        now = datetime.now(ZoneInfo(timezone))
+        logger.info(f"Daemon run [{timezone}] {now.isoformat()} -> start.")
+        try:
+            # Manager.run には現地時刻をタイムゾーン無しで渡す
+            result = self.manager.run(self.location_dict[timezone], now.replace(tzinfo=None))
+        except Exception as e:
+            logger.exception(e)
+            result = Result.failed
+        logger.info(f"Daemon run [{timezone}] -> done.")
+        return result
+
+    def stop(self, signum=None, frame=None) -> None:
+        logger.info("Daemon stop requested.")
+        self.stop_event.set()
+
+    def run_forever(self) -> Result:
+        logger.info("Daemon -> start.")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for timezone in self.location_dict:
+            self.run_once(timezone)
+            self.next_run_at[timezone] = self.get_next_run_at(timezone, datetime.now(ZoneInfo(timezone)))
+            logger.info(f"Daemon next run [{timezone}] {self.next_run_at[timezone].isoformat()}.")
+
+        while not self.stop_event.wait(self.poll_interval):
+            for timezone, next_run_at in self.next_run_at.items():
+                now = datetime.now(ZoneInfo(timezone))
+                if now < next_run_at:
+                    continue
+                self.run_once(timezone)
+                self.next_run_at[timezone] = self.get_next_run_at(timezone, datetime.now(ZoneInfo(timezone)))
+                logger.info(f"Daemon next run [{timezone}] {self.next_run_at[timezone].isoformat()}.")
+
+        self.manager.flush_discord_notify(Manager.NOTIFY_FLUSH_TIMEOUT)
+        logger.info("Daemon -> done.")
+        return Result.success
+
+
+if __name__ == "__main__":
+    daemon = Daemon(Manager())
+    daemon.run_forever()
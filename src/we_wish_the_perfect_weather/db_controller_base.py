@@ -1,16 +1,135 @@
+import sqlite3
 from abc import ABCMeta, abstractmethod
+from logging import INFO, getLogger
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
 
-from we_wish_the_perfect_weather.model import Base
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.model import Base, Weather
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
 
 
 class DBControllerBase(metaclass=ABCMeta):
+    # スキーマを変更した場合はインクリメントする
+    # DBの PRAGMA user_version と異なる場合のみ create_all と migrate を実行する
+    # 2: HourlyObservation テーブルを追加（create_all で作成される）
+    # 3: Weather に criteria_version 列を追加
+    # 4: 集計テーブル WeatherMonthlyStats, WeatherStreak を追加（create_all で作成し、migrate で集計する）
+    #    Weather に (target_date) のインデックスを追加
+    # 5: Weather に is_stale 列を追加
+    SCHEMA_VERSION = 5
+    # 接続ごとに設定する PRAGMA
+    # 複数の実行が同じDBを参照しても "database is locked" になりにくくする
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -20000,  # 負の値はKiB単位
+        "busy_timeout": 5000,  # [ms]
+    }
+
     def __init__(self, db_fullpath="PW_DB.db"):
         self.dbname = db_fullpath
         self.engine = create_engine(f"sqlite:///{self.dbname}", echo=False)
-        Base.metadata.create_all(self.engine)
+        event.listen(self.engine, "connect", self.set_sqlite_pragma)
+        event.listen(self.engine, "after_cursor_execute", self.count_statement)
+        self.Session = sessionmaker(bind=self.engine)
+
+        if self.get_schema_version() != self.SCHEMA_VERSION:
+            Base.metadata.create_all(self.engine)
+            self.migrate()
+            self.set_schema_version(self.SCHEMA_VERSION)
+
+    @classmethod
+    def is_migration_needed(cls, db_fullpath: str | Path) -> bool:
+        """DBを開く際に、スキーマの作成・移行（create_all と migrate による書き込み）が必要かどうかを返す
+
+        Notes:
+            DBを作成・変更しないよう、標準ライブラリの sqlite3 で読み取り専用で開いて PRAGMA user_version を確認する
+            DBが存在しない・確認できない場合は True を返す
+
+        Args:
+            db_fullpath (str | Path): DBファイルのパス
+
+        Returns:
+            bool: 作成・移行が必要ならTrue
+        """
+        db_fullpath = Path(db_fullpath)
+        if not db_fullpath.exists():
+            return True
+        try:
+            conn = sqlite3.connect(f"{db_fullpath.resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+            try:
+                (version,) = conn.execute("PRAGMA user_version").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return True
+        return version != cls.SCHEMA_VERSION
+
+    def set_sqlite_pragma(self, dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for key, value in self.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {key}={value}")
+        cursor.close()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        instrumentation.add("db_statements")
+
+    def get_schema_version(self) -> int:
+        with self.engine.connect() as conn:
+            return int(conn.exec_driver_sql("PRAGMA user_version").scalar())
+
+    def set_schema_version(self, version: int) -> None:
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"PRAGMA user_version={int(version)}")
+
+    def migrate(self) -> None:
+        """既存DBのスキーマを現行のモデルに合わせる
+
+        Notes:
+            create_all は既存テーブルへの列・インデックス追加を行わないため、不足しているものをここで追加する
+            location 列が無いDBは単一地点運用時のものなので、既存レコードの location は空文字列とする
+            Weather のインデックスはモデルの定義を唯一の組とし、それ以外のこのアプリケーションが作成したもの
+            （ix_weather_, ux_weather_ で始まるもの）は削除する
+            ux_weather_key を作成する前に (location, target_date, record_type) の重複レコードを削除し、件数をログに残す
+        """
+        inspector = inspect(self.engine)
+        columns = [c["name"] for c in inspector.get_columns(Weather.__tablename__)]
+        indexes = [i["name"] for i in inspector.get_indexes(Weather.__tablename__)]
+        with self.engine.begin() as conn:
+            if "location" not in columns:
+                conn.execute(text("ALTER TABLE Weather ADD COLUMN location VARCHAR(256) NOT NULL DEFAULT ''"))
+            if "criteria_version" not in columns:
+                # 既存レコードは判定時の基準が不明なため空文字列とする（rescore で再判定される）
+                conn.execute(text("ALTER TABLE Weather ADD COLUMN criteria_version VARCHAR(32) NOT NULL DEFAULT ''"))
+            if "is_stale" not in columns:
+                conn.execute(text("ALTER TABLE Weather ADD COLUMN is_stale BOOLEAN NOT NULL DEFAULT 0"))
+
+            model_index_dict = {index.name: index for index in Weather.__table__.indexes}
+            for name in indexes:
+                if name not in model_index_dict and name.startswith(("ix_weather_", "ux_weather_")):
+                    conn.execute(text(f"DROP INDEX {name}"))
+            if "ux_weather_key" not in indexes:
+                # UPSERT のキーとなる一意制約を付与する
+                # 重複レコードが存在する場合は最後に登録されたものを残す
+                count = conn.execute(
+                    text(
+                        "DELETE FROM Weather WHERE id NOT IN "
+                        "(SELECT MAX(id) FROM Weather GROUP BY location, target_date, record_type)"
+                    )
+                ).rowcount
+                if count:
+                    logger.warning(
+                        f"Migration removed {count} duplicate Weather row(s), "
+                        "kept the last registered row for each (location, target_date, record_type)."
+                    )
+            for name, index in model_index_dict.items():
+                if name not in indexes:
+                    index.create(conn)
 
     @abstractmethod
     def upsert(self, params: dict) -> None:
@@ -18,11 +137,12 @@ class DBControllerBase(metaclass=ABCMeta):
 
         Notes:
             一致しているかの判定は
-            record_type, target_date の両方が一致している場合、とする
+            location, record_type, target_date のすべてが一致している場合、とする
 
         Args:
             params (dict): 以下のキーを持つ辞書
                 params = {
+                    "location": (str),
                     "target_date": (str: "%Y-%m-%d %H:%M:%S"),
                     "record_type": (str),
                     "is_perfect": (bool),
@@ -34,10 +154,27 @@ class DBControllerBase(metaclass=ABCMeta):
                     "maximum_precipitation": (float),
                     "maximum_wind_speed": (float),
                     "registered_at": (str: "%Y-%m-%d %H:%M:%S"),
+                    "is_stale": (bool, 省略時 False),
                 }
         """
         pass
 
+    @abstractmethod
+    def upsert_many(self, records: list[dict]) -> int:
+        """DBに複数レコードをまとめてUPSERTする
+
+        Notes:
+            location, target_date, record_type の一意制約に対する
+            INSERT ... ON CONFLICT DO UPDATE を1トランザクションで実行する
+
+        Args:
+            records (list[dict]): upsert の params と同じキーを持つ辞書のリスト
+
+        Returns:
+            int: UPSERTしたレコード数
+        """
+        return 0
+
     @abstractmethod
     def select(self, limit=300) -> list[dict]:
         """DBからSELECTする
@@ -54,11 +191,12 @@ class DBControllerBase(metaclass=ABCMeta):
         return []
 
     @abstractmethod
-    def is_perfect(self, record_type: str, target_date: str) -> bool:
-        """特定の日付の結果or予測が "完璧な気候" かを取得する
+    def is_perfect(self, record_type: str, target_date: str, location: str = "") -> bool:
+        """特定の地点・日付の結果or予測が "完璧な気候" かを取得する
 
         Note:
-            f"select * from Weather where record_type={record_type} and target_date={target_date}"
+            f"select * from Weather where record_type={record_type} and target_date={target_date}
+              and location={location}"
         """
         pass
 
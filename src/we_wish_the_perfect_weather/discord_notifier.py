@@ -0,0 +1,221 @@
+import queue
+import threading
+import time
+from logging import INFO, getLogger
+from pathlib import Path
+
+import httpx
+import orjson
+
+from we_wish_the_perfect_weather.util import Result
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class DiscordNotifier:
+    """Discord の webhook に通知をポストする
+
+    Notes:
+        post はキューに積むだけで、実際の送信はバックグラウンドのスレッドが
+        接続を使い回す1つの httpx.Client で順に行う
+        キューが満杯の場合、post は空きができるまで待つ
+        Discord のレート制限（429 と X-RateLimit-* ヘッダ）に従って送信を待機する
+        is_coalesce が True の場合、キューに溜まっている複数のメッセージを1つにまとめて送信する
+        上限文字数を超えるメッセージは、行の区切りで複数の content に分けて送信する
+    """
+
+    QUEUE_SIZE = 100
+    MAX_CONTENT_LENGTH = 2000  # Discord の content の上限文字数
+    MAX_RETRY = 5
+    TIMEOUT = 10.0  # [s]
+
+    def __init__(self, webhook_url: str, queue_size: int = QUEUE_SIZE, is_coalesce: bool = True):
+        self.webhook_url = webhook_url
+        self.is_coalesce = is_coalesce
+        self.client = httpx.Client(timeout=DiscordNotifier.TIMEOUT)
+        self.queue: queue.Queue[str | None] = queue.Queue(maxsize=queue_size)
+        self.rate_limit_reset_at = 0.0  # time.monotonic() 基準
+        self.thread = threading.Thread(target=self.worker, name="discord-notifier", daemon=True)
+        self.thread.start()
+
+    def post(self, message: str) -> Result:
+        """通知をキューに積む
+
+        Args:
+            message (str): Discordに通知する文字列
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        self.queue.put(message)
+        return Result.success
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """キューに積まれた通知の送信完了を待つ
+
+        Args:
+            timeout (float | None): 待機の上限[s]、None なら無制限
+
+        Returns:
+            bool: 期限内にすべて送信し終えた場合True
+        """
+        end_at = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if end_at is None else end_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Discord notify flush timeout, {self.queue.unfinished_tasks} message(s) left.")
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        """送信完了を待ってからスレッドと接続を終了する"""
+        self.flush(timeout)
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.client.close()
+
+    def worker(self) -> None:
+        while True:
+            message = self.queue.get()
+            if message is None:
+                self.queue.task_done()
+                return
+
+            message_list = [message]
+            if self.is_coalesce:
+                message_list.extend(self.drain())
+
+            try:
+                for content in self.coalesce(message_list):
+                    self.send(content)
+            except Exception as e:
+                logger.exception(f"Discord notify failed, {e}")
+            finally:
+                for _ in message_list:
+                    self.queue.task_done()
+
+    def drain(self) -> list[str]:
+        """キューに溜まっているメッセージを待たずに取り出す"""
+        message_list = []
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                return message_list
+            if message is None:
+                # 終了指示はキューに戻す
+                self.queue.task_done()
+                self.queue.put(None)
+                return message_list
+            message_list.append(message)
+
+    def coalesce(self, message_list: list[str]) -> list[str]:
+        """複数のメッセージを、上限文字数に収まるようにコードブロックにまとめる
+
+        Notes:
+            1つで上限文字数を超えるメッセージは、split_message で分けてからまとめる
+
+        Args:
+            message_list (list[str]): メッセージのリスト
+
+        Returns:
+            list[str]: 送信する content のリスト
+        """
+        max_body_length = DiscordNotifier.MAX_CONTENT_LENGTH - len("``````")
+        content_list = []
+        body = ""
+        for message in message_list:
+            for part in self.split_message(message, max_body_length):
+                candidate = f"{body}\n{part}" if body else part
+                if body and len(candidate) > max_body_length:
+                    content_list.append("```" + body + "```")
+                    candidate = part
+                body = candidate
+        if body:
+            content_list.append("```" + body + "```")
+        return content_list
+
+    @staticmethod
+    def split_message(message: str, max_length: int) -> list[str]:
+        """メッセージを max_length 文字以下に分ける
+
+        Notes:
+            行の区切りで分け、1行で max_length 文字を超える行はその文字数ごとに分ける
+
+        Args:
+            message (str): メッセージ
+            max_length (int): 分けた1つあたりの上限文字数
+
+        Returns:
+            list[str]: 分けたメッセージのリスト（上限文字数以下ならそのまま1つ）
+        """
+        if len(message) <= max_length:
+            return [message]
+        part_list = []
+        body = None
+        for line in message.split("\n"):
+            for start in range(0, max(len(line), 1), max_length):
+                piece = line[start : start + max_length]
+                if body is None:
+                    body = piece
+                elif len(body) + 1 + len(piece) > max_length:
+                    part_list.append(body)
+                    body = piece
+                else:
+                    body = f"{body}\n{piece}"
+        part_list.append(body)
+        return part_list
+
+    def build_payload(self, content: str) -> dict:
+        return {"content": content}
+
+    def send(self, content: str) -> Result:
+        """レート制限に従って1件送信する
+
+        Args:
+            content (str): 送信する content
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        headers = {"Content-Type": "application/json"}
+        data = orjson.dumps(self.build_payload(content)).decode()
+        for _ in range(DiscordNotifier.MAX_RETRY):
+            wait = self.rate_limit_reset_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            response = self.client.post(self.webhook_url, headers=headers, data=data)
+            self.update_rate_limit(response)
+            if response.status_code == 429:
+                logger.info(f"Discord rate limited, retry after {self.rate_limit_reset_at - time.monotonic():.2f}s.")
+                continue
+            response.raise_for_status()
+            return Result.success
+        raise RuntimeError("Discord notify retry count exceeded.")
+
+    def update_rate_limit(self, response: httpx.Response) -> None:
+        """レスポンスのヘッダから、次に送信してよい時刻を更新する"""
+        wait = 0.0
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after is None:
+                try:
+                    retry_after = orjson.loads(response.content).get("retry_after")
+                except orjson.JSONDecodeError:
+                    retry_after = None
+            wait = float(retry_after) if retry_after is not None else 1.0
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            wait = float(response.headers.get("X-RateLimit-Reset-After", 0))
+        self.rate_limit_reset_at = max(self.rate_limit_reset_at, time.monotonic() + wait)
+
+
+if __name__ == "__main__":
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    notifier = DiscordNotifier(config["discord_webhook_url"]["webhook_url"])
+    notifier.post("test message 1")
+    notifier.post("test message 2")
+    notifier.close(timeout=30)
@@ -0,0 +1,61 @@
+import sqlite3
+from datetime import datetime
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+
+from we_wish_the_perfect_weather.util import get_locations, get_target_dates
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+def is_already_done(config: dict, now: datetime | None = None) -> bool:
+    """全地点について、今回の実行で記録する日付がすべて登録済かどうかを返す
+
+    Notes:
+        実行のほとんどは記録済で何もしないため、Manager の構築（SQLAlchemy や HTTP クライアント等の
+        読み込み）より前に、標準ライブラリの sqlite3 だけで1回のクエリで確認する
+        DBが存在しない・スキーマが古い等で確認できない場合は False を返す（通常の実行で判定させる）
+        stale なレコードは登録済としない（WeatherDBController.select_done_locations と同じ）
+
+    Args:
+        config (dict): 設定辞書
+        now (datetime | None): 基準とする現在日時、None なら実行環境の現在日時
+
+    Returns:
+        bool: すべて登録済ならTrue
+    """
+    if now is None:
+        now = datetime.now()
+    target_date1, target_date2 = get_target_dates(now)
+    location_list = [location["name"] for location in get_locations(config)]
+
+    db_fullpath = Path(config["db"]["save_path"]) / config["db"]["save_file_name"]
+    if not db_fullpath.exists():
+        return False
+
+    query = """
+        SELECT COUNT(*) FROM Weather
+        WHERE location IN (SELECT value FROM json_each(?))
+          AND ((target_date = ? AND record_type = 'actual') OR (target_date = ? AND record_type = 'forecast'))
+          AND NOT is_stale
+    """
+    try:
+        conn = sqlite3.connect(f"{db_fullpath.resolve().as_uri()}?mode=ro", uri=True, timeout=5)
+        try:
+            (count,) = conn.execute(
+                query, (orjson.dumps(location_list).decode(), target_date1, target_date2)
+            ).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.info(f"Done check skipped, {e}.")
+        return False
+    return count == 2 * len(location_list)
+
+
+if __name__ == "__main__":
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    print(is_already_done(config))
@@ -0,0 +1,123 @@
+import csv
+import os
+from collections.abc import Iterator
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+from sqlalchemy import Boolean, Float, Integer
+
+from we_wish_the_perfect_weather.model import Weather
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+EXPORT_FORMATS = ["csv", "jsonl", "parquet"]
+
+
+class WeatherExporter:
+    """Weather テーブルをファイルに書き出す
+
+    Notes:
+        WeatherDBController.iter_chunks で chunk_size 件ずつ読み、読んだ分をすぐに書き出すため、
+        レコード数によらずメモリ使用量は一定となる
+        書き出し中のファイルを読まれないよう、一時ファイルに書いてから置き換える
+        parquet の書き出しには pyarrow が必要（インストールされていない場合は ImportError）
+    """
+
+    CHUNK_SIZE = 10000
+
+    def __init__(self, weather_db: WeatherDBController, chunk_size: int = CHUNK_SIZE):
+        self.weather_db = weather_db
+        self.chunk_size = chunk_size
+
+    def export(
+        self,
+        path: str | Path,
+        export_format: str,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        record_type: str | None = None,
+    ) -> int:
+        """Weather のレコードをファイルに書き出す
+
+        Args:
+            path (str | Path): 出力先のパス
+            export_format (str): 出力形式 ["csv", "jsonl", "parquet"]
+            start_date (str | None): 期間の開始日 "%Y-%m-%d"形式、None なら最初から
+            end_date (str | None): 期間の終了日 "%Y-%m-%d"形式（この日を含む）、None なら最後まで
+            record_type (str | None): レコードタイプ ["actual", "forecast"]、None なら両方
+
+        Returns:
+            int: 書き出したレコード数
+
+        Raises:
+            ValueError: 出力形式が EXPORT_FORMATS に無い場合
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"export_format must be one of {EXPORT_FORMATS}.")
+        writer = {
+            "csv": self.write_csv,
+            "jsonl": self.write_jsonl,
+            "parquet": self.write_parquet,
+        }[export_format]
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        chunks = self.weather_db.iter_chunks(start_date, end_date, record_type, self.chunk_size)
+        try:
+            count = writer(chunks, temp_path)
+            temp_path.replace(path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return count
+
+    def write_csv(self, chunks: Iterator, path: Path) -> int:
+        """ヘッダ行付きの csv で書き出す"""
+        count = 0
+        with path.open("w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([c.name for c in Weather.__table__.columns])
+            for _, row_list in chunks:
+                writer.writerows(row_list)
+                count += len(row_list)
+        return count
+
+    def write_jsonl(self, chunks: Iterator, path: Path) -> int:
+        """1行1レコードの JSON Lines で書き出す"""
+        count = 0
+        with path.open("wb") as f:
+            for keys, row_list in chunks:
+                f.write(b"".join([orjson.dumps(dict(zip(keys, row))) + b"\n" for row in row_list]))
+                count += len(row_list)
+        return count
+
+    def write_parquet(self, chunks: Iterator, path: Path) -> int:
+        """Parquet で書き出す（chunk ごとに1つの row group とする）"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("parquet export requires pyarrow (install the 'parquet' extra).") from e
+
+        arrow_types = {Boolean: pa.bool_(), Float: pa.float64(), Integer: pa.int64()}
+        schema = pa.schema([
+            (c.name, next((t for k, t in arrow_types.items() if isinstance(c.type, k)), pa.string()))
+            for c in Weather.__table__.columns
+        ])
+        count = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for _, row_list in chunks:
+                columns = list(zip(*row_list))
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+                count += len(row_list)
+        return count
+
+
+if __name__ == "__main__":
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    db_fullpath = Path(config["db"]["save_path"]) / config["db"]["save_file_name"]
+    exporter = WeatherExporter(WeatherDBController(db_fullpath))
+    print(exporter.export("./export/weather.jsonl", "jsonl"))
@@ -1,16 +1,58 @@
 from abc import ABCMeta, abstractmethod
+from collections.abc import Callable, Mapping
+from datetime import date, timedelta
 from pathlib import Path
+from typing import NamedTuple
 
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
+import numpy as np
+
+from we_wish_the_perfect_weather.circuit_breaker import CircuitBreaker
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.response_cache import CachedResponse, ResponseCache
+from we_wish_the_perfect_weather.util import datetime_to_date, get_now
+
+
+class FetchResult(NamedTuple):
+    """fetch_data の取得結果
+
+    Notes:
+        いずれも観測地点名をキーに持つ辞書で、取得した地点の分のみを含む
+    """
+
+    fetched_data: dict[str, dict]  # 1時間ごとの値
+    daily_data: dict[str, dict]  # 日ごとの集計値
+    stale_dates: dict[str, set[str]]  # 期限切れのキャッシュ(stale)の値を代わりに使った日付 "%Y-%m-%d" の集合
+    failed: dict[str, str]  # 代わりの値も無く取得できなかった地点と、その理由
 
 
 class FetcherBase(metaclass=ABCMeta):
     API_OPEN_METEO = ""
+    HOURLY_DTYPE = "<f4"  # HourlyObservation.hourly_values の型
+    CACHE_TTL_FORECAST = 3600  # 予報等、変わりうるデータのキャッシュの有効期間[s]
+    CACHE_TTL_FINALIZED = 30 * 24 * 3600  # 確定済の過去のデータのキャッシュの有効期間[s]
+    MAX_STALE_AGE = 2 * 24 * 3600  # 取得に失敗した場合に代わりに使う、期限切れのキャッシュの古さの上限[s]
 
     def __init__(self, config: dict):
         self.config = config
+        cache_config = config.get("cache", {})
+        self.response_cache = ResponseCache(
+            cache_config.get("path", ResponseCache.PATH),
+            int(cache_config.get("max_bytes", ResponseCache.MAX_BYTES)),
+        )
+        self.ttl_forecast = int(cache_config.get("ttl_forecast", FetcherBase.CACHE_TTL_FORECAST))
+        self.ttl_finalized = int(cache_config.get("ttl_finalized", FetcherBase.CACHE_TTL_FINALIZED))
+        self.max_stale_age = int(cache_config.get("max_stale_age", FetcherBase.MAX_STALE_AGE))
+        breaker_config = config.get("circuit_breaker", {})
+        self.circuit_breaker = CircuitBreaker(
+            breaker_config.get("path", CircuitBreaker.PATH),
+            int(breaker_config.get("failure_threshold", CircuitBreaker.FAILURE_THRESHOLD)),
+            float(breaker_config.get("reset_timeout", CircuitBreaker.RESET_TIMEOUT)),
+        )
+        # 直近の fetch (load_result) で読み込んだ取得結果、各属性の意味は FetchResult を参照
+        self.fetched_data: dict[str, dict] = {}
+        self.daily_data: dict[str, dict] = {}
+        self.stale_dates: dict[str, set[str]] = {}
+        self.failed: dict[str, str] = {}
 
     @abstractmethod
     def api_endpoint_url(self) -> str:
@@ -35,14 +77,228 @@ class FetcherBase(metaclass=ABCMeta):
         }
         return params
 
+    def response_ttl(self, params: dict) -> int:
+        """api_params のレスポンスのキャッシュの有効期間を返す（既定では予報を含むものとして ttl_forecast）"""
+        return self.ttl_forecast
+
+    def cache_ttl(self, end_date: str, finalize_days: int = 1, today: str | None = None) -> int:
+        """end_date までのデータのキャッシュの有効期間を返す
+
+        Notes:
+            end_date が今日から finalize_days 日以上前なら、値はもう変わらないものとして ttl_finalized を、
+            そうでなければ ttl_forecast を返す
+
+        Args:
+            end_date (str): データの最後の日付 "%Y-%m-%d"形式
+            finalize_days (int): データが確定するまでの日数
+            today (str | None): 基準とする今日の日付（地点の現地の日付） "%Y-%m-%d"形式、None なら実行環境の今日
+
+        Returns:
+            int: 有効期間[s]
+        """
+        finalized_date = date.fromisoformat(today or datetime_to_date(get_now())) - timedelta(days=finalize_days)
+        return self.ttl_finalized if end_date <= finalized_date.isoformat() else self.ttl_forecast
+
+    def fetch_cached(
+        self, url: str, params: dict, ttl: int, send: Callable[[dict], tuple[int, bytes, Mapping]]
+    ) -> bytes:
+        """キャッシュを通してレスポンスのボディを取得する
+
+        Notes:
+            有効期限内のレスポンスが保存されていればそのまま返し、ネットワークには接続しない
+            期限切れでも ETag/Last-Modified があれば条件付きリクエストで再検証し、
+            304 が返ってきた場合は保存済のボディの有効期限を延ばして返す
+
+        Args:
+            url (str): エンドポイントのURL
+            params (dict): クエリパラメータ
+            ttl (int): 取得したレスポンスの有効期間[s]
+            send (Callable[[dict], tuple[int, bytes, Mapping]]): 追加のリクエストヘッダを受け取って送信し、
+                (ステータスコード, ボディ, レスポンスヘッダ) を返す関数（304 以外のエラーは例外を送出すること）
+
+        Returns:
+            bytes: レスポンスのボディ
+        """
+        key = ResponseCache.make_key(url, params)
+        cached = self.response_cache.get(key)
+        if cached is not None and cached.is_fresh():
+            instrumentation.add("http_cache_hits", fetcher=type(self).__name__)
+            return cached.body
+        status_code, body, response_headers = send(self.revalidation_headers(cached))
+        return self.store_response(key, url, ttl, cached, status_code, body, response_headers)
+
+    @staticmethod
+    def revalidation_headers(cached: CachedResponse | None) -> dict:
+        """保存済のレスポンスを再検証する条件付きリクエストのヘッダを返す（保存済で無ければ空辞書）"""
+        headers = {}
+        if cached is not None and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def store_response(
+        self,
+        key: str,
+        url: str,
+        ttl: int,
+        cached: CachedResponse | None,
+        status_code: int,
+        body: bytes,
+        response_headers: Mapping,
+    ) -> bytes:
+        """取得したレスポンスをキャッシュに保存し、使うボディを返す
+
+        Notes:
+            304 の場合は保存済のボディの有効期限を延ばしてそれを返す
+
+        Args:
+            key (str): キャッシュのキー
+            url (str): エンドポイントのURL
+            ttl (int): 有効期間[s]
+            cached (CachedResponse | None): リクエスト前に保存されていたレスポンス
+            status_code (int): ステータスコード
+            body (bytes): レスポンスのボディ
+            response_headers (Mapping): レスポンスヘッダ
+
+        Returns:
+            bytes: レスポンスのボディ
+        """
+        if status_code == 304 and cached is not None:
+            instrumentation.add("http_cache_revalidations", fetcher=type(self).__name__)
+            self.response_cache.refresh(key, ttl)
+            return cached.body
+
+        etag = response_headers.get("ETag", "")
+        last_modified = response_headers.get("Last-Modified", "")
+        self.response_cache.put(key, url, body, ttl, etag, last_modified)
+        return body
+
+    @staticmethod
+    def is_upstream_failure(status_code: int) -> bool:
+        """上流の障害とみなす（サーキットブレーカーの失敗に数える）ステータスコードかを返す"""
+        return status_code == 429 or status_code >= 500
+
+    def is_stale(self, target_date: str, location: str = "") -> bool:
+        """interpret が返す target_date の値が、取得に失敗したため最新の値で無いかを返す
+
+        Notes:
+            期限切れのキャッシュから得た値と、代わりも無く取得できなかった地点の値（欠測値）を最新で無いとする
+            取得に成功したがAPIが target_date の値を返さなかった場合（明日の花粉飛散数等）は、
+            再取得しても変わらないため最新の値として扱う
+        """
+        return location in self.failed or target_date in self.stale_dates.get(location, ())
+
     @abstractmethod
-    def fetch(self) -> dict:
+    def fetch_data(self, locations: list[dict] | None = None) -> FetchResult:
+        """locations の値を取得して解釈した結果を返す
+
+        Notes:
+            fetcher の取得結果の属性 (fetched_data 等) には書き込まない
+            （Manager.fetch_all で期限切れとして放棄したスレッドが、後から取得結果を書き換えないようにするため）
+
+        Args:
+            locations (list[dict] | None): 観測地点辞書のリスト、None の場合は設定の全地点
+
+        Returns:
+            FetchResult: 取得結果
+        """
         raise NotImplementedError()
 
+    def load_result(self, locations: list[dict], result: FetchResult) -> None:
+        """fetch_data の取得結果を、interpret 等で参照できるように読み込む
+
+        Notes:
+            locations の地点の以前の取得結果は破棄する（取得できなかった地点は取得失敗の扱いになる）
+        """
+        for location in locations:
+            name = location["name"]
+            self.discard(name)
+            for data, new_data in zip([self.fetched_data, self.daily_data, self.stale_dates, self.failed], result):
+                if name in new_data:
+                    data[name] = new_data[name]
+
+    def discard(self, location: str) -> None:
+        """location の取得結果を破棄する"""
+        for data in [self.fetched_data, self.daily_data, self.stale_dates, self.failed]:
+            data.pop(location, None)
+
+    def fetch(self, locations: list[dict] | None = None) -> dict:
+        """fetch_data で取得し、その結果を読み込む
+
+        Returns:
+            dict: 観測地点名をキー、1時間ごとの値を値に持つ辞書 (fetched_data)
+        """
+        if locations is None:
+            locations = self.locations
+        self.load_result(locations, self.fetch_data(locations))
+        return self.fetched_data
+
     @abstractmethod
-    def interpret(self, target_date: str, record_type: str) -> dict:
+    def interpret(self, target_date: str, record_type: str, location: str = "") -> dict:
         raise NotImplementedError()
 
+    def fallback(self, target_date: str, record_type: str, location: str = "") -> dict:
+        """fetch が期限内に完了しなかった場合に interpret の代わりに使う値を返す
+
+        Notes:
+            代替値が無い場合は空辞書を返す（その場合レコードは登録されない）
+        """
+        return {}
+
+    def dump_hourly(self, target_date: str, location: str = "") -> dict[str, np.ndarray]:
+        """取得済の値から target_date の1日分の1時間ごとの値を取り出す（HourlyObservation への保存用）
+
+        Notes:
+            値は現地時刻の 0時台 ～ 23時台 の24個の float32 とし、値が無い時間は NaN とする
+            保存する値が無い fetcher は空辞書を返す
+
+        Args:
+            target_date (str): 対象日付 "%Y-%m-%d"形式
+            location (str): 観測地点名
+
+        Returns:
+            dict[str, np.ndarray]: 変数名をキー、24個の float32 配列を値に持つ辞書
+        """
+        return {}
+
+    def dump_hourly_records(self, record_list: list[dict]) -> list[dict]:
+        """Weather のレコードごとに、集計元の1時間ごとの値を HourlyObservation のレコードとして返す
+
+        Args:
+            record_list (list[dict]): Weather のレコード辞書のリスト
+
+        Returns:
+            list[dict]: WeatherDBController.upsert_hourly_many に渡すレコード辞書のリスト
+        """
+        hourly_record_list = []
+        for record in record_list:
+            hourly_values = self.dump_hourly(record["target_date"], record["location"])
+            for variable, values in hourly_values.items():
+                hourly_record_list.append({
+                    "location": record["location"],
+                    "target_date": record["target_date"],
+                    "record_type": record["record_type"],
+                    "variable": variable,
+                    "hourly_values": values.astype(FetcherBase.HOURLY_DTYPE).tobytes(),
+                    "registered_at": record["registered_at"],
+                })
+        return hourly_record_list
+
+    def load_hourly(self, target_date: str, location: str, hourly_values: dict[str, np.ndarray]) -> None:
+        """dump_hourly で保存した1日分の値を、fetch で取得した場合と同じように読み込む
+
+        Notes:
+            読み込み後は interpret で target_date の値を取得できる
+            値が揃っていない場合はその地点の取得結果を破棄する（interpret は取得失敗時と同じ値を返す）
+
+        Args:
+            target_date (str): 対象日付 "%Y-%m-%d"形式
+            location (str): 観測地点名
+            hourly_values (dict[str, np.ndarray]): dump_hourly の返り値と同じ形式の辞書
+        """
+        return None
+
 
 if __name__ == "__main__":
     import orjson
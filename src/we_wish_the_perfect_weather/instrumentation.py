@@ -0,0 +1,244 @@
+import functools
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+METRIC_PREFIX = "pw_"
+# Prometheus に出力するカウンタの説明
+COUNTER_HELP = {
+    "http_requests": "HTTP requests sent by fetchers in the last run.",
+    "http_retries": "HTTP retries performed by fetchers in the last run.",
+    "http_response_bytes": "HTTP response body bytes received by fetchers in the last run.",
+    "http_cache_hits": "HTTP responses served from the response cache in the last run.",
+    "http_cache_revalidations": "Cached HTTP responses revalidated with 304 Not Modified in the last run.",
+    "fetch_failures": "Fetch targets (e.g. pollen city codes) that failed in the last run, by status.",
+    "db_statements": "SQL statements executed in the last run.",
+    "rows_written": "Weather rows upserted in the last run.",
+    "locations_skipped": "Locations left unrecorded because their shard or its write failed in the last run.",
+    "notifications": "Notifications queued in the last run.",
+}
+
+
+class Instrumentation:
+    """1回の実行の処理段階ごとの所要時間とカウンタを集計する
+
+    Notes:
+        span（with 文/デコレータ）で囲んだ区間の所要時間を、名前とラベルごとに回数・合計・最大で集計する
+        fetcher はスレッドで並行に動くため、集計はロックを取って行う
+        実行ごとに reset し、終了時に write_jsonl / write_prometheus で書き出す
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """集計をすべて破棄して、新しい実行の集計を開始する"""
+        with self.lock:
+            self.started_at = time.time()
+            self.start = time.perf_counter()
+            # (名前, ラベル) -> [回数, 合計[s], 最大[s]]
+            self.span_dict: dict[tuple[str, tuple], list[float]] = {}
+            # (名前, ラベル) -> 値
+            self.counter_dict: dict[tuple[str, tuple], float] = {}
+
+    @contextmanager
+    def span(self, name: str, **labels: str) -> Iterator[None]:
+        """with 文で囲んだ区間の所要時間を記録する
+
+        Args:
+            name (str): 処理段階の名前 ("fetch", "interpret" 等)
+            **labels (str): 付加するラベル (fetcher="OpenMeteoFetcher" 等)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels: str) -> Callable:
+        """関数の呼び出しごとの所要時間を記録するデコレータを返す"""
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, name: str, duration: float, **labels: str) -> None:
+        """所要時間を1回分記録する"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            stat = self.span_dict.setdefault(key, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += duration
+            stat[2] = max(stat[2], duration)
+
+    def add(self, name: str, value: float = 1, **labels: str) -> None:
+        """カウンタに value を加算する"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counter_dict[key] = self.counter_dict.get(key, 0) + value
+
+    def merge(self, report: dict) -> None:
+        """別のプロセスで集計した to_dict の結果を、この集計に加える
+
+        Notes:
+            span は回数と合計を加算し最大を取り直す、counter は加算する
+            （ShardedRunner のワーカープロセスの集計を、実行全体の集計にまとめるために使う）
+        """
+        with self.lock:
+            for span in report.get("spans", []):
+                key = (span["name"], tuple(sorted(span["labels"].items())))
+                stat = self.span_dict.setdefault(key, [0, 0.0, 0.0])
+                stat[0] += span["count"]
+                stat[1] += span["total"]
+                stat[2] = max(stat[2], span["max"])
+            for counter in report.get("counters", []):
+                key = (counter["name"], tuple(sorted(counter["labels"].items())))
+                self.counter_dict[key] = self.counter_dict.get(key, 0) + counter["value"]
+
+    def to_dict(self, extra: dict | None = None) -> dict:
+        """集計結果を辞書で返す
+
+        Args:
+            extra (dict | None): 付加する情報（結果や縮退した fetcher 等）
+
+        Returns:
+            dict: 集計結果辞書
+        """
+        with self.lock:
+            span_list = [
+                {"name": name, "labels": dict(labels), "count": int(count), "total": total, "max": maximum}
+                for (name, labels), (count, total, maximum) in self.span_dict.items()
+            ]
+            counter_list = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counter_dict.items()
+            ]
+            result = {
+                "started_at": self.started_at,
+                "duration": time.perf_counter() - self.start,
+                "spans": span_list,
+                "counters": counter_list,
+            }
+        return result | (extra or {})
+
+    def write_jsonl(self, path: str | Path, extra: dict | None = None) -> None:
+        """集計結果を JSON Lines のファイルに1行追記する"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("ab") as f:
+            f.write(orjson.dumps(self.to_dict(extra)) + b"\n")
+
+    def write_prometheus(self, path: str | Path, degraded: dict[str, str] | None = None) -> None:
+        """集計結果を Prometheus の textfile collector 形式で書き出す
+
+        Notes:
+            collector が書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+
+        Args:
+            path (str | Path): 出力先のパス（拡張子 .prom）
+            degraded (dict[str, str] | None): 縮退した fetcher のクラス名をキーに持つ辞書
+        """
+        report = self.to_dict()
+        line_list = [
+            f"# HELP {METRIC_PREFIX}run_timestamp_seconds Start time of the last run.",
+            f"# TYPE {METRIC_PREFIX}run_timestamp_seconds gauge",
+            f"{METRIC_PREFIX}run_timestamp_seconds {report['started_at']:.3f}",
+            f"# HELP {METRIC_PREFIX}run_duration_seconds Duration of the last run.",
+            f"# TYPE {METRIC_PREFIX}run_duration_seconds gauge",
+            f"{METRIC_PREFIX}run_duration_seconds {report['duration']:.6f}",
+        ]
+
+        for suffix, key, help_text in [
+            ("seconds", "total", "Total duration of each stage in the last run."),
+            ("max_seconds", "max", "Longest single duration of each stage in the last run."),
+            ("count", "count", "Number of times each stage ran in the last run."),
+        ]:
+            metric = f"{METRIC_PREFIX}stage_{suffix}"
+            line_list.append(f"# HELP {metric} {help_text}")
+            line_list.append(f"# TYPE {metric} gauge")
+            for span in report["spans"]:
+                labels = {"stage": span["name"]} | span["labels"]
+                line_list.append(f"{metric}{format_labels(labels)} {span[key]:g}")
+
+        counter_name_list = sorted({counter["name"] for counter in report["counters"]})
+        for name in counter_name_list:
+            metric = f"{METRIC_PREFIX}{name}"
+            line_list.append(f"# HELP {metric} {COUNTER_HELP.get(name, name)}")
+            line_list.append(f"# TYPE {metric} gauge")
+            for counter in report["counters"]:
+                if counter["name"] == name:
+                    line_list.append(f"{metric}{format_labels(counter['labels'])} {counter['value']:g}")
+
+        if degraded is not None:
+            metric = f"{METRIC_PREFIX}fetcher_degraded"
+            line_list.append(f"# HELP {metric} Fetchers that fell back in the last run.")
+            line_list.append(f"# TYPE {metric} gauge")
+            for name in degraded:
+                line_list.append(f"{metric}{format_labels({'fetcher': name})} 1")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temp_path.write_text("\n".join(line_list) + "\n", encoding="utf-8")
+        temp_path.replace(path)
+
+    def export(self, config: dict, extra: dict | None = None) -> None:
+        """設定 instrumentation.report_path / prometheus_path に集計結果を書き出す
+
+        Notes:
+            書き出しに失敗しても実行自体は失敗させない
+
+        Args:
+            config (dict): 設定辞書
+            extra (dict | None): 付加する情報、"degraded" キーは Prometheus にも出力する
+        """
+        instrumentation_config = config.get("instrumentation", {})
+        report_path = instrumentation_config.get("report_path", "")
+        prometheus_path = instrumentation_config.get("prometheus_path", "")
+        try:
+            if report_path:
+                self.write_jsonl(report_path, extra)
+            if prometheus_path:
+                self.write_prometheus(prometheus_path, (extra or {}).get("degraded"))
+        except OSError as e:
+            logger.warning(f"Run report export failed, {e}.")
+
+
+def format_labels(labels: dict) -> str:
+    """Prometheus のラベル表記 {key="value",...} を返す"""
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+# 実行全体で共有する集計
+instrumentation = Instrumentation()
+
+
+if __name__ == "__main__":
+    with instrumentation.span("fetch", fetcher="OpenMeteoFetcher"):
+        time.sleep(0.1)
+    instrumentation.add("rows_written", 2)
+    print(orjson.dumps(instrumentation.to_dict(), option=orjson.OPT_INDENT_2).decode())
+    instrumentation.write_prometheus("./run_report.prom", {"PollenCountFetcher": "timeout"})
+    print(Path("./run_report.prom").read_text())
@@ -1,16 +1,27 @@
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
 from logging import INFO, getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import httpx
+import numpy as np
 import orjson
-from jinja2 import Template
 
-from we_wish_the_perfect_weather.fetcher_base import FetcherBase
-from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher
-from we_wish_the_perfect_weather.pollen_count_fetcher import PollenCountFetcher
-from we_wish_the_perfect_weather.util import Result, datetime_to_date, get_now, get_tomorrow, get_yesterday, is_morning
+from we_wish_the_perfect_weather.accuracy import ForecastAccuracy
+from we_wish_the_perfect_weather.criteria import CRITERIA_COLUMNS, PW_BASE, criteria_version, evaluate_perfection
+from we_wish_the_perfect_weather.criteria import evaluate_perfection_one, resolve_base
+from we_wish_the_perfect_weather.fetcher_base import FetcherBase, FetchResult
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.util import Result, get_locations, get_now, get_target_dates, month_range_list
+from we_wish_the_perfect_weather.util import run_in_daemon_thread
 from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
 
+if TYPE_CHECKING:
+    from jinja2 import Template
+
+    from we_wish_the_perfect_weather.discord_notifier import DiscordNotifier
+
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
@@ -18,28 +29,75 @@ logger.setLevel(INFO)
 class Manager:
     MSG_TEMPLATE_PATH = "./log/msg.html"
     CONFIG_PATH = "./config/config.json"
-    PW_BASE = {
-        "maximum_temperature": 28,
-        "minimum_temperature": 18,
-        "maximum_humidity": 70,
-        "minimum_humidity": 40,
-        "maximum_precipitation_probability": 10,
-        "maximum_precipitation": 0,
-        "maximum_wind_speed": 3,
-        "maximum_pollen_count": 10,
-    }
-
-    def __init__(self) -> None:
-        self.config: dict = orjson.loads(Path(Manager.CONFIG_PATH).read_bytes())
-        self.fetcher_list: list[FetcherBase] = [OpenMeteoFetcher(self.config), PollenCountFetcher(self.config)]
-
-        db_fullpath: Path = Path(self.config["db"]["save_path"]) / self.config["db"]["save_file_name"]
-        self.weather_db: WeatherDBController = WeatherDBController(db_fullpath)
-
-        msg_template_str: str = Path(Manager.MSG_TEMPLATE_PATH).read_text()
-        self.msg_template: Template = Template(msg_template_str)
+    FETCH_TIMEOUT = 60  # fetcher ごとの取得期限の既定値[s]
+    FETCH_DEADLINE = 90  # 取得処理全体の期限[s]
+    NOTIFY_FLUSH_TIMEOUT = 60  # 実行終了時にDiscord通知の送信完了を待つ上限[s]
+    SHARD_SIZE = 100  # ShardedRunner で1プロセスに1回で割り当てる地点数の既定値
+    PW_BASE = PW_BASE
+
+    def __init__(self, config: dict | None = None) -> None:
+        if config is None:
+            config = orjson.loads(Path(Manager.CONFIG_PATH).read_bytes())
+        self.config: dict = config
+        self.locations: list[dict] = get_locations(self.config)
+
+        # 集計元の1時間ごとの値も保存しておく（replay で再取得せずにレコードを作り直すため）
+        self.is_store_hourly: bool = bool(self.config["db"].get("is_store_hourly", True))
+
+        # DB、fetcher と通知テンプレートは必要になった時点で構築する
+        # （記録済で何もしない実行では HTTP クライアント等の読み込みを行わない、
+        #   ShardedRunner のワーカープロセスではDBに接続しない）
+        self._weather_db: WeatherDBController | None = None
+        self._accuracy: ForecastAccuracy | None = None
+        self._fetcher_list: list[FetcherBase] | None = None
+        self._msg_template: Template | None = None
 
         self.registered_at: str = get_now()
+        self.degraded: dict[str, str] = {}
+        self.notifier: DiscordNotifier | None = None
+
+    @property
+    def db_fullpath(self) -> Path:
+        return Path(self.config["db"]["save_path"]) / self.config["db"]["save_file_name"]
+
+    @property
+    def weather_db(self) -> WeatherDBController:
+        if self._weather_db is None:
+            self._weather_db = WeatherDBController(self.db_fullpath)
+        return self._weather_db
+
+    @weather_db.setter
+    def weather_db(self, weather_db: WeatherDBController) -> None:
+        self._weather_db = weather_db
+        self._accuracy = None
+
+    @property
+    def accuracy(self) -> ForecastAccuracy:
+        if self._accuracy is None:
+            self._accuracy = ForecastAccuracy(self.weather_db)
+        return self._accuracy
+
+    @property
+    def fetcher_list(self) -> list[FetcherBase]:
+        if self._fetcher_list is None:
+            from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher
+            from we_wish_the_perfect_weather.pollen_count_fetcher import PollenCountFetcher
+
+            self._fetcher_list = [OpenMeteoFetcher(self.config), PollenCountFetcher(self.config)]
+        return self._fetcher_list
+
+    @fetcher_list.setter
+    def fetcher_list(self, fetcher_list: list[FetcherBase]) -> None:
+        self._fetcher_list = fetcher_list
+
+    @property
+    def msg_template(self) -> "Template":
+        if self._msg_template is None:
+            from jinja2 import Template
+
+            msg_template_str: str = Path(Manager.MSG_TEMPLATE_PATH).read_text()
+            self._msg_template = Template(msg_template_str)
+        return self._msg_template
 
     def check_perfection(self, info: dict) -> list[bool]:
         """気象情報を元に、"完璧な気候" かどうかを判定する
@@ -63,41 +121,43 @@ class Manager:
                 ・雷、濃霧、乾燥、低温）
             ・風速3m/s以下（木の葉や細かい小枝が揺れる程度で、日常生活にはほとんど影響がない程度）
         """
-        result = []
         match info:
             case {
-                "record_type": record_type,
-                "maximum_temperature": maximum_temperature,
-                "minimum_temperature": minimum_temperature,
-                "maximum_humidity": maximum_humidity,
-                "minimum_humidity": minimum_humidity,
-                "maximum_precipitation_probability": maximum_precipitation_probability,
-                "maximum_precipitation": maximum_precipitation,
-                "maximum_wind_speed": maximum_wind_speed,
-                "maximum_pollen_count": maximum_pollen_count,
+                "record_type": _,
+                "maximum_temperature": _,
+                "minimum_temperature": _,
+                "maximum_humidity": _,
+                "minimum_humidity": _,
+                "maximum_precipitation_probability": _,
+                "maximum_precipitation": _,
+                "maximum_wind_speed": _,
+                "maximum_pollen_count": _,
             }:
                 pass
             case _:
                 raise ValueError("info structure is invalid.")
 
-        base = Manager.PW_BASE
-        result.append(
-            base["minimum_temperature"] <= maximum_temperature and maximum_temperature <= base["maximum_temperature"]
-        )
-        result.append(
-            base["minimum_temperature"] <= minimum_temperature and minimum_temperature <= base["maximum_temperature"]
-        )
-        result.append(maximum_humidity <= base["maximum_humidity"])
-        result.append(base["minimum_humidity"] <= minimum_humidity)
-        result.append(maximum_precipitation_probability <= base["maximum_precipitation_probability"])
-        result.append(maximum_precipitation <= base["maximum_precipitation"])
-        result.append(maximum_wind_speed <= base["maximum_wind_speed"])
-        result.append(maximum_pollen_count < base["maximum_pollen_count"])
-        return result
+        # 1レコードの判定は配列を作らずに行う（複数レコードは check_perfection_batch でまとめて判定する）
+        return evaluate_perfection_one(info, Manager.PW_BASE)
+
+    def check_perfection_batch(self, columns: dict) -> tuple[np.ndarray, np.ndarray]:
+        """列ごとの配列で与えられた複数レコードについて、"完璧な気候" かどうかをまとめて判定する
+
+        Args:
+            columns (dict): 判定に使う各列名（と "is_stale"）をキー、同じ長さの配列を値に持つ辞書
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]:
+                (check_perfection と同じ並びの判定結果 bool[n_records, 8], is_perfect bool[n_records])
+        """
+        return evaluate_perfection(columns, Manager.PW_BASE)
 
     def post_discord_notify(self, message: str, is_embed: bool = False) -> Result:
         """Discord通知ポスト
 
+        Notes:
+            通知は DiscordNotifier のキューに積まれ、接続を使い回して順に送信される
+
         Args:
             message (str): Discordに通知する文字列
             is_embed (bool): 埋め込んで投稿するかどうか
@@ -105,100 +165,591 @@ class Manager:
         Returns:
             Result: 成功時Result.success
         """
-        url = self.config["discord_webhook_url"]["webhook_url"]
-        headers = {"Content-Type": "application/json"}
-
-        payload = {}
-        # if is_embed:
-        #     description_msg = ""
-        #     media_links = []
-        #     lines = message.split("\n")
-        #     for line in lines:
-        #         line = line.strip()
-        #         if line.startswith("http"):
-        #             media_links.append(line)
-        #         else:
-        #             description_msg += line + "\n"
-        #     embeds = []
-        #     embeds.append({"description": description_msg})
-        #     payload = {"embeds": embeds}
-
-        if not payload:
-            payload = {"content": "```" + message + "```"}
-
-        response = httpx.post(url, headers=headers, data=orjson.dumps(payload).decode())
-        response.raise_for_status()
-        return Result.success
+        if self.notifier is None:
+            from we_wish_the_perfect_weather.discord_notifier import DiscordNotifier
+
+            discord_config = self.config["discord_webhook_url"]
+            self.notifier = DiscordNotifier(
+                discord_config["webhook_url"],
+                queue_size=int(discord_config.get("queue_size", DiscordNotifier.QUEUE_SIZE)),
+                is_coalesce=bool(discord_config.get("is_coalesce", True)),
+            )
+        # 送信はバックグラウンドで行われる、完了を待つ場合は flush_discord_notify を呼ぶ
+        instrumentation.add("notifications")
+        return self.notifier.post(message)
+
+    def flush_discord_notify(self, timeout: float | None = None) -> bool:
+        """キューに積まれたDiscord通知の送信完了を待つ
+
+        Args:
+            timeout (float | None): 待機の上限[s]、None なら無制限
+
+        Returns:
+            bool: 期限内にすべて送信し終えた場合True
+        """
+        if self.notifier is None:
+            return True
+        with instrumentation.span("notify_flush"):
+            return self.notifier.flush(timeout)
+
+    def interpret_record(self, target_date: str, record_type: str, location: str = "") -> dict:
+        """取得済の気象情報から、判定前のレコードを組み立てる
+
+        Args:
+            target_date (str): 対象日付 "%Y-%m-%d"形式
+            record_type (str): レコードタイプ ["actual", "forecast"]
+            location (str): 観測地点名
+
+        Notes:
+            いずれかの fetcher の値が最新で無い（期限切れのキャッシュから得たか、取得できなかった、
+            縮退して fallback の値を使った）場合は is_stale を True とし、次回の実行で取得し直す
 
-    def register(self, target_date: str, record_type: str) -> Result:
+        Returns:
+            dict: is_perfect 以外のキーを持つレコード辞書
+        """
         record = {}
+        is_stale = False
         for fetcher in self.fetcher_list:
-            record = record | fetcher.interpret(target_date, record_type)
+            if type(fetcher).__name__ in self.degraded:
+                record = record | fetcher.fallback(target_date, record_type, location)
+                is_stale = True
+            else:
+                record = record | fetcher.interpret(target_date, record_type, location)
+                is_stale = is_stale or fetcher.is_stale(target_date, location)
+        record["registered_at"] = self.registered_at
+        record["location"] = location
+        record["is_stale"] = is_stale
+        return record
 
+    def build_record(self, target_date: str, record_type: str, location: str = "") -> tuple[dict, list[bool]]:
+        """取得済の気象情報から、登録用のレコードを組み立てる
+
+        Args:
+            target_date (str): 対象日付 "%Y-%m-%d"形式
+            record_type (str): レコードタイプ ["actual", "forecast"]
+            location (str): 観測地点名
+
+        Returns:
+            tuple[dict, list[bool]]: (レコード辞書, check_perfection の判定結果)
+        """
+        record = self.interpret_record(target_date, record_type, location)
         check = self.check_perfection(record)
         record["is_perfect"] = all(check)
-        record["registered_at"] = self.registered_at
+        record["criteria_version"] = criteria_version(Manager.PW_BASE)
+        return record, check
 
-        self.weather_db.upsert(record)
+    def render_notification(self, record: dict, check: list[bool]) -> str | None:
+        """登録したレコードの通知文を組み立てる
 
+        Args:
+            record (dict): 登録したレコード辞書
+            check (list[bool]): check_perfection の判定結果
+
+        Returns:
+            str | None: Discordに通知する文字列、設定で通知しない場合は None
+        """
+        location, target_date, record_type = record["location"], record["target_date"], record["record_type"]
         is_post_discord = self.config["discord_webhook_url"]["is_post_discord_notify"]
         if record["is_perfect"]:
-            logger.info(f"{target_date} {record_type} is perfect !!!")
+            logger.info(f"{location} {target_date} {record_type} is perfect !!!")
             if self.config["notification"]["perfect"] and is_post_discord:
                 line = "/" * 55 + "\n"
                 msg = self.msg_template.render(record=record, base=Manager.PW_BASE, check=check)
-                self.post_discord_notify(f"{line}{msg}{line}")
+                return f"{line}{msg}{line}"
         else:
-            logger.info(f"{target_date} {record_type} is imperfect ...")
+            logger.info(f"{location} {target_date} {record_type} is imperfect ...")
             if self.config["notification"]["imperfect"] and is_post_discord:
-                msg = self.msg_template.render(record=record, base=Manager.PW_BASE, check=check)
-                self.post_discord_notify(msg)
+                return self.msg_template.render(record=record, base=Manager.PW_BASE, check=check)
+        return None
+
+    @instrumentation.timed("notify")
+    def notify(self, record: dict, check: list[bool]) -> Result:
+        message = self.render_notification(record, check)
+        if message is not None:
+            self.post_discord_notify(message)
         return Result.success
 
-    def is_first_run_of_day(self, target_date1: str, target_date2: str) -> bool:
-        t1 = self.weather_db.select_by_target_date(target_date1, "actual")
-        t2 = self.weather_db.select_by_target_date(target_date2, "forecast")
-        return not (t1 and t2)
+    def register(self, target_date: str, record_type: str, location: str = "") -> Result:
+        record, check = self.build_record(target_date, record_type, location)
+        self.weather_db.upsert(record)
+        self.notify(record, check)
+        return Result.success
 
-    def run(self) -> Result:
-        logger.info("Manager run -> start.")
+    def get_target_list(
+        self, locations: list[dict], target_date1: str, target_date2: str
+    ) -> list[tuple[str, str, str]]:
+        """地点ごとに [target_date1 の実測値, target_date2 の予報値] の (target_date, record_type, location) を返す"""
+        target_list = []
+        for location in locations:
+            # 実測値格納
+            target_list.append((target_date1, "actual", location["name"]))
+            # 予報値格納
+            target_list.append((target_date2, "forecast", location["name"]))
+        return target_list
+
+    def build_records(self, target_list: list[tuple[str, str, str]]) -> tuple[list[dict], np.ndarray]:
+        """取得済の気象情報から、複数の (target_date, record_type, location) の登録用のレコードをまとめて組み立てる
 
-        target_date_at_list = [
-            get_yesterday(),
-            get_now(),
-            get_tomorrow(),
+        Notes:
+            判定に必要な値が揃わないレコードは含めない
+
+        Args:
+            target_list (list[tuple[str, str, str]]): (target_date, record_type, location) のリスト
+
+        Returns:
+            tuple[list[dict], np.ndarray]: (レコード辞書のリスト, check_perfection と同じ並びの判定結果 bool[n, 8])
+        """
+        record_list = []
+        with instrumentation.span("interpret"):
+            for target_date, record_type, location in target_list:
+                record = self.interpret_record(target_date, record_type, location)
+                if not all(column in record for column in CRITERIA_COLUMNS):
+                    # 取得できなかった値がある場合は登録しない（次回の実行で再取得する）
+                    logger.warning(f"{location} {target_date} {record_type} is skipped, information is missing.")
+                    continue
+                record_list.append(record)
+
+        # 全レコードをまとめて判定する
+        with instrumentation.span("check"):
+            columns = {
+                column: [record[column] for record in record_list] for column in [*CRITERIA_COLUMNS, "is_stale"]
+            }
+            check_matrix, is_perfect_list = self.check_perfection_batch(columns)
+            version = criteria_version(Manager.PW_BASE)
+            for record, is_perfect in zip(record_list, is_perfect_list):
+                record["is_perfect"] = bool(is_perfect)
+                record["criteria_version"] = version
+        return record_list, check_matrix
+
+    def register_many(self, target_list: list[tuple[str, str, str]]) -> Result:
+        """複数の (target_date, record_type, location) をまとめて登録する
+
+        Notes:
+            DBへの書き込みは upsert_many で1トランザクションにまとめ、その後に通知する
+            判定に必要な値が揃わないレコードは登録しない
+
+        Args:
+            target_list (list[tuple[str, str, str]]): (target_date, record_type, location) のリスト
+
+        Returns:
+            Result: 成功時Result.success, 登録できたレコードが無い場合Result.failed
+        """
+        record_list, check_matrix = self.build_records(target_list)
+        if not record_list:
+            return Result.failed
+
+        with instrumentation.span("upsert"):
+            count = self.weather_db.upsert_many(record_list)
+            if self.is_store_hourly:
+                self.store_hourly(record_list)
+        instrumentation.add("rows_written", count)
+        for record, check in zip(record_list, check_matrix):
+            self.notify(record, [bool(c) for c in check])
+        return Result.success
+
+    def dump_hourly_records(self, record_list: list[dict]) -> list[dict]:
+        """登録するレコードの集計元の1時間ごとの値を、HourlyObservation のレコードとして返す
+
+        Notes:
+            stale なレコードの値は保存しない（replay で stale でないレコードとして作り直されないようにする）
+
+        Args:
+            record_list (list[dict]): 登録する Weather のレコード辞書のリスト
+
+        Returns:
+            list[dict]: WeatherDBController.upsert_hourly_many に渡すレコード辞書のリスト
+        """
+        record_list = [record for record in record_list if not record.get("is_stale", False)]
+        hourly_record_list = []
+        for fetcher in self.fetcher_list:
+            if type(fetcher).__name__ in self.degraded:
+                continue
+            hourly_record_list.extend(fetcher.dump_hourly_records(record_list))
+        return hourly_record_list
+
+    def store_hourly(self, record_list: list[dict]) -> int:
+        """登録したレコードの集計元の1時間ごとの値をDBに保存する
+
+        Args:
+            record_list (list[dict]): 登録した Weather のレコード辞書のリスト
+
+        Returns:
+            int: 保存した HourlyObservation のレコード数
+        """
+        return self.weather_db.upsert_hourly_many(self.dump_hourly_records(record_list))
+
+    def fetch_all(self, locations: list[dict]) -> dict[str, str]:
+        """全fetcherの fetch_data を並行に実行し、期限内に完了した取得結果を読み込む
+
+        Notes:
+            fetcher ごとの期限 fetch.timeout.{fetcherのクラス名} と、全体の期限 fetch.deadline を過ぎた fetcher は
+            待たずに縮退扱いとし、以降は interpret の代わりに fallback の値を使う
+            実行中のスレッドは中断できないため、期限切れの fetcher のスレッドは放棄する
+            （デーモンスレッドなので終了は待たない、後から完了しても取得結果は読み込まずに捨てる）
+            取得結果の読み込み (load_result) はこのスレッドでのみ行い、ワーカースレッドは fetcher の属性を書き換えない
+
+        Args:
+            locations (list[dict]): 取得対象の観測地点辞書のリスト
+
+        Returns:
+            dict[str, str]: 縮退した fetcher のクラス名をキー、理由を値に持つ辞書
+        """
+        fetch_config = self.config.get("fetch", {})
+        timeout_config = fetch_config.get("timeout", {})
+        deadline = float(fetch_config.get("deadline", Manager.FETCH_DEADLINE))
+
+        self.degraded = {}
+        start = time.monotonic()
+        future_list = [
+            (fetcher, run_in_daemon_thread(self.fetch, fetcher, locations, name=f"fetcher-{type(fetcher).__name__}"))
+            for fetcher in self.fetcher_list
         ]
-        target_date_list = [datetime_to_date(t) for t in target_date_at_list]
-        target_date1, target_date2 = "", ""
-        if is_morning():
-            target_date1 = target_date_list[0]
-            target_date2 = target_date_list[1]
+        for fetcher, future in future_list:
+            name = type(fetcher).__name__
+            timeout = float(timeout_config.get(name, Manager.FETCH_TIMEOUT))
+            remaining = start + min(timeout, deadline) - time.monotonic()
+            try:
+                result = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                self.degraded[name] = "timeout"
+                continue
+            except Exception as e:
+                self.degraded[name] = f"{type(e).__name__}: {e}"
+                continue
+            fetcher.load_result(locations, result)
+
+        for name, reason in self.degraded.items():
+            logger.warning(f"Fetcher {name} is degraded, {reason}.")
+        logger.info(f"Fetching all -> done ({time.monotonic() - start:.2f}s).")
+        return self.degraded
+
+    def fetch(self, fetcher: FetcherBase, locations: list[dict]) -> FetchResult:
+        """fetcher ごとの取得時間を記録しながら fetch_data を実行する（fetch_all のワーカースレッドで呼ばれる）"""
+        with instrumentation.span("fetch", fetcher=type(fetcher).__name__):
+            return fetcher.fetch_data(locations)
+
+    def export_report(self, command: str, result: Result, **extra) -> None:
+        """実行ごとの所要時間とカウンタを、設定 instrumentation の出力先に書き出す
+
+        Args:
+            command (str): 実行したコマンド ["run", "backfill"]
+            result (Result): 実行結果
+            **extra: 付加する情報
+        """
+        report = {"command": command, "result": result.name, "degraded": self.degraded} | extra
+        instrumentation.export(self.config, report)
+
+    def is_first_run_of_day(self, target_date1: str, target_date2: str, location: str = "") -> bool:
+        return location not in self.weather_db.select_done_locations([location], target_date1, target_date2)
+
+    def run(self, locations: list[dict] | None = None, now: datetime | None = None) -> Result:
+        """ "完璧な気候" かどうかを判定してDBに記録する
+
+        Notes:
+            午前なら [昨日の実測値, 今日の予報値]、午後なら [今日の実測値, 明日の予報値] を記録する
+
+        Args:
+            locations (list[dict] | None): 対象の観測地点辞書のリスト、None なら設定のすべての地点
+            now (datetime | None): 基準とする現在日時（地点の現地時刻）、None なら実行環境の現在日時
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info("Manager run -> start.")
+        instrumentation.reset()
+        self.degraded = {}
+        if locations is None:
+            locations = self.locations
+        if now is None:
+            now = datetime.now()
+        self.registered_at = get_now()
+
+        target_date1, target_date2 = get_target_dates(now)
+        if now.hour < 12:
             logger.info(f"Now is morning, checking [{target_date1}, {target_date2}].")
         else:
-            target_date1 = target_date_list[1]
-            target_date2 = target_date_list[2]
             logger.info(f"Now is afternoon, checking [{target_date1}, {target_date2}].")
 
-        # 実行日の午前or午後それぞれで初回実行で無ければ
-        if not self.is_first_run_of_day(target_date1, target_date2):
+        # 実行日の午前or午後それぞれで初回実行で無い地点は除外する
+        # 登録済かどうかは全地点分を1回のクエリで確認する
+        done_location_set = self.weather_db.select_done_locations(
+            [location["name"] for location in locations], target_date1, target_date2
+        )
+        pending_locations = [location for location in locations if location["name"] not in done_location_set]
+        if not pending_locations:
             logger.info(f"[{target_date1}, {target_date2}] target_date is already done.")
+            self.export_report("run", Result.success, locations=0)
             logger.info("Manager run -> done.")
             return Result.success
+        logger.info(f"{len(pending_locations)}/{len(locations)} location(s) to check.")
+        locations = pending_locations
+
+        report_extra = {}
+        shard_config = self.config.get("shard", {})
+        workers = int(shard_config.get("workers", 1))
+        shard_size = int(shard_config.get("size", Manager.SHARD_SIZE))
+        if workers > 1 and len(locations) > shard_size:
+            # 地点が多い場合は、地点を分割して複数プロセスで取得・判定し、このプロセスでまとめて書き込む
+            from we_wish_the_perfect_weather.sharded_runner import ShardedRunner
+
+            logger.info("Manager register (sharded) -> start.")
+            runner = ShardedRunner(
+                self,
+                workers,
+                shard_size,
+                int(shard_config.get("queue_size", ShardedRunner.QUEUE_SIZE)),
+                int(shard_config.get("batch_size", ShardedRunner.BATCH_SIZE)),
+            )
+            count = runner.run(locations, target_date1, target_date2)
+            # 失敗したシャードがあれば、登録できた地点があっても失敗とする
+            result = Result.success if count and not runner.skipped_locations else Result.failed
+            report_extra["skipped_locations"] = runner.skipped_locations
+        else:
+            # 気象情報取得（対象地点をまとめて、各fetcherを並行に取得する）
+            self.fetch_all(locations)
 
-        # 気象情報取得
-        for fetcher in self.fetcher_list:
-            fetcher.fetch()
-
-        logger.info("Manager register -> start.")
-        # 実測値格納
-        self.register(target_date1, "actual")
-        # 予報値格納
-        self.register(target_date2, "forecast")
+            logger.info("Manager register -> start.")
+            result = self.register_many(self.get_target_list(locations, target_date1, target_date2))
+        self.flush_discord_notify(Manager.NOTIFY_FLUSH_TIMEOUT)
         logger.info("Manager register -> done.")
 
+        self.export_report("run", result, locations=len(locations), **report_extra)
         logger.info("Manager run -> done.")
+        return result
+
+    def backfill(self, from_date: str, to_date: str) -> Result:
+        """過去の実測値を期間指定でDBに記録する
+
+        Args:
+            from_date (str): 開始日 "%Y-%m-%d"形式
+            to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info(f"Manager backfill [{from_date}, {to_date}] -> start.")
+        from we_wish_the_perfect_weather.backfill import Backfiller
+
+        instrumentation.reset()
+        backfiller = Backfiller(self.config, self.weather_db, Manager.PW_BASE, self.registered_at)
+        count = backfiller.run(from_date, to_date)
+        logger.info(f"{count} record(s) backfilled.")
+        self.export_report("backfill", Result.success, from_date=from_date, to_date=to_date)
+        logger.info("Manager backfill -> done.")
+        return Result.success
+
+    def replay(self, from_date: str, to_date: str) -> Result:
+        """保存済の1時間ごとの値から、期間内の Weather レコードを作り直す
+
+        Notes:
+            取得は行わず、HourlyObservation の値を各 fetcher に読み込ませて、
+            通常の実行と同じ interpret → 判定 → upsert_many を行う（通知はしない）
+            集計や判定の処理を変更した場合に、過去のレコードへ反映するために使う
+            registered_at は元の取得時のものを使う
+
+        Args:
+            from_date (str): 開始日 "%Y-%m-%d"形式
+            to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info(f"Manager replay [{from_date}, {to_date}] -> start.")
+        instrumentation.reset()
+        self.degraded = {}
+        name_list = [location["name"] for location in self.locations]
+        count = 0
+        # 集計テーブルは月ごとではなく、最後にまとめて集計し直す
+        with self.weather_db.deferred_stats():
+            for start_date, end_date in month_range_list(from_date, to_date):
+                count += self.replay_month(name_list, start_date, end_date)
+
+        instrumentation.add("rows_written", count)
+        logger.info(f"{count} record(s) replayed.")
+        self.export_report("replay", Result.success, from_date=from_date, to_date=to_date)
+        logger.info("Manager replay -> done.")
+        return Result.success
+
+    def replay_month(self, name_list: list[str], start_date: str, end_date: str) -> int:
+        """replay の1か月分の Weather レコードを作り直す
+
+        Args:
+            name_list (list[str]): 観測地点名のリスト
+            start_date (str): 開始日 "%Y-%m-%d"形式
+            end_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+
+        Returns:
+            int: 書き込んだレコード数
+        """
+        # (地点, 日付, レコードタイプ) 単位で変数をまとめる
+        group_dict: dict[tuple[str, str, str], dict] = {}
+        for row in self.weather_db.select_hourly(name_list, start_date, end_date):
+            key = (row["location"], row["target_date"], row["record_type"])
+            group = group_dict.setdefault(key, {"registered_at": row["registered_at"], "hourly_values": {}})
+            values = np.frombuffer(row["hourly_values"], dtype=FetcherBase.HOURLY_DTYPE)
+            group["hourly_values"][row["variable"]] = values
+
+        record_list = []
+        with instrumentation.span("interpret"):
+            for (location, target_date, record_type), group in group_dict.items():
+                for fetcher in self.fetcher_list:
+                    fetcher.load_hourly(target_date, location, group["hourly_values"])
+                record = self.interpret_record(target_date, record_type, location)
+                if not all(column in record for column in CRITERIA_COLUMNS):
+                    logger.warning(f"{location} {target_date} {record_type} is skipped, information is missing.")
+                    continue
+                record["registered_at"] = group["registered_at"]
+                record_list.append(record)
+        if not record_list:
+            return 0
+
+        with instrumentation.span("check"):
+            columns = {
+                column: [record[column] for record in record_list] for column in [*CRITERIA_COLUMNS, "is_stale"]
+            }
+            _, is_perfect_list = self.check_perfection_batch(columns)
+            version = criteria_version(Manager.PW_BASE)
+            for record, is_perfect in zip(record_list, is_perfect_list):
+                record["is_perfect"] = bool(is_perfect)
+                record["criteria_version"] = version
+
+        with instrumentation.span("upsert"):
+            count = self.weather_db.upsert_many(record_list)
+        logger.info(f"Replay [{start_date}, {end_date}] -> {len(record_list)} record(s).")
+        return count
+
+    def rescore(self) -> Result:
+        """現行の判定基準(PW_BASE)で、保存済の全レコードの is_perfect を再判定する
+
+        Notes:
+            判定は DB 上で1つの UPDATE 文で行い、判定時の基準が現行と同じレコードは更新しない
+            閾値を変更した後に実行する（通知はしない）
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info(f"Manager rescore [{criteria_version(Manager.PW_BASE)}] -> start.")
+        instrumentation.reset()
+        with instrumentation.span("rescore"):
+            count = self.weather_db.rescore(Manager.PW_BASE)
+        instrumentation.add("rows_written", count)
+        logger.info(f"{count} record(s) rescored.")
+        self.export_report("rescore", Result.success)
+        logger.info("Manager rescore -> done.")
+        return Result.success
+
+    def forecast_accuracy(self, from_date: str, to_date: str, location: str | None = None) -> dict:
+        """期間内の予報値を同じ日付の実測値と比較して、予報の精度を返す
+
+        Notes:
+            結果は期間ごとにキャッシュされ、このプロセスからDBに書き込むまで使い回される（daemon での利用を想定）
+
+        Args:
+            from_date (str): 開始日 "%Y-%m-%d"形式
+            to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+            location (str | None): 観測地点名、None なら全地点
+
+        Returns:
+            dict: 列ごとの誤差と is_perfect の的中の件数の辞書（accuracy.evaluate_accuracy）
+        """
+        return self.accuracy.evaluate(from_date, to_date, location)
+
+    def export(
+        self,
+        path: str,
+        export_format: str,
+        from_date: str | None = None,
+        to_date: str | None = None,
+        record_type: str | None = None,
+    ) -> Result:
+        """記録済のレコードをファイルに書き出す
+
+        Args:
+            path (str): 出力先のパス
+            export_format (str): 出力形式 ["csv", "jsonl", "parquet"]
+            from_date (str | None): 開始日 "%Y-%m-%d"形式、None なら最初から
+            to_date (str | None): 終了日 "%Y-%m-%d"形式（この日を含む）、None なら最後まで
+            record_type (str | None): レコードタイプ ["actual", "forecast"]、None なら両方
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info(f"Manager export [{export_format}] -> start.")
+        from we_wish_the_perfect_weather.exporter import WeatherExporter
+
+        count = WeatherExporter(self.weather_db).export(path, export_format, from_date, to_date, record_type)
+        logger.info(f"{count} record(s) exported to {path}.")
+        logger.info("Manager export -> done.")
+        return Result.success
+
+    def rebuild_stats(self) -> Result:
+        """集計テーブル（月ごとの集計、連続日数）を記録済の全レコードから作り直す
+
+        Notes:
+            集計テーブルは upsert のたびに更新されるため、通常は実行不要
+            DBを直接編集した場合等に、集計テーブルを Weather と一致させるために使う
+
+        Returns:
+            Result: 成功時Result.success
+        """
+        logger.info("Manager rebuild stats -> start.")
+        instrumentation.reset()
+        with instrumentation.span("rebuild_stats"):
+            count = self.weather_db.rebuild_stats()
+        logger.info(f"{count} monthly stat(s) rebuilt.")
+        self.export_report("rebuild-stats", Result.success)
+        logger.info("Manager rebuild stats -> done.")
         return Result.success
 
+    def get_base(self, profile: str = "") -> dict:
+        """判定の閾値のプロファイル名から閾値辞書を返す
+
+        Notes:
+            プロファイルは設定 profiles に {プロファイル名: {閾値のキー: 値}} の形式で定義し、
+            定義に無いキーは PW_BASE の値を使う
+
+        Args:
+            profile (str): プロファイル名、空文字列なら PW_BASE
+
+        Returns:
+            dict: PW_BASE と同じキーを持つ閾値辞書
+
+        Raises:
+            ValueError: 設定に無いプロファイル名、またはプロファイルの閾値が不正な場合
+        """
+        if not profile:
+            return resolve_base()
+        profile_dict: dict = self.config.get("profiles", {})
+        if profile not in profile_dict:
+            raise ValueError(f"unknown profile: {profile}.")
+        return resolve_base(profile_dict[profile])
+
+    def select_perfect_days(
+        self,
+        from_date: str,
+        to_date: str,
+        location: str | None = None,
+        profile: str = "",
+        record_type: str = "actual",
+    ) -> list[dict]:
+        """期間内の "完璧な気候" の日を、指定のプロファイルの閾値で判定して返す
+
+        Notes:
+            記録時の is_perfect ではなく、保存済の集計値をプロファイルの閾値で DB 上で判定する
+
+        Args:
+            from_date (str): 開始日 "%Y-%m-%d"形式
+            to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+            location (str | None): 観測地点名、None なら全地点
+            profile (str): 閾値のプロファイル名、空文字列なら PW_BASE
+            record_type (str): レコードタイプ ["actual", "forecast"]
+
+        Returns:
+            list[dict]: 該当するレコードの辞書リスト（地点、日付順）
+        """
+        base = self.get_base(profile)
+        return self.weather_db.select_perfect_days(from_date, to_date, location, record_type, base)
+
 
 if __name__ == "__main__":
     manager = Manager()
@@ -1,16 +1,46 @@
-from typing import Self
+from typing import NamedTuple, Self
 
-from sqlalchemy import INTEGER, Boolean, Column, Float, Integer, String, create_engine
+from sqlalchemy import INTEGER, Boolean, Column, Float, Index, Integer, LargeBinary, String, create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, deferred
 
 Base = declarative_base()
 
 
+class WeatherRecord(NamedTuple):
+    """Weather の1行を表す読み取り専用のレコード
+
+    Notes:
+        Core で読んだ行から ORM オブジェクトを介さずに作る（WeatherDBController.select_records 等）
+        並びは Weather の列の並びと一致させる
+    """
+
+    id: int
+    location: str
+    target_date: str
+    record_type: str
+    is_perfect: bool
+    maximum_temperature: float
+    minimum_temperature: float
+    maximum_humidity: int
+    minimum_humidity: int
+    maximum_precipitation_probability: int
+    maximum_precipitation: float
+    maximum_wind_speed: float
+    maximum_pollen_count: int
+    registered_at: str
+    criteria_version: str
+    is_stale: bool
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
 class Weather(Base):
     """気象情報モデル
 
     [id] INTEGER NOT NULL UNIQUE,
+    [location] TEXT NOT NULL,
     [target_date] TEXT NOT NULL,
     [record_type] TEXT NOT NULL,
     [is_perfect] Boolean NOT NULL,
@@ -23,12 +53,24 @@ class Weather(Base):
     [maximum_wind_speed] Float NOT NULL,
     [maximum_pollen_count] Integer NOT NULL,
     [registered_at] TEXT NOT NULL,
-    PRIMARY KEY([id])
+    [criteria_version] TEXT NOT NULL,
+    [is_stale] Boolean NOT NULL,
+    PRIMARY KEY([id]),
+    UNIQUE([location], [target_date], [record_type])
     """
 
     __tablename__ = "Weather"
+    __table_args__ = (
+        Index("ux_weather_key", "location", "target_date", "record_type", unique=True),
+        # 地点を指定しない期間指定の検索と、(target_date, id) のキーセットページングに使う
+        # （SQLite のインデックスは末尾に rowid(=id) を持つため、target_date のみで (target_date, id) 順に読める）
+        # record_type を含めると地点を指定した検索で ux_weather_key より優先されたり、
+        # (target_date, id) 順に読めなくなったりするため、target_date のみとする
+        Index("ix_weather_target_date", "target_date"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    location = Column(String(256), nullable=False, default="", server_default="")
     target_date = Column(String(32))
     record_type = Column(String(256), nullable=False)
     is_perfect = Column(Boolean(), nullable=False)
@@ -41,6 +83,31 @@ class Weather(Base):
     maximum_wind_speed = Column(Float(precision=1), nullable=False)
     maximum_pollen_count = Column(INTEGER(), nullable=False)
     registered_at = Column(String(32))
+    # is_perfect を判定したときの基準と閾値のハッシュ（criteria.criteria_version）
+    criteria_version = Column(String(32), nullable=False, default="", server_default="")
+    # 上流のAPIの障害時に、期限切れのキャッシュの値(stale)を代わりに使ったレコードか
+    # （stale なレコードは登録済として扱わず、次回の実行で取得し直す）
+    is_stale = Column(Boolean(), nullable=False, default=False, server_default="0")
+
+    # 列ごとに許容する値の型（__init__ の型チェックと同じ）と、省略可能な列の既定値
+    VALUE_TYPES = {
+        "location": str,
+        "target_date": str,
+        "record_type": str,
+        "is_perfect": bool,
+        "maximum_temperature": float,
+        "minimum_temperature": float,
+        "maximum_humidity": int,
+        "minimum_humidity": int,
+        "maximum_precipitation_probability": int,
+        "maximum_precipitation": float,
+        "maximum_wind_speed": float,
+        "maximum_pollen_count": int,
+        "registered_at": str,
+        "criteria_version": str,
+        "is_stale": bool,
+    }
+    OPTIONAL_VALUES = {"location": "", "criteria_version": "", "is_stale": False}
 
     def __init__(
         self,
@@ -56,6 +123,9 @@ class Weather(Base):
         maximum_wind_speed: float,
         maximum_pollen_count: int,
         registered_at: str,
+        location: str = "",
+        criteria_version: str = "",
+        is_stale: bool = False,
     ) -> None:
         if not isinstance(target_date, str):
             raise TypeError("target_date must be str.")
@@ -81,7 +151,14 @@ class Weather(Base):
             raise TypeError("maximum_pollen_count must be int.")
         if not isinstance(registered_at, str):
             raise TypeError("registered_at must be str.")
+        if not isinstance(location, str):
+            raise TypeError("location must be str.")
+        if not isinstance(criteria_version, str):
+            raise TypeError("criteria_version must be str.")
+        if not isinstance(is_stale, bool):
+            raise TypeError("is_stale must be bool.")
 
+        self.location = location
         self.target_date = target_date
         self.record_type = record_type
         self.is_perfect = is_perfect
@@ -94,6 +171,8 @@ class Weather(Base):
         self.maximum_wind_speed = maximum_wind_speed
         self.maximum_pollen_count = maximum_pollen_count
         self.registered_at = registered_at
+        self.criteria_version = criteria_version
+        self.is_stale = is_stale
 
     def __repr__(self) -> str:
         columns = ", ".join([f"{k}={v}" for k, v in self.__dict__.items() if k[0] != "_"])
@@ -102,6 +181,7 @@ class Weather(Base):
     def __eq__(self, other: Self) -> bool:
         return (
             isinstance(other, Weather)
+            and other.location == self.location
             and other.target_date == self.target_date
             and other.record_type == self.record_type
         )
@@ -109,6 +189,7 @@ class Weather(Base):
     def to_dict(self) -> dict:
         return {
             "id": self.id,
+            "location": self.location,
             "target_date": self.target_date,
             "record_type": self.record_type,
             "is_perfect": self.is_perfect,
@@ -121,6 +202,8 @@ class Weather(Base):
             "maximum_wind_speed": self.maximum_wind_speed,
             "maximum_pollen_count": self.maximum_pollen_count,
             "registered_at": self.registered_at,
+            "criteria_version": self.criteria_version,
+            "is_stale": self.is_stale,
         }
 
     @classmethod
@@ -153,10 +236,213 @@ class Weather(Base):
                     maximum_wind_speed,
                     maximum_pollen_count,
                     registered_at,
+                    arg_dict.get("location", ""),
+                    arg_dict.get("criteria_version", ""),
+                    arg_dict.get("is_stale", False),
                 )
             case _:
                 raise ValueError("Weather create failed.")
 
+    @classmethod
+    def validate_many(cls, records: list[dict]) -> list[dict]:
+        """複数レコードの辞書を、列ごとにまとめて型チェックする
+
+        Notes:
+            create と同じく必須のキーが無い場合は ValueError、値の型が違う場合は TypeError とする
+            型チェックはレコードごとではなく、列ごとに値の型の集合を求めて一度に行う
+            （値の型の種類は高々数個のため、レコード数によらず isinstance の判定はほぼ列数回で済む）
+
+        Args:
+            records (list[dict]): create の arg_dict と同じキーを持つ辞書のリスト
+
+        Returns:
+            list[dict]: VALUE_TYPES の列のみを持つ辞書のリスト（省略された列は既定値とする）
+        """
+        column_values = []
+        for column, value_type in cls.VALUE_TYPES.items():
+            try:
+                if column in cls.OPTIONAL_VALUES:
+                    default = cls.OPTIONAL_VALUES[column]
+                    values = [r.get(column, default) for r in records]
+                else:
+                    values = [r[column] for r in records]
+            except KeyError:
+                raise ValueError("Weather create failed.")
+            if not all(issubclass(t, value_type) for t in set(map(type, values))):
+                raise TypeError(f"{column} must be {value_type.__name__}.")
+            column_values.append(values)
+
+        columns = list(cls.VALUE_TYPES)
+        return [dict(zip(columns, row)) for row in zip(*column_values)]
+
+
+class HourlyObservation(Base):
+    """1時間ごとの取得値モデル
+
+    [id] INTEGER NOT NULL UNIQUE,
+    [location] TEXT NOT NULL,
+    [target_date] TEXT NOT NULL,
+    [record_type] TEXT NOT NULL,
+    [variable] TEXT NOT NULL,
+    [hourly_values] BLOB NOT NULL,
+    [registered_at] TEXT NOT NULL,
+    PRIMARY KEY([id]),
+    UNIQUE([location], [target_date], [record_type], [variable])
+
+    Notes:
+        Weather の1レコードを集計した元の値を、変数ごとに1日分まとめて保持する
+        hourly_values は現地時刻の 0時台 ～ 23時台 の24個の値を float32 (リトルエンディアン) で詰めたもの
+        値が無い時間は NaN とする
+    """
+
+    __tablename__ = "HourlyObservation"
+    __table_args__ = (
+        Index("ux_hourly_observation_key", "location", "target_date", "record_type", "variable", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    location = Column(String(256), nullable=False, default="", server_default="")
+    target_date = Column(String(32), nullable=False)
+    record_type = Column(String(256), nullable=False)
+    variable = Column(String(256), nullable=False)
+    hourly_values = Column(LargeBinary(), nullable=False)
+    registered_at = Column(String(32))
+
+    def __init__(
+        self,
+        target_date: str,
+        record_type: str,
+        variable: str,
+        hourly_values: bytes,
+        registered_at: str,
+        location: str = "",
+    ) -> None:
+        if not isinstance(target_date, str):
+            raise TypeError("target_date must be str.")
+        if not isinstance(record_type, str):
+            raise TypeError("record_type must be str.")
+        if not isinstance(variable, str):
+            raise TypeError("variable must be str.")
+        if not isinstance(hourly_values, bytes):
+            raise TypeError("hourly_values must be bytes.")
+        if not isinstance(registered_at, str):
+            raise TypeError("registered_at must be str.")
+        if not isinstance(location, str):
+            raise TypeError("location must be str.")
+
+        self.location = location
+        self.target_date = target_date
+        self.record_type = record_type
+        self.variable = variable
+        self.hourly_values = hourly_values
+        self.registered_at = registered_at
+
+    def __repr__(self) -> str:
+        columns = ", ".join([f"{k}={v}" for k, v in self.__dict__.items() if k[0] != "_"])
+        return f"<{self.__class__.__name__}({columns})>"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "location": self.location,
+            "target_date": self.target_date,
+            "record_type": self.record_type,
+            "variable": self.variable,
+            "hourly_values": self.hourly_values,
+            "registered_at": self.registered_at,
+        }
+
+    @classmethod
+    def create(cls, arg_dict: dict) -> Self:
+        match arg_dict:
+            case {
+                "target_date": target_date,
+                "record_type": record_type,
+                "variable": variable,
+                "hourly_values": hourly_values,
+                "registered_at": registered_at,
+            }:
+                return cls(
+                    target_date, record_type, variable, hourly_values, registered_at, arg_dict.get("location", "")
+                )
+            case _:
+                raise ValueError("HourlyObservation create failed.")
+
+
+class WeatherMonthlyStats(Base):
+    """地点・月ごとの集計モデル
+
+    [location] TEXT NOT NULL,
+    [month] TEXT NOT NULL,
+    [actual_days] INTEGER NOT NULL,
+    [actual_perfect_days] INTEGER NOT NULL,
+    [forecast_days] INTEGER NOT NULL,
+    [forecast_perfect_days] INTEGER NOT NULL,
+    [forecast_tp] INTEGER NOT NULL,
+    [forecast_fp] INTEGER NOT NULL,
+    [forecast_fn] INTEGER NOT NULL,
+    [forecast_tn] INTEGER NOT NULL,
+    PRIMARY KEY([location], [month])
+
+    Notes:
+        Weather から集計した値を保持し、WeatherDBController.upsert_many で更新される
+        month は "%Y-%m" 形式
+        forecast_* は同じ日の予報値と実測値が両方ある日について、予報の is_perfect を実測の is_perfect と
+        比べた件数（tp: 予報 完璧/実測 完璧, fp: 予報 完璧/実測 否, fn: 予報 否/実測 完璧, tn: 予報 否/実測 否）
+    """
+
+    __tablename__ = "WeatherMonthlyStats"
+
+    location = Column(String(256), primary_key=True)
+    month = Column(String(32), primary_key=True)
+    actual_days = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    actual_perfect_days = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_days = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_perfect_days = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_tp = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_fp = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_fn = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    forecast_tn = Column(INTEGER(), nullable=False, default=0, server_default="0")
+
+    def __repr__(self) -> str:
+        columns = ", ".join([f"{k}={v}" for k, v in self.__dict__.items() if k[0] != "_"])
+        return f"<{self.__class__.__name__}({columns})>"
+
+    def to_dict(self) -> dict:
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class WeatherStreak(Base):
+    """地点ごとの "完璧な気候" の連続日数モデル
+
+    [location] TEXT NOT NULL,
+    [last_date] TEXT NOT NULL,
+    [current_streak] INTEGER NOT NULL,
+    [longest_streak] INTEGER NOT NULL,
+    [longest_streak_end_date] TEXT,
+    PRIMARY KEY([location])
+
+    Notes:
+        実測値のみを対象とし、日付が連続して is_perfect であった日数を数える（記録の無い日で途切れる）
+        last_date は記録済の最新の実測値の日付、current_streak は last_date で終わる連続日数
+        Weather から集計した値を保持し、WeatherDBController.upsert_many で更新される
+    """
+
+    __tablename__ = "WeatherStreak"
+
+    location = Column(String(256), primary_key=True)
+    last_date = Column(String(32), nullable=False)
+    current_streak = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    longest_streak = Column(INTEGER(), nullable=False, default=0, server_default="0")
+    longest_streak_end_date = Column(String(32))
+
+    def __repr__(self) -> str:
+        columns = ", ".join([f"{k}={v}" for k, v in self.__dict__.items() if k[0] != "_"])
+        return f"<{self.__class__.__name__}({columns})>"
+
+    def to_dict(self) -> dict:
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
 
 if __name__ == "__main__":
     engine = create_engine("sqlite:///PW_DB.db", echo=True)
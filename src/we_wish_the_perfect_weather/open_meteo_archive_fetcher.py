@@ -0,0 +1,82 @@
+from logging import INFO, getLogger
+from pathlib import Path
+
+import numpy as np
+
+from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class OpenMeteoArchiveFetcher(OpenMeteoFetcher):
+    """Open-Meteo の過去データ(archive)から、期間を指定して気象情報を取得する
+
+    Notes:
+        archive には precipitation_probability が無いため、
+        実測の降水量が0より大きい時間を100%、それ以外を0%として補う
+        archive の値は数日遅れで再解析値に置き換わるため、終了日から FINALIZE_DAYS 日経つまでは確定済として扱わない
+    """
+
+    API_OPEN_METEO = "https://archive-api.open-meteo.com/v1/archive"
+    HOURLY_VARIABLES = [
+        "temperature_2m",
+        "relative_humidity_2m",
+        "precipitation",
+        "wind_speed_10m",
+    ]
+    FINALIZE_DAYS = 7
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.start_date = ""
+        self.end_date = ""
+
+    def set_date_range(self, start_date: str, end_date: str) -> None:
+        """取得対象の期間を設定する
+
+        Args:
+            start_date (str): 開始日 "%Y-%m-%d"形式
+            end_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+        """
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def api_endpoint_url(self) -> str:
+        return self.config.get("open_meteo", {}).get("archive_url", OpenMeteoArchiveFetcher.API_OPEN_METEO)
+
+    def api_params(self, locations: list[dict] | None = None) -> dict:
+        if not (self.start_date and self.end_date):
+            raise ValueError("date range is not set.")
+        if locations is None:
+            locations = self.locations
+        params = {
+            "latitude": ",".join([str(float(location["latitude"])) for location in locations]),
+            "longitude": ",".join([str(float(location["longitude"])) for location in locations]),
+            "hourly": self.HOURLY_VARIABLES,
+            "timezone": ",".join([location["timezone"] for location in locations]),
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+        }
+        return params
+
+    def response_ttl(self, params: dict) -> int:
+        return self.cache_ttl(params["end_date"], OpenMeteoArchiveFetcher.FINALIZE_DAYS)
+
+    def parse_hourly(self, response) -> dict:
+        hourly_data = super().parse_hourly(response)
+        precipitation = hourly_data["precipitation"]
+        probability = np.where(precipitation > 0, 100, 0).astype(np.float32)
+        # 欠測(NaN)は欠測のまま残す
+        hourly_data["precipitation_probability"] = np.where(np.isnan(precipitation), np.nan, probability)
+        return hourly_data
+
+
+if __name__ == "__main__":
+    import orjson
+
+    config = orjson.loads(Path("./config/config.json").read_bytes())
+    fetcher = OpenMeteoArchiveFetcher(config)
+    fetcher.set_date_range("2025-05-01", "2025-05-07")
+    fetcher.fetch()
+    print(fetcher.daily_data)
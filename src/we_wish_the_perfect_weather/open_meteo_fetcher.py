@@ -1,126 +1,426 @@
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
 from logging import INFO, getLogger
 from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
+import numpy as np
 import openmeteo_requests
-import requests_cache
+import requests
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 from retry_requests import retry
 
-from we_wish_the_perfect_weather.fetcher_base import FetcherBase
-from we_wish_the_perfect_weather.util import datetime_to_date, get_now, get_tomorrow, get_yesterday, is_morning
-from we_wish_the_perfect_weather.util import to_builtin
+from we_wish_the_perfect_weather.circuit_breaker import CircuitOpenError
+from we_wish_the_perfect_weather.fetcher_base import FetcherBase, FetchResult
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.response_cache import ResponseCache
+from we_wish_the_perfect_weather.util import chunked, get_locations
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
 
+class PayloadResponse:
+    """openmeteo_requests.Client が参照する範囲のみを持つ HTTP レスポンス"""
+
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self) -> None:
+        return None
+
+
+class CachedPayloadSession:
+    """openmeteo_requests.Client に渡す HTTP セッション
+
+    Notes:
+        get は OpenMeteoFetcher.get_payload で地点ごとにキャッシュを引き、
+        キャッシュに無い地点のみ session でまとめて取得する
+    """
+
+    def __init__(self, fetcher: "OpenMeteoFetcher", session: requests.Session):
+        self.fetcher = fetcher
+        self.session = session
+
+    def get(self, url: str, params: dict, **kwargs) -> PayloadResponse:
+        return PayloadResponse(self.fetcher.get_payload(self.session, url, params, **kwargs))
+
+
 class OpenMeteoFetcher(FetcherBase):
     API_OPEN_METEO = "https://api.open-meteo.com/v1/forecast"
+    CHUNK_SIZE = 100  # 1リクエストあたりの地点数
+    LOCATION_PARAMS = ["latitude", "longitude", "timezone"]  # 地点ごとの値をカンマ区切りで指定するパラメータ
+    # aggregate_daily で計算する日ごとの集計値の列
+    DAILY_COLUMNS = [
+        "maximum_temperature",
+        "minimum_temperature",
+        "maximum_humidity",
+        "minimum_humidity",
+        "maximum_precipitation",
+        "maximum_precipitation_probability",
+        "maximum_wind_speed",
+    ]
+    HOURLY_VARIABLES = [
+        "temperature_2m",
+        "relative_humidity_2m",
+        "precipitation",
+        "precipitation_probability",
+        "wind_speed_10m",
+    ]
 
     def __init__(self, config: dict):
         super().__init__(config)
-        self.latitude = config["open_meteo"]["latitude"]
-        self.longitude = config["open_meteo"]["longitude"]
-        cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
-        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-        self.open_meteo = openmeteo_requests.Client(session=retry_session)
+        self.locations = get_locations(config)
+        self.chunk_size = int(config.get("open_meteo", {}).get("chunk_size", OpenMeteoFetcher.CHUNK_SIZE))
+        session = requests.Session()
+        session.hooks["response"].append(self.count_response)
+        retry_session = retry(session, retries=5, backoff_factor=0.2)
+        self.open_meteo = openmeteo_requests.Client(session=CachedPayloadSession(self, retry_session))
+
+    def count_response(self, response, *args, **kwargs) -> None:
+        """レスポンスごとに受信バイト数、リトライ回数を記録する（requests のフック）"""
+        name = type(self).__name__
+        instrumentation.add("http_requests", fetcher=name)
+        instrumentation.add("http_response_bytes", len(response.content), fetcher=name)
+        # urllib3 の Retry は実施したリトライを history に持つ
+        retries = getattr(getattr(response, "raw", None), "retries", None)
+        instrumentation.add("http_retries", len(getattr(retries, "history", ())), fetcher=name)
 
     def api_endpoint_url(self) -> str:
-        return OpenMeteoFetcher.API_OPEN_METEO
+        # 設定で上書きできるようにしておく（テスト用のスタブサーバを指す場合など）
+        return self.config.get("open_meteo", {}).get("url", OpenMeteoFetcher.API_OPEN_METEO)
 
-    def api_params(self) -> dict:
+    def api_params(self, locations: list[dict] | None = None) -> dict:
+        # 複数地点はカンマ区切りで指定する（レスポンスは地点ごとに1つ返ってくる）
+        if locations is None:
+            locations = self.locations
         params = {
-            "latitude": float(self.latitude),
-            "longitude": float(self.longitude),
-            "hourly": [
-                "temperature_2m",
-                "relative_humidity_2m",
-                "precipitation",
-                "precipitation_probability",
-                "wind_speed_10m",
-            ],
-            "timezone": "Asia/Tokyo",
+            "latitude": ",".join([str(float(location["latitude"])) for location in locations]),
+            "longitude": ",".join([str(float(location["longitude"])) for location in locations]),
+            "hourly": self.HOURLY_VARIABLES,
+            "timezone": ",".join([location["timezone"] for location in locations]),
             "past_days": 1,
             "forecast_days": 2,
         }
         return params
 
-    def fetch(self) -> dict:
+    def location_cache_keys(self, url: str, params: dict, now: datetime | None = None) -> list[str]:
+        """複数地点分のパラメータから、地点ごとのキャッシュのキーをリクエストした地点の順に返す
+
+        Notes:
+            format は Client が常に付加するため、キーには含めない
+            （fetch で api_params から代わりの値を引く場合と同じキーにする）
+            past_days, forecast_days は地点の現地の今日からの相対指定なので、解決した期間もキーに含める
+            （日付が変わった後に、前日に保存した別の期間のレスポンスを返さない）
+
+        Args:
+            url (str): エンドポイントのURL
+            params (dict): クエリパラメータ（LOCATION_PARAMS はカンマ区切りで複数地点を指定）
+            now (datetime | None): 期間を解決する基準の日時（タイムゾーン付き）、None なら現在日時
+
+        Returns:
+            list[str]: 地点ごとのキャッシュのキーのリスト
+        """
+        params = {k: v for k, v in params.items() if k != "format"}
+        n_locations = len(str(params["latitude"]).split(","))
+        split_params = {k: str(params[k]).split(",") for k in OpenMeteoFetcher.LOCATION_PARAMS if k in params}
+        key_list = []
+        for i in range(n_locations):
+            location_params = params | {k: v[i] for k, v in split_params.items()}
+            window = self.resolve_date_window(location_params, now)
+            key_list.append(ResponseCache.make_key(url, location_params | window))
+        return key_list
+
+    @staticmethod
+    def resolve_date_window(params: dict, now: datetime | None = None) -> dict:
+        """1地点分のパラメータの past_days, forecast_days を、現地の日付の期間に解決する
+
+        Notes:
+            Open-Meteo と同じく、timezone の指定が無ければ GMT、forecast_days の指定が無ければ 7日とする
+            現地の日付を解決できない timezone（"auto" 等）は、UTC の1時間ごとに異なる値を返す
+
+        Args:
+            params (dict): 1地点分のクエリパラメータ
+            now (datetime | None): 基準の日時（タイムゾーン付き）、None なら現在日時
+
+        Returns:
+            dict: キャッシュのキーに加えるパラメータ、相対指定が無ければ空辞書
+        """
+        if "past_days" not in params and "forecast_days" not in params:
+            return {}
+        now = now or datetime.now(UTC)
+        try:
+            today = now.astimezone(ZoneInfo(str(params.get("timezone", "GMT")))).date()
+        except (ZoneInfoNotFoundError, ValueError):
+            return {"resolved_at": now.astimezone(UTC).strftime("%Y-%m-%dT%H")}
+        start_date = today - timedelta(days=int(params.get("past_days", 0)))
+        end_date = today + timedelta(days=int(params.get("forecast_days", 7)) - 1)
+        return {"window_start_date": start_date.isoformat(), "window_end_date": end_date.isoformat()}
+
+    def get_payload(self, session: requests.Session, url: str, params: dict, **kwargs) -> bytes:
+        """地点ごとのキャッシュを通して、複数地点分のレスポンスボディを取得する
+
+        Notes:
+            レスポンスボディは地点ごとのメッセージ（4バイトのリトルエンディアンの長さ + FlatBuffers）を
+            リクエストした地点の順に連結したものなので、メッセージに分割して地点ごとのキーで保存する
+            キャッシュに無い（期限切れの）地点のみを1リクエストで取得し、保存済の地点と合わせて元の順に連結し直す
+            そのため、地点の組み合わせが変わっても取得済の地点はネットワークに接続しない
+            複数のメッセージを連結したボディに対する ETag は地点ごとの再検証には使えないため、保存しない
+            送信の可否と結果はエンドポイントごとのサーキットブレーカーに問い合わせ・記録する
+
+        Args:
+            session (requests.Session): 取得に使う HTTP セッション
+            url (str): エンドポイントのURL
+            params (dict): クエリパラメータ（LOCATION_PARAMS はカンマ区切りで複数地点を指定）
+            **kwargs: session.get に渡す引数
+
+        Returns:
+            bytes: リクエストした地点の順に連結したレスポンスボディ
+
+        Raises:
+            CircuitOpenError: キャッシュに無い地点があり、サーキットブレーカーが open の場合
+        """
+        key_list = self.location_cache_keys(url, params)
+        n_locations = len(key_list)
+        split_params = {k: str(params[k]).split(",") for k in OpenMeteoFetcher.LOCATION_PARAMS if k in params}
+        cached_dict = self.response_cache.get_many(key_list)
+        message_list = [
+            cached_dict[key].body if key in cached_dict and cached_dict[key].is_fresh() else None for key in key_list
+        ]
+        missing_index_list = [i for i, message in enumerate(message_list) if message is None]
+        n_hits = n_locations - len(missing_index_list)
+        if n_hits:
+            instrumentation.add("http_cache_hits", n_hits, fetcher=type(self).__name__)
+
+        if missing_index_list:
+            if not self.circuit_breaker.allow_request(url):
+                raise CircuitOpenError(url)
+            missing_params = params | {k: ",".join(v[i] for i in missing_index_list) for k, v in split_params.items()}
+            try:
+                response = session.get(url, params=missing_params, **kwargs)
+            except requests.RequestException:
+                # リトライし尽くしても応答が得られなかった場合
+                self.circuit_breaker.record_failure(url)
+                raise
+            if self.is_upstream_failure(response.status_code):
+                self.circuit_breaker.record_failure(url)
+            else:
+                self.circuit_breaker.record_success(url)
+            response.raise_for_status()
+            fetched_list = self.split_payload(response.content)
+            if len(fetched_list) != len(missing_index_list):
+                raise ValueError(f"{len(missing_index_list)} location(s) requested, {len(fetched_list)} returned.")
+            for i, message in zip(missing_index_list, fetched_list):
+                message_list[i] = message
+            self.response_cache.put_many(
+                [(key_list[i], url, message_list[i], "", "") for i in missing_index_list], self.response_ttl(params)
+            )
+        return b"".join(len(message).to_bytes(4, byteorder="little") + message for message in message_list)
+
+    def load_response(self, result: FetchResult, location: str, response: WeatherApiResponse) -> None:
+        """1地点分のレスポンスを解釈して、result に加える"""
+        hourly_data = self.parse_hourly(response)
+        result.fetched_data[location] = hourly_data
+        result.daily_data[location] = self.aggregate_daily(hourly_data)
+
+    def load_stale(self, result: FetchResult, url: str, params: dict, locations: list[dict], status: str) -> int:
+        """取得に失敗したチャンクの地点について、保存済のレスポンスを代わりに読み込む
+
+        Notes:
+            期限切れのものは保存してから max_stale_age 秒以内のもののみ使い、その地点の全日付を stale とする
+            有効期限内のものは通常の取得結果として扱う
+            使えるものが無い地点は、status を理由として result.failed に加える
+
+        Args:
+            result (FetchResult): 読み込み先の取得結果
+            url (str): エンドポイントのURL
+            params (dict): 失敗したリクエストのパラメータ（api_params の返り値）
+            locations (list[dict]): 失敗したチャンクの観測地点辞書のリスト
+            status (str): 失敗の種類
+
+        Returns:
+            int: 期限切れのレスポンスを読み込んだ地点数
+        """
+        key_list = self.location_cache_keys(url, params)
+        cached_dict = self.response_cache.get_many(key_list)
+        n_stale = 0
+        for location, key in zip(locations, key_list):
+            name = location["name"]
+            cached = cached_dict.get(key)
+            if cached is None or not (cached.is_fresh() or cached.is_usable_stale(self.max_stale_age)):
+                result.failed[name] = status
+                continue
+            self.load_response(result, name, WeatherApiResponse.GetRootAs(cached.body, 0))
+            if not cached.is_fresh():
+                result.stale_dates[name] = {str(d) for d in result.daily_data[name]["date_list"]}
+                n_stale += 1
+        return n_stale
+
+    @staticmethod
+    def split_payload(payload: bytes) -> list[bytes]:
+        """レスポンスボディを、長さのプレフィックスを除いた地点ごとのメッセージに分割する"""
+        message_list = []
+        offset = 0
+        while offset < len(payload):
+            length = int.from_bytes(payload[offset : offset + 4], byteorder="little")
+            message_list.append(payload[offset + 4 : offset + 4 + length])
+            offset += 4 + length
+        return message_list
+
+    def fetch_data(self, locations: list[dict] | None = None) -> FetchResult:
         logger.info("Fetching open_meteo -> start.")
+        if locations is None:
+            locations = self.locations
         url = self.api_endpoint_url()
-        params = self.api_params()
+        result = FetchResult({}, {}, {}, {})
 
-        responses = self.open_meteo.weather_api(url, params=params)
-        response = responses[0]
+        # 地点をチャンクに分割し、チャンクごとに1リクエストで取得する
+        for chunk in chunked(locations, self.chunk_size):
+            params = self.api_params(chunk)
+            try:
+                responses = self.open_meteo.weather_api(url, params=params)
+            except Exception as e:
+                # 上流の障害時は、保存済のレスポンスを期限切れでも代わりに使う（使えない地点は取得失敗のまま）
+                # Client は送信時の例外を OpenMeteoRequestsError で包むため、元の例外で分類する
+                cause = e.__cause__ or e
+                status = "circuit_open" if isinstance(cause, CircuitOpenError) else "error"
+                instrumentation.add("fetch_failures", len(chunk), fetcher=type(self).__name__, status=status)
+                n_stale = self.load_stale(result, url, params, chunk, status)
+                logger.warning(
+                    f"Fetching open_meteo failed, {status}: {type(cause).__name__}, "
+                    f"{n_stale}/{len(chunk)} location(s) from stale cache."
+                )
+                continue
+            # レスポンスは地点の順に返ってくる
+            # （キャッシュから組み立てたメッセージの LocationId は保存時のリクエスト内の位置のため使わない）
+            for location, response in zip(chunk, responses):
+                self.load_response(result, location["name"], response)
+            logger.info(f"Fetching open_meteo -> {len(chunk)} location(s) fetched.")
 
-        hourly = response.Hourly()
-        hourly_temperature_2m = to_builtin(hourly.Variables(0).ValuesAsNumpy())
-        hourly_relative_humidity_2m = to_builtin(hourly.Variables(1).ValuesAsNumpy())
-        hourly_precipitation = to_builtin(hourly.Variables(2).ValuesAsNumpy())
-        hourly_precipitation_probability = to_builtin(hourly.Variables(3).ValuesAsNumpy())
-        hourly_wind_speed_10m = to_builtin(hourly.Variables(4).ValuesAsNumpy())
-        start = hourly.Time()
-        end = hourly.TimeEnd()
-        freq = hourly.Interval()
-        hourly_unixtime = list(range(start, end, freq))
-        hourly_date_time = [datetime.fromtimestamp(x).strftime("%Y-%m-%d %H:%M:%S") for x in hourly_unixtime]
-
-        hourly_data = {"date_list": hourly_date_time}
-        hourly_data["temperature_2m"] = hourly_temperature_2m
-        hourly_data["relative_humidity_2m"] = hourly_relative_humidity_2m
-        hourly_data["precipitation"] = hourly_precipitation
-        hourly_data["precipitation_probability"] = hourly_precipitation_probability
-        hourly_data["wind_speed_10m"] = hourly_wind_speed_10m
-        # print(hourly_data)
-        self.fetched_data = hourly_data
         logger.info("Fetching open_meteo -> done.")
-        return self.fetched_data
+        return result
 
-    def get_slice(self, target_date: str) -> tuple[int, int]:
-        target_date_at_list = [
-            get_yesterday(),
-            get_now(),
-            get_tomorrow(),
-        ]
-        target_date_list = [datetime_to_date(t) for t in target_date_at_list]
-        if is_morning():
-            if target_date == target_date_list[0]:
-                return (0, 24)  # 昨日の値が含まれるスライス範囲
-            elif target_date == target_date_list[1]:
-                return (24, 48)  # 今日の値が含まれるスライス範囲
-            else:
-                return (-1, -1)
-        else:
-            if target_date == target_date_list[1]:
-                return (24, 48)  # 今日の値が含まれるスライス範囲
-            elif target_date == target_date_list[2]:
-                return (48, 72)  # 明日の値が含まれるスライス範囲
-            else:
-                return (-1, -1)
+    def parse_hourly(self, response) -> dict:
+        """レスポンスから1時間ごとの気象情報を取り出す
+
+        Notes:
+            各系列は FlatBuffers のバッファを参照する float32 の ndarray のまま保持する
+            時刻は現地時刻の datetime64[s] とする
+
+        Args:
+            response (WeatherApiResponse): 1地点分のレスポンス
+
+        Returns:
+            dict: "time_list" と HOURLY_VARIABLES の各系列をキーに持つ辞書
+        """
+        hourly = response.Hourly()
+        utc_offset = response.UtcOffsetSeconds()
+        unixtime = np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype=np.int64)
+
+        hourly_data = {"time_list": (unixtime + utc_offset).astype("datetime64[s]")}
+        for i, variable in enumerate(self.HOURLY_VARIABLES):
+            hourly_data[variable] = hourly.Variables(i).ValuesAsNumpy()
+        return hourly_data
+
+    def aggregate_daily(self, hourly_data: dict) -> dict:
+        """1時間ごとの気象情報から、日ごとの最大/最小を計算する
+
+        Notes:
+            全系列を (変数, 日数, 24) の配列にまとめ、全日・全変数の最大/最小を一度に計算する
+            1日分に満たない末尾のデータは捨てる
 
-    def interpret(self, target_date: str, record_type: str) -> dict:
-        n, m = self.get_slice(target_date)
-        if n == -1 or m == -1:
+        Args:
+            hourly_data (dict): parse_hourly の返り値
+
+        Returns:
+            dict: "date_list" (datetime64[D]) と各集計値の ndarray をキーに持つ辞書
+        """
+        time_list = hourly_data["time_list"]
+        n_days = len(time_list) // 24
+        n = n_days * 24
+
+        values = np.stack([hourly_data[variable][:n] for variable in OpenMeteoFetcher.HOURLY_VARIABLES])
+        values = values.reshape(len(OpenMeteoFetcher.HOURLY_VARIABLES), n_days, 24)
+        maximum = values.max(axis=2)
+        minimum = values.min(axis=2)
+
+        return {
+            "date_list": time_list[:n:24].astype("datetime64[D]"),
+            "maximum_temperature": maximum[0],
+            "minimum_temperature": minimum[0],
+            "maximum_humidity": maximum[1],
+            "minimum_humidity": minimum[1],
+            "maximum_precipitation": maximum[2],
+            "maximum_precipitation_probability": maximum[3],
+            "maximum_wind_speed": maximum[4] / 3.6,  # [km/h]から[m/s]に変換
+        }
+
+    def dump_hourly(self, target_date: str, location: str = "") -> dict[str, np.ndarray]:
+        if location not in self.fetched_data:
             return {}
+        hourly_data = self.fetched_data[location]
+        hour_list = (hourly_data["time_list"] - np.datetime64(target_date, "s")) // np.timedelta64(1, "h")
+        mask = (hour_list >= 0) & (hour_list < 24)
+        if not mask.any():
+            return {}
+
+        result = {}
+        for variable in OpenMeteoFetcher.HOURLY_VARIABLES:
+            values = np.full(24, np.nan, dtype=np.float32)
+            values[hour_list[mask]] = hourly_data[variable][mask]
+            result[variable] = values
+        return result
 
-        maximum_temperature = max(self.fetched_data["temperature_2m"][n:m])
-        minimum_temperature = min(self.fetched_data["temperature_2m"][n:m])
-        maximum_humidity = int(max(self.fetched_data["relative_humidity_2m"][n:m]))
-        minimum_humidity = int(min(self.fetched_data["relative_humidity_2m"][n:m]))
-        maximum_precipitation_probability = int(max(self.fetched_data["precipitation_probability"][n:m]))
-        maximum_precipitation = max(self.fetched_data["precipitation"][n:m])
-        maximum_wind_speed = max(self.fetched_data["wind_speed_10m"][n:m]) / 3.6  # [km/h]から[m/s]に変換
+    def load_hourly(self, target_date: str, location: str, hourly_values: dict[str, np.ndarray]) -> None:
+        self.discard(location)
+        if not all(len(hourly_values.get(v, [])) == 24 for v in OpenMeteoFetcher.HOURLY_VARIABLES):
+            return
 
+        hourly_data = {"time_list": np.datetime64(target_date, "s") + np.arange(24) * np.timedelta64(1, "h")}
+        for variable in OpenMeteoFetcher.HOURLY_VARIABLES:
+            hourly_data[variable] = np.asarray(hourly_values[variable], dtype=np.float32)
+        self.fetched_data[location] = hourly_data
+        self.daily_data[location] = self.aggregate_daily(hourly_data)
+
+    def get_index(self, target_date: str, location: str = "") -> int:
+        """日ごとの集計値から target_date に対応するインデックスを返す
+
+        Args:
+            target_date (str): 対象日付 "%Y-%m-%d"形式
+            location (str): 観測地点名
+
+        Returns:
+            int: インデックス、対象が存在しない場合は -1
+        """
+        if location not in self.daily_data:
+            return -1
+        date_list = self.daily_data[location]["date_list"]
+        index = int(np.searchsorted(date_list, np.datetime64(target_date, "D")))
+        if index >= len(date_list) or date_list[index] != np.datetime64(target_date, "D"):
+            return -1
+        return index
+
+    def interpret(self, target_date: str, record_type: str, location: str = "") -> dict:
+        i = self.get_index(target_date, location)
+        if i == -1:
+            return {}
+
+        daily_data = self.daily_data[location]
+        # 欠測(NaN)を含む日は情報が無いものとする（呼び出し側でレコードを登録せず、次回の実行で取得し直す）
+        if any(np.isnan(daily_data[column][i]) for column in OpenMeteoFetcher.DAILY_COLUMNS):
+            return {}
         return {
+            "location": location,
             "target_date": target_date,
             "record_type": record_type,
-            "maximum_temperature": maximum_temperature,
-            "minimum_temperature": minimum_temperature,
-            "maximum_humidity": maximum_humidity,
-            "minimum_humidity": minimum_humidity,
-            "maximum_precipitation_probability": maximum_precipitation_probability,
-            "maximum_precipitation": maximum_precipitation,
-            "maximum_wind_speed": maximum_wind_speed,
+            "maximum_temperature": float(daily_data["maximum_temperature"][i]),
+            "minimum_temperature": float(daily_data["minimum_temperature"][i]),
+            "maximum_humidity": int(daily_data["maximum_humidity"][i]),
+            "minimum_humidity": int(daily_data["minimum_humidity"][i]),
+            "maximum_precipitation_probability": int(daily_data["maximum_precipitation_probability"][i]),
+            "maximum_precipitation": float(daily_data["maximum_precipitation"][i]),
+            "maximum_wind_speed": float(daily_data["maximum_wind_speed"][i]),
         }
 
 
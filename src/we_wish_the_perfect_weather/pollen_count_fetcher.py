@@ -1,120 +1,444 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
 from logging import INFO, getLogger
 from pathlib import Path
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import httpx
-from httpx_retries import RetryTransport
+import numpy as np
+from httpx_retries import Retry, RetryTransport
 
-from we_wish_the_perfect_weather.fetcher_base import FetcherBase
-from we_wish_the_perfect_weather.util import datetime_to_date, datetime_to_yyyymmdd, get_now, get_tomorrow
-from we_wish_the_perfect_weather.util import get_yesterday, is_morning
+from we_wish_the_perfect_weather.circuit_breaker import CLOSED, CircuitOpenError
+from we_wish_the_perfect_weather.criteria import MISSING_VALUE
+from we_wish_the_perfect_weather.fetcher_base import FetcherBase, FetchResult
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.response_cache import CachedResponse, ResponseCache
+from we_wish_the_perfect_weather.util import datetime_to_yyyymmdd, get_locations, get_now, get_yesterday
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
 
+class CountingTransport(httpx.AsyncBaseTransport):
+    """内側の transport への送信回数を数える
+
+    Notes:
+        RetryTransport の外側に置くとリクエスト数を、内側に置くとリトライを含めた送信回数を数える
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+        self.count = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.count += 1
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class CityFetchResult(NamedTuple):
+    """1つの市区町村コードの取得結果
+
+    Notes:
+        status は "ok", "stale"（一部または全部を期限切れのキャッシュで補った）か、
+        代わりも無かった失敗の種類 "timeout", "http_error", "network_error", "circuit_open", "invalid"
+    """
+
+    citycode: str
+    status: str
+    hourly_data: dict | None  # parse_csv の返り値、1つも取得できなかった場合は None
+    error: str  # 失敗した場合の理由
+    stale_dates: frozenset[str] = frozenset()  # 期限切れのキャッシュで補った日付 "%Y-%m-%d"
+
+
 class PollenCountFetcher(FetcherBase):
     API_POLLEN_COUNT = "https://wxtech.weathernews.com/opendata/v1/pollen"
+    CONCURRENCY = 16  # 同時に送信するリクエスト数の上限
+    TIMEOUT = 10  # 1リクエストあたりの期限[s]
+    RETRIES = 3  # 1リクエストあたりのリトライ回数の上限
+    BACKOFF_FACTOR = 0.5  # リトライの待ち時間の基準[s]（回数ごとに倍、各待ち時間は 0～その値 のランダム）
+    TIMEZONE = "Asia/Tokyo"  # 地点の timezone を解決できない場合に使うタイムゾーン（APIの時刻は日本時間）
 
     def __init__(self, config: dict):
         super().__init__(config)
-        self.citycode = config["pollen_count"]["citycode"]
+        self.locations = get_locations(config)
+        pollen_config = config.get("pollen_count", {})
+        self.concurrency = int(pollen_config.get("concurrency", PollenCountFetcher.CONCURRENCY))
+        self.timeout = float(pollen_config.get("timeout", PollenCountFetcher.TIMEOUT))
+        self.retries = int(pollen_config.get("retries", PollenCountFetcher.RETRIES))
+        self.backoff_factor = float(pollen_config.get("backoff_factor", PollenCountFetcher.BACKOFF_FACTOR))
 
     def api_endpoint_url(self) -> str:
-        return PollenCountFetcher.API_POLLEN_COUNT
+        # OpenMeteoFetcher と同じく、設定で上書きできるようにしておく（スタブサーバを指す場合など）
+        return self.config.get("pollen_count", {}).get("url", PollenCountFetcher.API_POLLEN_COUNT)
 
-    def api_params(self) -> dict:
-        # 昨日と今日の分のみリクエスト
+    def api_params(self, citycode: str = "", start_at: str = "", end_at: str = "") -> dict:
+        # 既定では昨日と今日の分のみリクエスト
         return {
-            "citycode": self.citycode,
-            "start": datetime_to_yyyymmdd(get_yesterday()),
-            "end": datetime_to_yyyymmdd(get_now()),
+            "citycode": citycode,
+            "start": datetime_to_yyyymmdd(start_at or get_yesterday()),
+            "end": datetime_to_yyyymmdd(end_at or get_now()),
         }
 
-    def fetch(self) -> dict:
+    def api_params_list(self, citycode: str, timezone: str = TIMEZONE, now: datetime | None = None) -> list[dict]:
+        """1地点分のリクエストのパラメータのリストを返す
+
+        Notes:
+            確定済の昨日の分と、まだ変わりうる今日の分を別のリクエストに分け、
+            昨日の分は response_ttl で長い有効期間のキャッシュを使い回せるようにする
+            昨日・今日は地点の timezone の現地の日付とする（実行環境のタイムゾーンによらない）
+
+        Args:
+            citycode (str): 市区町村コード
+            timezone (str): 地点のタイムゾーン
+            now (datetime | None): 基準の日時（タイムゾーン付き）、None なら現在日時
+
+        Returns:
+            list[dict]: [昨日の分, 今日の分] のクエリパラメータ
+        """
+        local_now = self.get_local_now(timezone, now)
+        today = local_now.strftime("%Y-%m-%d %H:%M:%S")
+        yesterday = (local_now - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+        return [self.api_params(citycode, yesterday, yesterday), self.api_params(citycode, today, today)]
+
+    def response_ttl(self, params: dict, timezone: str = TIMEZONE) -> int:
+        end = params["end"]
+        today = self.get_local_now(timezone).date().isoformat()
+        return self.cache_ttl(f"{end[:4]}-{end[4:6]}-{end[6:]}", today=today)
+
+    @staticmethod
+    def get_local_now(timezone: str, now: datetime | None = None) -> datetime:
+        """地点の timezone の現地の日時を返す（解決できない timezone は PollenCountFetcher.TIMEZONE とする）"""
+        now = now or datetime.now(UTC)
+        try:
+            return now.astimezone(ZoneInfo(timezone))
+        except (ZoneInfoNotFoundError, ValueError):
+            return now.astimezone(ZoneInfo(PollenCountFetcher.TIMEZONE))
+
+    def fetch_data(self, locations: list[dict] | None = None) -> FetchResult:
         logger.info("Fetching pollen_count -> start.")
+        if locations is None:
+            locations = self.locations
+
         # 花粉飛散数APIを使用
-        # 1時間ごとに記録されたcsvカンマ区切り文字列が返ってくる
-        try:
-            with httpx.Client(transport=RetryTransport()) as client:
-                response = client.get(self.api_endpoint_url(), params=self.api_params())
-                response.raise_for_status()
-
-                self.fetched_csv = response.text
-        except Exception:
-            logger.info("Fetching pollen_count failed.")
-            self.fetched_csv = ""
-
-        self.fetched_data = self.fetched_csv
-
-        logger.info("Fetching pollen_count -> done.")
-        return self.fetched_data
-
-    def get_slice(self, target_date: str) -> tuple[int, int]:
-        target_date_at_list = [
-            get_yesterday(),
-            get_now(),
-            get_tomorrow(),
-        ]
-        target_date_list = [datetime_to_date(t) for t in target_date_at_list]
-        if is_morning():
-            if target_date == target_date_list[0]:
-                return (0, 24)  # 昨日の値が含まれるスライス範囲
-            elif target_date == target_date_list[1]:
-                return (24, 48)  # 今日の値が含まれるスライス範囲
-            else:
-                return (-1, -1)
-        else:
-            if target_date == target_date_list[1]:
-                return (24, 48)  # 今日の値が含まれるスライス範囲
-            elif target_date == target_date_list[2]:
-                return (48, 72)  # 明日の値が含まれるスライス範囲
-            else:
-                return (-1, -1)
+        # 1時間ごとに記録されたcsvカンマ区切り文字列が返ってくるので、ここで一度だけ解釈しておく
+        # 同じ市区町村コードの地点は1回だけ取得する、citycode 未設定の地点は取得しない
+        # 取得する日付は、市区町村コードごとに最初の地点の timezone で決める
+        citycode_dict: dict[str, str] = {}
+        for location in locations:
+            if location["citycode"]:
+                citycode_dict.setdefault(location["citycode"], location["timezone"])
+        city_results = self.fetch_cities(citycode_dict)
+        citycode_list = list(citycode_dict)
+        result = FetchResult({}, {}, {}, {})
+        for location in locations:
+            name, citycode = location["name"], location["citycode"]
+            city_result = city_results.get(citycode)
+            if city_result is None:
+                continue
+            # 1つも取得できなかった地点は fetched_data に含めない
+            if city_result.hourly_data is None:
+                result.failed[name] = city_result.status
+                continue
+            result.fetched_data[name] = city_result.hourly_data
+            result.daily_data[name] = self.aggregate_daily(city_result.hourly_data)
+            if city_result.stale_dates:
+                result.stale_dates[name] = set(city_result.stale_dates)
 
-    def interpret(self, target_date: str, record_type: str) -> dict:
-        error_value_default = {
-            "target_date": target_date,
-            "record_type": record_type,
-            "maximum_pollen_count": -9999,
+        n_ok = sum(city_result.status == "ok" for city_result in city_results.values())
+        n_stale = sum(city_result.status == "stale" for city_result in city_results.values())
+        logger.info(
+            f"Fetching pollen_count -> done ({n_ok}/{len(citycode_list)} city, {n_stale} city from stale cache)."
+        )
+        return result
+
+    def fetch_cities(self, citycode_dict: dict[str, str]) -> dict[str, CityFetchResult]:
+        """複数の市区町村コードの花粉飛散数を並行に取得する
+
+        Notes:
+            1つの AsyncClient の接続を使い回し、同時に送信するリクエスト数は concurrency までとする
+            各リクエストは timeout 秒で打ち切り、タイムアウト・接続エラー・429/5xx は retries 回まで、
+            ランダムに揺らした指数的な待ち時間を挟んでリトライする
+            サーキットブレーカーが closed で無い場合は、試行の1件を先に取得してから残りを取得する
+            （上流が復旧していれば残りも取得し、そうでなければ残りはリクエストを送信せずに失敗とする）
+            失敗した市区町村コードも、失敗の種類と理由を持つ結果として返す（例外は送出しない）
+
+        Args:
+            citycode_dict (dict[str, str]): 市区町村コードをキー、取得する日付を決めるタイムゾーンを値に持つ辞書
+
+        Returns:
+            dict[str, CityFetchResult]: 市区町村コードをキー、取得結果を値に持つ辞書
+        """
+        return asyncio.run(self.fetch_cities_async(citycode_dict))
+
+    async def fetch_cities_async(self, citycode_dict: dict[str, str]) -> dict[str, CityFetchResult]:
+        """fetch_cities の本体"""
+        url = self.api_endpoint_url()
+        params_dict = {
+            citycode: self.api_params_list(citycode, timezone) for citycode, timezone in citycode_dict.items()
         }
-        if self.fetched_csv == "":
-            # fetchが失敗している場合
-            return error_value_default
+        # キャッシュは最初にまとめて引く
+        cached_dict = self.response_cache.get_many([
+            ResponseCache.make_key(url, params) for params_list in params_dict.values() for params in params_list
+        ])
 
-        n, m = self.get_slice(target_date)
-        if n == -1 or m == -1:
-            # target_date が想定外の範囲
-            return error_value_default
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        attempt_transport = CountingTransport(httpx.AsyncHTTPTransport(limits=limits))
+        retry = Retry(total=self.retries, backoff_factor=self.backoff_factor, backoff_jitter=1.0)
+        request_transport = CountingTransport(RetryTransport(transport=attempt_transport, retry=retry))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(transport=request_transport, timeout=self.timeout) as client:
+            coroutine_list = [
+                self.fetch_city(client, semaphore, url, citycode, citycode_dict[citycode], params_list, cached_dict)
+                for citycode, params_list in params_dict.items()
+            ]
+            result_list = []
+            if coroutine_list and self.circuit_breaker.state(url) != CLOSED:
+                result_list.append(await coroutine_list.pop(0))
+            result_list.extend(await asyncio.gather(*coroutine_list))
 
-        if n == 48 and m == 72:
-            # 明日の値を参照された場合、確定で値が存在しないので決め打ち
-            return error_value_default
+        fetcher_name = type(self).__name__
+        instrumentation.add("http_requests", request_transport.count, fetcher=fetcher_name)
+        instrumentation.add("http_retries", attempt_transport.count - request_transport.count, fetcher=fetcher_name)
+        for result in result_list:
+            if result.status != "ok":
+                instrumentation.add("fetch_failures", fetcher=fetcher_name, status=result.status)
+                logger.info(
+                    f"Fetching pollen_count failed, citycode={result.citycode}, {result.status}: {result.error}."
+                )
+        return {result.citycode: result for result in result_list}
+
+    async def fetch_city(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        url: str,
+        citycode: str,
+        timezone: str,
+        params_list: list[dict],
+        cached_dict: dict[str, CachedResponse],
+    ) -> CityFetchResult:
+        """1つの市区町村コードについて、api_params_list のリクエストをキャッシュを通して取得し、解釈する
 
-        def is_numeric(s: str) -> bool:
+        Notes:
+            失敗したリクエストは、保存してから max_stale_age 秒以内のレスポンスがあれば期限切れでも代わりに使い、
+            その日付を stale とする
+            代わりも無いリクエストがあった場合はその失敗を結果とする（取得できた日付の値は hourly_data に含める）
+        """
+        csv_list = []
+        stale_date_set = set()
+        status, error = "ok", ""
+        for params in params_list:
+            key = ResponseCache.make_key(url, params)
+            ttl = self.response_ttl(params, timezone)
+            cached = cached_dict.get(key)
             try:
-                float(s)
-            except ValueError:
-                return False
+                body = await self.fetch_response(client, semaphore, url, key, ttl, params, cached)
+                fetched_csv = body.decode("utf-8")
+            except (httpx.HTTPError, CircuitOpenError, UnicodeDecodeError) as e:
+                fetched_csv = self.decode_stale(cached)
+                if fetched_csv is None:
+                    if status in ["ok", "stale"]:
+                        status, error = self.classify_failure(e)
+                    continue
+                if status == "ok":
+                    status, error = "stale", f"{type(e).__name__}: {e}"
+                end = params["end"]
+                stale_date_set.add(f"{end[:4]}-{end[4:6]}-{end[6:]}")
             else:
-                return True
+                if ttl == self.ttl_finalized and len(self.parse_csv(fetched_csv)["time_list"]) < 24:
+                    # 確定済のはずの日の値が揃っていない場合は、次回取得し直す
+                    self.response_cache.delete(key)
+            csv_list.append(fetched_csv)
+
+        hourly_data = self.parse_csv("\n".join(csv_list))
+        if len(hourly_data["time_list"]) == 0:
+            if status in ["ok", "stale"]:
+                status, error = "invalid", "no pollen count in response"
+            return CityFetchResult(citycode, status, None, error)
+        return CityFetchResult(citycode, status, hourly_data, error, frozenset(stale_date_set))
 
-        # fetchしたcsvを分解
-        pollen_count_list: list[int] = []
-        lines = self.fetched_csv.split("\n")
-        for line in lines:
+    async def fetch_response(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        url: str,
+        key: str,
+        ttl: int,
+        params: dict,
+        cached: CachedResponse | None,
+    ) -> bytes:
+        """1リクエスト分のレスポンスのボディを、キャッシュとサーキットブレーカーを通して取得する
+
+        Raises:
+            CircuitOpenError: サーキットブレーカーが open の場合
+            httpx.HTTPError: リトライしても取得できなかった場合
+        """
+        fetcher_name = type(self).__name__
+        if cached is not None and cached.is_fresh():
+            instrumentation.add("http_cache_hits", fetcher=fetcher_name)
+            return cached.body
+        async with semaphore:
+            # 送信待ちの間に open になった場合は送信しない
+            if not self.circuit_breaker.allow_request(url):
+                raise CircuitOpenError(url)
+            try:
+                response = await client.get(url, params=params, headers=self.revalidation_headers(cached))
+            except httpx.TransportError:
+                # タイムアウト・接続エラー（リトライし尽くした場合）
+                self.circuit_breaker.record_failure(url)
+                raise
+        if self.is_upstream_failure(response.status_code):
+            self.circuit_breaker.record_failure(url)
+        else:
+            self.circuit_breaker.record_success(url)
+        instrumentation.add("http_response_bytes", len(response.content), fetcher=fetcher_name)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return self.store_response(key, url, ttl, cached, response.status_code, response.content, response.headers)
+
+    def decode_stale(self, cached: CachedResponse | None) -> str | None:
+        """取得に失敗したリクエストの代わりに使える保存済のレスポンスを返す、無ければ None"""
+        if cached is None or not cached.is_usable_stale(self.max_stale_age):
+            return None
+        try:
+            return cached.body.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+
+    @staticmethod
+    def classify_failure(e: Exception) -> tuple[str, str]:
+        """取得の失敗を (CityFetchResult の status, 理由) に分類する"""
+        if isinstance(e, CircuitOpenError):
+            return "circuit_open", str(e)
+        if isinstance(e, httpx.TimeoutException):
+            return "timeout", f"{type(e).__name__}: {e}"
+        if isinstance(e, httpx.HTTPStatusError):
+            return "http_error", f"HTTP {e.response.status_code}"
+        if isinstance(e, httpx.HTTPError):
+            return "network_error", f"{type(e).__name__}: {e}"
+        return "invalid", f"{type(e).__name__}: {e}"
+
+    def parse_csv(self, fetched_csv: str) -> dict:
+        """花粉飛散数APIのcsvを、時刻順に並んだ配列に変換する
+
+        Notes:
+            csvは "citycode,date,pollen" の形式で、date は "%Y-%m-%dT%H:%M:%S+09:00" 形式の現地時刻
+            数値として解釈できない行（ヘッダ等）は読み飛ばす
+
+        Args:
+            fetched_csv (str): 花粉飛散数APIのレスポンス
+
+        Returns:
+            dict: "time_list" (datetime64[s]) と "pollen_count" (int64) をキーに持つ辞書
+        """
+        time_list, pollen_count_list = [], []
+        for line in fetched_csv.splitlines():
             token = line.split(",")
-            pollen = token[-1]
-            if not is_numeric(pollen):
+            if len(token) < 3:
                 continue
-            pollen_count_list.append(int(pollen))
+            try:
+                pollen_count = int(float(token[-1]))
+                time_at = np.datetime64(token[1][:19], "s")
+            except ValueError:
+                continue
+            time_list.append(time_at)
+            pollen_count_list.append(pollen_count)
+
+        time_array = np.array(time_list, dtype="datetime64[s]")
+        pollen_count_array = np.array(pollen_count_list, dtype=np.int64)
+        order = np.argsort(time_array, kind="stable")
+        return {
+            "time_list": time_array[order],
+            "pollen_count": pollen_count_array[order],
+        }
+
+    def aggregate_daily(self, hourly_data: dict) -> dict:
+        """1時間ごとの花粉飛散数から、日ごとの最大値を計算する
+
+        Notes:
+            各時刻はその時刻までの1時間の値を表す（01:00 ～ 翌00:00 が1日分）ため、
+            1時間前にずらしてから日付ごとにまとめる
+
+        Args:
+            hourly_data (dict): parse_csv の返り値
 
-        # 花粉飛散量のmaxをとる
-        pollen_count = max(pollen_count_list[n:m])
+        Returns:
+            dict: "date_list" (datetime64[D]) と "maximum_pollen_count" (int64) をキーに持つ辞書
+        """
+        time_list = hourly_data["time_list"]
+        if len(time_list) == 0:
+            return {
+                "date_list": np.array([], dtype="datetime64[D]"),
+                "maximum_pollen_count": np.array([], dtype=np.int64),
+            }
+
+        date_list = (time_list - np.timedelta64(1, "h")).astype("datetime64[D]")
+        date_list, start_index = np.unique(date_list, return_index=True)
+        return {
+            "date_list": date_list,
+            "maximum_pollen_count": np.maximum.reduceat(hourly_data["pollen_count"], start_index),
+        }
+
+    def dump_hourly(self, target_date: str, location: str = "") -> dict[str, np.ndarray]:
+        if location not in self.fetched_data:
+            return {}
+        hourly_data = self.fetched_data[location]
+        # aggregate_daily と同じく、各時刻の値はその1時間前からの時間帯の値とする
+        start_at = np.datetime64(target_date, "s") + np.timedelta64(1, "h")
+        hour_list = (hourly_data["time_list"] - start_at) // np.timedelta64(1, "h")
+        mask = (hour_list >= 0) & (hour_list < 24)
+        if not mask.any():
+            return {}
+
+        values = np.full(24, np.nan, dtype=np.float32)
+        values[hour_list[mask]] = hourly_data["pollen_count"][mask]
+        return {"pollen_count": values}
+
+    def load_hourly(self, target_date: str, location: str, hourly_values: dict[str, np.ndarray]) -> None:
+        self.discard(location)
+        values = np.asarray(hourly_values.get("pollen_count", []), dtype=np.float32)
+        if len(values) != 24 or np.isnan(values).all():
+            return
+
+        valid = ~np.isnan(values)
+        start_at = np.datetime64(target_date, "s") + np.timedelta64(1, "h")
+        hourly_data = {
+            "time_list": start_at + np.flatnonzero(valid) * np.timedelta64(1, "h"),
+            "pollen_count": values[valid].astype(np.int64),
+        }
+        self.fetched_data[location] = hourly_data
+        self.daily_data[location] = self.aggregate_daily(hourly_data)
+
+    def fallback(self, target_date: str, record_type: str, location: str = "") -> dict:
+        return {
+            "location": location,
+            "target_date": target_date,
+            "record_type": record_type,
+            "maximum_pollen_count": MISSING_VALUE,
+        }
+
+    def interpret(self, target_date: str, record_type: str, location: str = "") -> dict:
+        error_value_default = self.fallback(target_date, record_type, location)
+        if location not in self.daily_data:
+            # fetchが失敗している場合
+            return error_value_default
+
+        date_list = self.daily_data[location]["date_list"]
+        target = np.datetime64(target_date, "D")
+        i = int(np.searchsorted(date_list, target))
+        if i >= len(date_list) or date_list[i] != target:
+            # target_date の値が存在しない場合（明日の値を参照された場合など）
+            return error_value_default
 
         return {
+            "location": location,
             "target_date": target_date,
             "record_type": record_type,
-            "maximum_pollen_count": pollen_count,
+            "maximum_pollen_count": int(self.daily_data[location]["maximum_pollen_count"][i]),
         }
 
 
@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+from typing import IO
+
+# fcntl が無い環境(Windows)では msvcrt を使う
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class ProcessLock:
+    """OSのファイルロックを使って多重起動を防ぐ
+
+    Notes:
+        ロックはプロセスが終了すればOSによって解放されるため、
+        異常終了してもロックファイルが残って次回以降の実行が止まることは無い
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.file: IO | None = None
+
+    def acquire(self) -> bool:
+        """ロックを取得する（待たない）
+
+        Returns:
+            bool: 取得できた場合True、他のプロセスが取得済の場合False
+        """
+        if self.file is not None:
+            return True
+
+        file = self.path.open("a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.close()
+            return False
+
+        # 確認用にロックを保持しているプロセスIDを書いておく
+        file.seek(0)
+        file.truncate()
+        file.write(f"{os.getpid()}\n")
+        file.flush()
+        self.file = file
+        return True
+
+    def release(self) -> None:
+        """ロックを解放する"""
+        if self.file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+if __name__ == "__main__":
+    lock = ProcessLock("./prevent_multiple_run")
+    print(lock.acquire())
+    print(ProcessLock("./prevent_multiple_run").acquire())
+    lock.release()
@@ -0,0 +1,213 @@
+import hashlib
+import sqlite3
+import time
+from contextlib import closing
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import NamedTuple
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class CachedResponse(NamedTuple):
+    """キャッシュに保存した1件分のレスポンス"""
+
+    body: bytes
+    etag: str
+    last_modified: str
+    expires_at: float
+    stored_at: float = 0.0
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        """有効期限内かどうかを返す（期限切れでも ETag/Last-Modified があれば再検証に使える）"""
+        return self.expires_at > (time.time() if now is None else now)
+
+    def is_usable_stale(self, max_age: float, now: float | None = None) -> bool:
+        """取得に失敗した場合の代わりに使えるか（保存してから max_age 秒以内か）を返す"""
+        return self.stored_at >= (time.time() if now is None else now) - max_age
+
+
+class ResponseCache:
+    """HTTP レスポンスのボディをディスク(SQLite)に保存して使い回す
+
+    Notes:
+        キーは make_key でエンドポイントとパラメータを正規化したもののハッシュとする
+        有効期限はレスポンスごとに保存時に指定し、期限切れのものも再検証用と、
+        取得に失敗した場合の古い値(stale)として次の保存/追い出しまで残す
+        合計サイズが max_bytes を超えたら、最後に参照された時刻が古いものから追い出す（LRU）
+        fetcher はスレッドで並行に動くため、操作ごとに接続を開く
+        キャッシュの読み書きに失敗しても取得自体は失敗させない（キャッシュが無い場合と同じ扱いとする）
+    """
+
+    PATH = "~/.cache/we-wish-the-perfect-weather/http_cache.db"
+    MAX_BYTES = 256 * 1024 * 1024
+    # make_key で数値として正規化するパラメータ（それ以外の値は表記のまま比較する）
+    NUMERIC_KEYS = ["latitude", "longitude"]
+
+    def __init__(self, path: str | Path = PATH, max_bytes: int = MAX_BYTES):
+        # 作業ディレクトリによらず同じキャッシュを使うため、絶対パスにしておく
+        self.path = Path(path).expanduser().resolve()
+        self.max_bytes = max_bytes
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(self.connect()) as conn, conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS response (
+                        key TEXT PRIMARY KEY,
+                        url TEXT NOT NULL,
+                        body BLOB NOT NULL,
+                        etag TEXT NOT NULL,
+                        last_modified TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        stored_at REAL NOT NULL,
+                        expires_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_response_accessed_at ON response (accessed_at)")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Response cache is unavailable, {e}.")
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def make_key(url: str, params: dict) -> str:
+        """エンドポイントとパラメータからキャッシュのキーを作成する
+
+        Notes:
+            パラメータはキーの順に並べ、リストはカンマ区切りとする
+            NUMERIC_KEYS（緯度・経度）の値は float を経由した文字列に揃える
+            （"35.6895" と 35.6895 のように、表記が違うだけの同じリクエストを同じキーにする）
+            それ以外の値は文字列のまま比較する（citycode "01101" と "1101" のような別のリクエストを同じキーにしない）
+
+        Args:
+            url (str): エンドポイントのURL
+            params (dict): クエリパラメータ
+
+        Returns:
+            str: キー（sha256 の16進文字列）
+        """
+
+        def normalize(value, is_numeric: bool) -> str:
+            if isinstance(value, (list, tuple)):
+                return ",".join(normalize(v, is_numeric) for v in value)
+            if isinstance(value, bool):
+                return str(value).lower()
+            if is_numeric:
+                try:
+                    return repr(float(value))
+                except (TypeError, ValueError):
+                    pass
+            return str(value)
+
+        query = "&".join(f"{k}={normalize(v, k in ResponseCache.NUMERIC_KEYS)}" for k, v in sorted(params.items()))
+        return hashlib.sha256(f"{url.rstrip('/')}?{query}".encode()).hexdigest()
+
+    def get_many(self, key_list: list[str]) -> dict[str, CachedResponse]:
+        """キーに対応する保存済のレスポンスを返す（期限切れのものも含む）
+
+        Args:
+            key_list (list[str]): キーのリスト
+
+        Returns:
+            dict[str, CachedResponse]: 保存済のキーをキー、レスポンスを値に持つ辞書
+        """
+        if not key_list:
+            return {}
+        result = {}
+        try:
+            with closing(self.connect()) as conn, conn:
+                # 1文のパラメータ数の上限を超えないよう分割して検索する
+                for i in range(0, len(key_list), 500):
+                    chunk = key_list[i : i + 500]
+                    placeholder = ",".join(["?"] * len(chunk))
+                    query = (
+                        "SELECT key, body, etag, last_modified, expires_at, stored_at "
+                        f"FROM response WHERE key IN ({placeholder})"
+                    )
+                    for key, *values in conn.execute(query, chunk).fetchall():
+                        result[key] = CachedResponse(*values)
+                    conn.execute(
+                        f"UPDATE response SET accessed_at = ? WHERE key IN ({placeholder})", [time.time(), *chunk]
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed, {e}.")
+            return {}
+        return result
+
+    def get(self, key: str) -> CachedResponse | None:
+        """キーに対応する保存済のレスポンスを返す、無ければ None"""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, entry_list: list[tuple[str, str, bytes, str, str]], ttl: float) -> None:
+        """レスポンスを保存し、合計サイズが max_bytes を超えた分を追い出す
+
+        Args:
+            entry_list (list[tuple[str, str, bytes, str, str]]): (キー, URL, ボディ, ETag, Last-Modified) のリスト
+            ttl (float): 有効期間[s]
+        """
+        if not entry_list:
+            return
+        now = time.time()
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (key, url, body, etag, last_modified, len(body), now, now + ttl, now)
+                        for key, url, body, etag, last_modified in entry_list
+                    ],
+                )
+                self.evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed, {e}.")
+
+    def put(self, key: str, url: str, body: bytes, ttl: float, etag: str = "", last_modified: str = "") -> None:
+        """レスポンスを1件保存する"""
+        self.put_many([(key, url, body, etag, last_modified)], ttl)
+
+    def refresh(self, key: str, ttl: float) -> None:
+        """再検証でレスポンスが変わっていなかった（304）場合に、有効期限を延ばす（保存時刻も確認した時刻にする）"""
+        now = time.time()
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute(
+                    "UPDATE response SET stored_at = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                    (now, now + ttl, now, key),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed, {e}.")
+
+    def delete(self, key: str) -> None:
+        """レスポンスを破棄する"""
+        try:
+            with closing(self.connect()) as conn, conn:
+                conn.execute("DELETE FROM response WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed, {e}.")
+
+    def evict(self, conn: sqlite3.Connection) -> None:
+        """最後に参照された時刻が新しい順にサイズを累積し、max_bytes を超えた分を削除する"""
+        (total_size,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()
+        if total_size <= self.max_bytes:
+            return
+        conn.execute(
+            """
+            DELETE FROM response WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS cumulative_size FROM response
+                ) WHERE cumulative_size > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+
+if __name__ == "__main__":
+    cache = ResponseCache("./cache/http_cache.db", max_bytes=1024)
+    key = ResponseCache.make_key("https://example.com/api", {"citycode": "13104", "start": "20250601"})
+    cache.put(key, "https://example.com/api", b"citycode,date,pollen\n", 3600, etag='"abc"')
+    print(cache.get(key))
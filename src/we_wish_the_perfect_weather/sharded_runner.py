@@ -0,0 +1,236 @@
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from logging import INFO, getLogger
+from typing import NamedTuple
+
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.util import chunked
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class ShardResult(NamedTuple):
+    """1シャード分の取得・判定の結果（ワーカープロセスから書き込み側に渡す）"""
+
+    record_list: list[dict]
+    hourly_record_list: list[dict]
+    message_list: list[str | None]  # record_list と同じ並びの通知文（通知しない場合は None）
+    degraded: dict[str, str]
+    report: dict  # ワーカープロセスでの instrumentation.to_dict()
+
+
+# ワーカープロセスごとに1つ構築する Manager（DBには接続しない）
+worker_manager: Manager | None = None
+
+
+def init_worker(config: dict) -> None:
+    """ワーカープロセスの初期化（ProcessPoolExecutor の initializer）"""
+    global worker_manager
+    worker_manager = Manager(config)
+
+
+def run_shard(locations: list[dict], target_date1: str, target_date2: str, registered_at: str) -> ShardResult:
+    """1シャード分の地点について、取得 → interpret → 判定 → 通知文の組み立てを行う（ワーカープロセスで呼ばれる）
+
+    Args:
+        locations (list[dict]): シャードの観測地点辞書のリスト
+        target_date1 (str): 実測値を記録する日付 "%Y-%m-%d"形式
+        target_date2 (str): 予報値を記録する日付 "%Y-%m-%d"形式
+        registered_at (str): レコードの登録日時（実行全体で揃える）
+
+    Returns:
+        ShardResult: 取得・判定の結果
+    """
+    manager = worker_manager
+    instrumentation.reset()
+    manager.registered_at = registered_at
+    manager.fetch_all(locations)
+    record_list, check_matrix = manager.build_records(manager.get_target_list(locations, target_date1, target_date2))
+    hourly_record_list = manager.dump_hourly_records(record_list) if manager.is_store_hourly else []
+    with instrumentation.span("render"):
+        message_list = [
+            manager.render_notification(record, [bool(c) for c in check])
+            for record, check in zip(record_list, check_matrix)
+        ]
+    return ShardResult(
+        record_list, hourly_record_list, message_list, dict(manager.degraded), instrumentation.to_dict()
+    )
+
+
+class ShardedRunner:
+    """観測地点を分割して複数プロセスで取得・判定し、1つの書き込みスレッドでDBに登録する
+
+    Notes:
+        取得(FlatBuffers の解釈を含む)・集計・判定・通知文の組み立ては CPU を使うため、
+        地点を shard_size ごとのシャードに分けて ProcessPoolExecutor のワーカープロセスで行う
+        SQLite の書き込みは1つの接続からしか行えないため、DBへの書き込みはこのプロセスの書き込みスレッドのみが行い、
+        ワーカープロセスはDBに接続しない
+        書き込みスレッドはキューに溜まった結果を batch_size 件程度ずつ1トランザクションで書き込み、その後に通知する
+        キューの長さは queue_size シャード分までとし、書き込みが追いつかない場合は新たなシャードを投入しない
+        （取得済で書き込み待ちの結果が際限なく溜まらないようにする）
+        ワーカープロセスは spawn で起動する（スレッドを持つこのプロセスを fork しない）
+    """
+
+    QUEUE_SIZE = 4  # 書き込み待ちのシャード数の上限
+    BATCH_SIZE = 2000  # 1トランザクションで書き込むレコード数の目安
+
+    def __init__(
+        self,
+        manager: Manager,
+        workers: int,
+        shard_size: int = Manager.SHARD_SIZE,
+        queue_size: int = QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+    ):
+        self.manager = manager
+        self.workers = workers
+        self.shard_size = shard_size
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.result_queue: queue.Queue[ShardResult | None] = queue.Queue(maxsize=queue_size)
+        self.written_count = 0
+        # 直近の run で、シャードの失敗や書き込みの失敗により記録しなかった地点名
+        # （シャードの失敗はこのスレッド、書き込みの失敗は書き込みスレッドが追加する）
+        self.skipped_locations: list[str] = []
+
+    def run(self, locations: list[dict], target_date1: str, target_date2: str) -> int:
+        """全地点について、[target_date1 の実測値, target_date2 の予報値] を記録する
+
+        Notes:
+            失敗したシャードや書き込みに失敗したバッチの地点は記録せず（次回の実行で再取得する）、
+            skipped_locations に加える
+            シャードの成否によらず、完了したら次のシャードを投入する
+            縮退した fetcher はシャードごとの結果をまとめて manager.degraded に設定する
+
+        Args:
+            locations (list[dict]): 対象の観測地点辞書のリスト
+            target_date1 (str): 実測値を記録する日付 "%Y-%m-%d"形式
+            target_date2 (str): 予報値を記録する日付 "%Y-%m-%d"形式
+
+        Returns:
+            int: 登録したレコード数
+        """
+        shard_list = list(chunked(locations, self.shard_size))
+        logger.info(f"{len(locations)} location(s) -> {len(shard_list)} shard(s), {self.workers} worker(s).")
+        self.manager.degraded = {}
+        self.written_count = 0
+        self.skipped_locations = []
+        writer = threading.Thread(target=self.write_loop, name="shard-writer")
+        writer.start()
+
+        start = time.monotonic()
+        # ワーカーが空かないよう、書き込み待ちにできる数に加えてワーカー数分のシャードを先に投入しておく
+        max_pending = self.workers + self.queue_size
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.manager.config,),
+        )
+        try:
+            # 投入済で未完了のシャード（Future -> シャードの地点）
+            pending: dict[Future, list[dict]] = {}
+            shard_iter = iter(shard_list)
+            for shard in shard_iter:
+                pending[self.submit(executor, shard, target_date1, target_date2)] = shard
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shard = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.skipped_locations.extend(location["name"] for location in shard)
+                        instrumentation.add("locations_skipped", len(shard))
+                        logger.warning(f"Shard failed, {len(shard)} location(s) skipped, {type(e).__name__}: {e}.")
+                    else:
+                        instrumentation.merge(result.report)
+                        self.manager.degraded |= result.degraded
+                        # 書き込みが追いついていない場合はここで待つ
+                        self.result_queue.put(result)
+                    next_shard = next(shard_iter, None)
+                    if next_shard is not None:
+                        pending[self.submit(executor, next_shard, target_date1, target_date2)] = next_shard
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.result_queue.put(None)
+            writer.join()
+
+        for name, reason in self.manager.degraded.items():
+            logger.warning(f"Fetcher {name} is degraded, {reason}.")
+        if self.skipped_locations:
+            logger.warning(f"{len(self.skipped_locations)} location(s) skipped by failed shard(s) or write(s).")
+        logger.info(f"Sharded run -> {self.written_count} record(s) ({time.monotonic() - start:.2f}s).")
+        return self.written_count
+
+    def submit(self, executor: ProcessPoolExecutor, shard: list[dict], target_date1: str, target_date2: str) -> Future:
+        registered_at = self.manager.registered_at
+        return executor.submit(run_shard, list(shard), target_date1, target_date2, registered_at)
+
+    def write_loop(self) -> None:
+        """キューから結果を取り出し、batch_size 件程度ずつまとめて書き込む（書き込みスレッド）"""
+        is_done = False
+        while not is_done:
+            result_list = []
+            n_records = 0
+            result = self.result_queue.get()
+            # 取り出せる分だけまとめる（最初の1件は届くまで待つ）
+            while result is not None:
+                result_list.append(result)
+                n_records += len(result.record_list)
+                if n_records >= self.batch_size:
+                    break
+                try:
+                    result = self.result_queue.get_nowait()
+                except queue.Empty:
+                    break
+            is_done = result is None
+            if not result_list:
+                continue
+            try:
+                self.write(result_list)
+            except Exception as e:
+                # 書き込みスレッドが止まるとキューへの投入が待ち続けるため、例外はここで止める
+                # バッチの地点は記録されていないため、skipped_locations に加えて実行を失敗とする
+                location_list = list(
+                    dict.fromkeys(record["location"] for result in result_list for record in result.record_list)
+                )
+                self.skipped_locations.extend(location_list)
+                instrumentation.add("locations_skipped", len(location_list))
+                logger.exception(f"Write failed, {len(location_list)} location(s) skipped, {type(e).__name__}: {e}.")
+
+    def write(self, result_list: list[ShardResult]) -> None:
+        """複数シャード分の結果を1トランザクションで書き込み、その後に通知する
+
+        Notes:
+            書き込みに失敗した場合はそのバッチのみ破棄して続ける（write_loop で地点を skipped_locations に加え、
+            次回の実行で再取得する）、通知は書き込みに成功したバッチのみ行う
+        """
+        record_list = [record for result in result_list for record in result.record_list]
+        hourly_record_list = [record for result in result_list for record in result.hourly_record_list]
+        with instrumentation.span("upsert"):
+            count = self.manager.weather_db.upsert_many(record_list, hourly_record_list)
+        instrumentation.add("rows_written", count)
+        self.written_count += count
+
+        for result in result_list:
+            for message in result.message_list:
+                if message is not None:
+                    self.manager.post_discord_notify(message)
+
+
+if __name__ == "__main__":
+    from datetime import datetime
+
+    from we_wish_the_perfect_weather.util import get_target_dates
+
+    manager = Manager()
+    runner = ShardedRunner(manager, workers=4)
+    print(runner.run(manager.locations, *get_target_dates(datetime.now())))
@@ -1,4 +1,7 @@
 import enum
+import threading
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 from typing import Any
 
@@ -114,6 +117,141 @@ def is_morning() -> bool:
     return datetime.now().hour < 12
 
 
+def get_locations(config: dict) -> list[dict]:
+    """設定から観測地点のリストを取得する
+
+    Notes:
+        config に "locations" が無い場合は、従来の "open_meteo", "pollen_count" の設定から
+        name が空文字列の単一地点を構成する（既存DBのレコードと対応させるため）
+
+    Args:
+        config (dict): 設定辞書
+
+    Returns:
+        list[dict]: 以下のキーを持つ観測地点辞書のリスト
+            {
+                "name": (str),
+                "latitude": (str),
+                "longitude": (str),
+                "citycode": (str),
+                "timezone": (str),
+            }
+    """
+    locations = config.get("locations")
+    if not locations:
+        locations = [
+            {
+                "name": "",
+                "latitude": config["open_meteo"]["latitude"],
+                "longitude": config["open_meteo"]["longitude"],
+                "citycode": config.get("pollen_count", {}).get("citycode", ""),
+            }
+        ]
+
+    result = []
+    for location in locations:
+        result.append({
+            "name": str(location.get("name", "")),
+            "latitude": str(location["latitude"]),
+            "longitude": str(location["longitude"]),
+            "citycode": str(location.get("citycode", "")),
+            "timezone": str(location.get("timezone", "Asia/Tokyo")),
+        })
+
+    names = [location["name"] for location in result]
+    if len(names) != len(set(names)):
+        raise ValueError("locations name must be unique.")
+    return result
+
+
+def chunked(seq: Sequence, size: int) -> Iterator[Sequence]:
+    """シーケンスを size 個ずつに分割する
+
+    Args:
+        seq (Sequence): 対象のシーケンス
+        size (int): 1チャンクあたりの要素数
+
+    Yields:
+        Sequence: 分割されたシーケンス
+    """
+    if size < 1:
+        raise ValueError("size must be greater than 0.")
+    for i in range(0, len(seq), size):
+        yield seq[i : i + size]
+
+
+def month_range_list(from_date: str, to_date: str) -> list[tuple[str, str]]:
+    """期間を月ごとに分割する
+
+    Args:
+        from_date (str): 開始日 "%Y-%m-%d"形式
+        to_date (str): 終了日 "%Y-%m-%d"形式（この日を含む）
+
+    Returns:
+        list[tuple[str, str]]: (月内の開始日, 月内の終了日) のリスト
+    """
+    start = datetime.strptime(from_date, "%Y-%m-%d").date()
+    end = datetime.strptime(to_date, "%Y-%m-%d").date()
+    result = []
+    while start <= end:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        month_end = min(next_month - timedelta(days=1), end)
+        result.append((start.isoformat(), month_end.isoformat()))
+        start = next_month
+    return result
+
+
+def get_target_dates(now: datetime) -> tuple[str, str]:
+    """記録対象の日付を返す
+
+    Notes:
+        午前なら (昨日, 今日)、午後なら (今日, 明日) を返す
+        1つ目は実測値、2つ目は予報値を記録する日付
+
+    Args:
+        now (datetime): 基準とする現在日時
+
+    Returns:
+        tuple[str, str]: "%Y-%m-%d" 形式の (実測値の日付, 予報値の日付)
+    """
+    yesterday, today, tomorrow = [(now + timedelta(days=days)).strftime("%Y-%m-%d") for days in [-1, 0, 1]]
+    if now.hour < 12:
+        return yesterday, today
+    return today, tomorrow
+
+
+def run_in_daemon_thread(func: Callable, *args, name: str = "") -> Future:
+    """func(*args) をデーモンスレッドで実行し、その結果を受け取る Future を返す
+
+    Notes:
+        実行中のスレッドは外から中断できないため、完了を待たないと決めたスレッドは放棄するしかない
+        ThreadPoolExecutor のスレッドはインタプリタの終了時に join されるので、放棄したスレッドが
+        終了を遅らせないよう、デーモンスレッドで実行する（終了時に実行中ならそのまま打ち切られる）
+
+    Args:
+        func (Callable): 実行する関数
+        *args: func に渡す引数
+        name (str): スレッド名
+
+    Returns:
+        Future: func の返り値か送出した例外を受け取る Future
+    """
+    future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    threading.Thread(target=run, name=name or None, daemon=True).start()
+    return future
+
+
 def to_builtin(obj: Any) -> Any:
     """NumPy互換データを、Python標準の list / dict / int / float に変換する
 
@@ -1,27 +1,228 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import date, timedelta
 from pathlib import Path
 
-from sqlalchemy import and_, desc
-from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import ColumnElement, Connection, Delete, Insert, Row, Select, and_, bindparam, case, delete, desc
+from sqlalchemy import func, insert, not_, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
+from we_wish_the_perfect_weather.criteria import CRITERIA_COLUMNS, MISSING_VALUE, OPERATORS, PERFECTION_CRITERIA
+from we_wish_the_perfect_weather.criteria import criteria_version, resolve_base
 from we_wish_the_perfect_weather.db_controller_base import DBControllerBase
-from we_wish_the_perfect_weather.model import Weather
+from we_wish_the_perfect_weather.model import HourlyObservation, Weather, WeatherMonthlyStats, WeatherRecord
+from we_wish_the_perfect_weather.model import WeatherStreak
+from we_wish_the_perfect_weather.util import chunked
+
+
+def build_perfection_predicate(base: dict | None = None) -> ColumnElement[bool]:
+    """PERFECTION_CRITERIA を Weather の列に対する条件式に変換する
+
+    Notes:
+        criteria.evaluate_perfection と同じ判定を SQL で行うためのもの
+        全基準の比較を AND で結合する（対象列が MISSING_VALUE の比較は、is_stale でなければ真とする）
+        閾値はバインドパラメータになるため、閾値だけが異なる条件式は同じ SQL 文になる
+
+    Args:
+        base (dict | None): 判定の閾値辞書、PW_BASE に無いキーは PW_BASE の値を使う、None なら PW_BASE
+
+    Returns:
+        ColumnElement[bool]: "完璧な気候" であるときに真となる条件式
+    """
+    base = resolve_base(base)
+    return and_(*[
+        or_(
+            and_(getattr(Weather, column) != MISSING_VALUE, OPERATORS[op](getattr(Weather, column), base[base_key])),
+            and_(getattr(Weather, column) == MISSING_VALUE, not_(Weather.is_stale)),
+        )
+        for criterion in PERFECTION_CRITERIA
+        for column, op, base_key in criterion
+    ])
+
+
+def build_upsert_stmt(model: type, key_columns: list[str]) -> Insert:
+    """key_columns の一意制約に対する INSERT ... ON CONFLICT DO UPDATE 文を返す（id 以外の列を更新する）
+
+    Args:
+        model (type): 対象のテーブルのモデル
+        key_columns (list[str]): 一意制約の列名のリスト
+
+    Returns:
+        Insert: UPSERT 文
+    """
+    stmt = sqlite_insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={c.name: stmt.excluded[c.name] for c in model.__table__.columns if c.name not in [*key_columns, "id"]},
+    )
+
+
+def build_monthly_stats_stmt(is_partial: bool) -> tuple[Delete, Insert]:
+    """Weather から WeatherMonthlyStats を集計し直す文を返す
+
+    Notes:
+        予報値と同じ地点・日付の実測値を LEFT JOIN し、月ごとの件数と予報の的中の件数を1つの SELECT で集計する
+        対象範囲の行を削除する DELETE と、集計結果を挿入する INSERT ... SELECT の組を返す
+        is_partial の場合は、バインドパラメータ key_list の (地点, 月 "%Y-%m") の組のみを集計し直す
+        （Weather はインデックスを使えるよう、バインドパラメータ location_list, start_month, end_month の
+          範囲で絞り込んでから key_list の組を取り出す）
+
+    Args:
+        is_partial (bool): (地点, 月) の組を指定して集計し直す文を返すか、全体を集計し直す文を返すか
+
+    Returns:
+        tuple[Delete, Insert]: 順に実行する (DELETE 文, INSERT 文)
+    """
+    w = Weather.__table__
+    a = w.alias("actual")
+    stats = WeatherMonthlyStats.__table__
+
+    month = func.substr(w.c.target_date, 1, 7)
+    weather_filter = []
+    stats_filter = []
+    if is_partial:
+        start_month, end_month = bindparam("start_month"), bindparam("end_month")
+        weather_filter = [
+            w.c.location.in_(bindparam("location_list", expanding=True)),
+            w.c.target_date >= start_month.concat("-01"),
+            w.c.target_date <= end_month.concat("-31"),
+            tuple_(w.c.location, month).in_(bindparam("key_list", expanding=True)),
+        ]
+        stats_filter = [tuple_(stats.c.location, stats.c.month).in_(bindparam("key_list", expanding=True))]
+
+    def count_if(*condition_list) -> ColumnElement[int]:
+        return func.coalesce(func.sum(case((and_(*condition_list), 1), else_=0)), 0)
+
+    is_actual = w.c.record_type == "actual"
+    is_forecast = w.c.record_type == "forecast"
+    is_paired = and_(is_forecast, a.c.id.is_not(None))
+    stmt = (
+        select(
+            w.c.location,
+            month,
+            count_if(is_actual),
+            count_if(is_actual, w.c.is_perfect),
+            count_if(is_forecast),
+            count_if(is_forecast, w.c.is_perfect),
+            count_if(is_paired, w.c.is_perfect, a.c.is_perfect),
+            count_if(is_paired, w.c.is_perfect, not_(a.c.is_perfect)),
+            count_if(is_paired, not_(w.c.is_perfect), a.c.is_perfect),
+            count_if(is_paired, not_(w.c.is_perfect), not_(a.c.is_perfect)),
+        )
+        .select_from(
+            w.outerjoin(
+                a,
+                and_(
+                    is_forecast,
+                    a.c.location == w.c.location,
+                    a.c.target_date == w.c.target_date,
+                    a.c.record_type == "actual",
+                ),
+            )
+        )
+        .where(*weather_filter)
+        .group_by(w.c.location, month)
+    )
+    columns = [c.name for c in stats.columns]
+    return delete(stats).where(*stats_filter), insert(stats).from_select(columns, stmt)
+
+
+def build_streak_stmt(is_partial: bool) -> tuple[Delete, Insert]:
+    """Weather から WeatherStreak を集計し直す文を返す
+
+    Notes:
+        実測値が is_perfect の日に地点ごとの日付順の連番を振り、julianday(日付) - 連番 が等しい日を
+        1つの連続期間として（gaps and islands）、ウィンドウ関数で連続日数を求める
+        最長の連続期間が複数ある場合は、最後に終わったものを longest_streak_end_date とする
+        is_partial の場合は、バインドパラメータ location_list で対象の地点を絞り込む
+
+    Args:
+        is_partial (bool): 地点を指定して集計し直す文を返すか、全体を集計し直す文を返すか
+
+    Returns:
+        tuple[Delete, Insert]: 順に実行する (DELETE 文, INSERT 文)
+    """
+    w = Weather.__table__
+    streak = WeatherStreak.__table__
+
+    actual_filter = [w.c.record_type == "actual"]
+    streak_filter = []
+    if is_partial:
+        actual_filter.append(w.c.location.in_(bindparam("location_list", expanding=True)))
+        streak_filter.append(streak.c.location.in_(bindparam("location_list", expanding=True)))
+
+    row_number = func.row_number().over(partition_by=w.c.location, order_by=w.c.target_date)
+    perfect = (
+        select(w.c.location, w.c.target_date, (func.julianday(w.c.target_date) - row_number).label("island"))
+        .where(*actual_filter, w.c.is_perfect.is_(True))
+        .cte("perfect")
+    )
+    island = (
+        select(perfect.c.location, func.count().label("length"), func.max(perfect.c.target_date).label("end_date"))
+        .group_by(perfect.c.location, perfect.c.island)
+        .cte("island")
+    )
+    rank = func.row_number().over(
+        partition_by=island.c.location, order_by=(island.c.length.desc(), island.c.end_date.desc())
+    )
+    longest = select(island, rank.label("rank")).cte("longest")
+    last = (
+        select(w.c.location, func.max(w.c.target_date).label("last_date"))
+        .where(*actual_filter)
+        .group_by(w.c.location)
+        .cte("last")
+    )
+    current = island.alias("current")
+    stmt = select(
+        last.c.location,
+        last.c.last_date,
+        func.coalesce(current.c.length, 0),
+        func.coalesce(longest.c.length, 0),
+        longest.c.end_date,
+    ).select_from(
+        last.outerjoin(
+            current, and_(current.c.location == last.c.location, current.c.end_date == last.c.last_date)
+        ).outerjoin(longest, and_(longest.c.location == last.c.location, longest.c.rank == 1))
+    )
+    columns = [c.name for c in streak.columns]
+    return delete(streak).where(*streak_filter), insert(streak).from_select(columns, stmt)
 
 
 class WeatherDBController(DBControllerBase):
+    STATS_KEY_CHUNK_SIZE = 500  # 集計し直す (地点, 月) の組や地点を、1文で指定する数の上限
+
     def __init__(self, db_fullpath="PW_DB.db"):
+        # UPSERT と集計テーブルを更新する文は upsert のたびに実行するため、構築（とSQLのコンパイル）を1回で済ませる
+        self.weather_upsert_stmt = build_upsert_stmt(Weather, ["location", "target_date", "record_type"])
+        self.hourly_upsert_stmt = build_upsert_stmt(
+            HourlyObservation, ["location", "target_date", "record_type", "variable"]
+        )
+        self.monthly_stats_stmt = {is_partial: build_monthly_stats_stmt(is_partial) for is_partial in [False, True]}
+        self.streak_stmt = {is_partial: build_streak_stmt(is_partial) for is_partial in [False, True]}
+        # Weather に書き込むたびにインクリメントする（集計結果のキャッシュの無効化に使う）
+        self.write_count = 0
+        # deferred_stats の中で UPSERT した (地点, 月) の組と、実測値を UPSERT した地点（中で無ければ None）
+        self.deferred_month_keys: set[tuple[str, str]] | None = None
+        self.deferred_streak_locations: set[str] | None = None
         super().__init__(db_fullpath)
 
+    def migrate(self) -> None:
+        super().migrate()
+        if self.get_schema_version() < 4:
+            # 集計テーブルを追加する前に登録されたレコードを集計する
+            self.rebuild_stats()
+
     def upsert(self, params: dict) -> None:
         """DBにUPSERTする
 
         Notes:
             一致しているかの判定は
-            record_type, target_date の両方が一致している場合、とする
+            location, record_type, target_date のすべてが一致している場合、とする
 
         Args:
             params (dict): 以下のキーを持つ辞書
                 params = {
+                    "location": (str),
                     "target_date": (str: "%Y-%m-%d"),
                     "record_type": (str),
                     "is_perfect": (bool),
@@ -36,39 +237,247 @@ class WeatherDBController(DBControllerBase):
                     "registered_at": (str: "%Y-%m-%d %H:%M:%S"),
                 }
         """
-        Session = sessionmaker(bind=self.engine)
-        session = Session()
+        self.upsert_many([params])
 
-        records = [Weather.create(params)]
-        for r in records:
-            try:
-                q = session.query(Weather).filter(
-                    and_(
-                        Weather.record_type == r.record_type,
-                        Weather.target_date == r.target_date,
-                    )
-                )
-                ex = q.one()
-            except NoResultFound:
-                # INSERT
-                session.add(r)
-            else:
-                # UPDATE
-                ex.target_date = r.target_date
-                ex.record_type = r.record_type
-                ex.is_perfect = r.is_perfect
-                ex.maximum_temperature = r.maximum_temperature
-                ex.minimum_temperature = r.minimum_temperature
-                ex.maximum_humidity = r.maximum_humidity
-                ex.minimum_humidity = r.minimum_humidity
-                ex.maximum_precipitation_probability = r.maximum_precipitation_probability
-                ex.maximum_precipitation = r.maximum_precipitation
-                ex.maximum_wind_speed = r.maximum_wind_speed
-                ex.maximum_pollen_count = r.maximum_pollen_count
-                ex.registered_at = r.registered_at
-
-        session.commit()
-        session.close()
+    def upsert_many(self, records: list[dict], hourly_records: list[dict] | None = None) -> int:
+        """DBに複数レコードをまとめてUPSERTする
+
+        Notes:
+            location, target_date, record_type の一意制約に対する
+            INSERT ... ON CONFLICT DO UPDATE を executemany で1トランザクションで実行する
+            同じトランザクションで集計テーブルも更新する（update_stats、deferred_stats の中では抜けるときに行う）
+            hourly_records を指定した場合は、その UPSERT（upsert_hourly_many）も同じトランザクションで行う
+
+        Args:
+            records (list[dict]): upsert の params と同じキーを持つ辞書のリスト
+            hourly_records (list[dict] | None): upsert_hourly_many の records と同じ形式の辞書のリスト
+
+        Returns:
+            int: UPSERTしたレコード数
+        """
+        if not records:
+            return 0
+
+        # 型チェックは Weather オブジェクトを生成せずに、列ごとにまとめて行う
+        values = Weather.validate_many(records)
+        hourly_values = self.validate_hourly(hourly_records) if hourly_records else []
+        with self.engine.begin() as conn:
+            conn.execute(self.weather_upsert_stmt, values)
+            if self.deferred_month_keys is None:
+                self.update_stats(conn, values)
+            if hourly_values:
+                conn.execute(self.hourly_upsert_stmt, hourly_values)
+        if self.deferred_month_keys is not None:
+            self.deferred_month_keys.update((r["location"], r["target_date"][:7]) for r in values)
+            self.deferred_streak_locations.update(r["location"] for r in values if r["record_type"] == "actual")
+        self.write_count += 1
+        return len(values)
+
+    @contextmanager
+    def deferred_stats(self) -> Iterator[None]:
+        """中で行った UPSERT の分の集計テーブルの更新を、抜けるときに1トランザクションでまとめて行う
+
+        Notes:
+            同じ地点・月に何度も UPSERT する場合（1レコードずつの upsert, backfill 等）に、
+            UPSERT のたびに集計し直さず、(地点, 月) の組ごと・地点ごとに1回だけ集計し直す
+            中にいる間は、集計テーブルにこの中での UPSERT が反映されていない
+            例外で抜けた場合も、それまでに UPSERT した分は更新する
+            入れ子にした場合は、最も外側を抜けるときにまとめて更新する
+        """
+        if self.deferred_month_keys is not None:
+            yield
+            return
+        self.deferred_month_keys, self.deferred_streak_locations = set(), set()
+        try:
+            yield
+        finally:
+            month_keys, streak_locations = self.deferred_month_keys, self.deferred_streak_locations
+            self.deferred_month_keys, self.deferred_streak_locations = None, None
+            if month_keys:
+                with self.engine.begin() as conn:
+                    self.rebuild_monthly_stats(conn, sorted(month_keys))
+                    if streak_locations:
+                        self.rebuild_streaks(conn, sorted(streak_locations))
+
+    def upsert_hourly_many(self, records: list[dict]) -> int:
+        """1時間ごとの取得値をまとめてUPSERTする
+
+        Notes:
+            location, target_date, record_type, variable の一意制約に対する
+            INSERT ... ON CONFLICT DO UPDATE を executemany で1トランザクションで実行する
+
+        Args:
+            records (list[dict]): 以下のキーを持つ辞書のリスト
+                {
+                    "location": (str),
+                    "target_date": (str: "%Y-%m-%d"),
+                    "record_type": (str),
+                    "variable": (str),
+                    "hourly_values": (bytes),
+                    "registered_at": (str: "%Y-%m-%d %H:%M:%S"),
+                }
+
+        Returns:
+            int: UPSERTしたレコード数
+        """
+        if not records:
+            return 0
+
+        values = self.validate_hourly(records)
+        with self.engine.begin() as conn:
+            conn.execute(self.hourly_upsert_stmt, values)
+        return len(values)
+
+    @staticmethod
+    def validate_hourly(records: list[dict]) -> list[dict]:
+        """upsert_hourly_many のレコードを型チェックし、HourlyObservation の id 以外の列の辞書のリストにする"""
+        columns = [c.name for c in HourlyObservation.__table__.columns if c.name != "id"]
+        values = []
+        for params in records:
+            r = HourlyObservation.create(params)
+            values.append({c: getattr(r, c) for c in columns})
+        return values
+
+    def select_hourly(self, location_list: list[str], start_date: str, end_date: str) -> list[dict]:
+        """期間内の1時間ごとの取得値を取得する
+
+        Note:
+            f"select * from HourlyObservation where location in {location_list}
+              and target_date between {start_date} and {end_date}
+              order by location, target_date, record_type, variable"
+
+        Args:
+            location_list (list[str]): 観測地点名のリスト
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
+
+        Returns:
+            list[dict]: SELECTしたレコードの辞書リスト
+        """
+        table = HourlyObservation.__table__
+        stmt = (
+            select(table)
+            .where(
+                table.c.location.in_(location_list),
+                table.c.target_date.between(start_date, end_date),
+            )
+            .order_by(table.c.location, table.c.target_date, table.c.record_type, table.c.variable)
+        )
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(stmt).mappings()]
+
+    def iter_chunks(
+        self,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        record_type: str | None = None,
+        chunk_size: int = 10000,
+    ) -> Iterator[tuple[list[str], list[Row]]]:
+        """Weather のレコードを chunk_size 件ずつ順に返す
+
+        Notes:
+            yield_per で DB からの取得も chunk_size 件ずつ行うため、全件を読んでもメモリ使用量は一定となる
+            ORM オブジェクトや辞書は作らず、Core の行（タプル）のまま返す
+            f"select * from Weather where target_date between {start_date} and {end_date}
+              and record_type = {record_type} order by id"
+
+        Args:
+            start_date (str | None): 期間の開始日 "%Y-%m-%d"形式、None なら最初から
+            end_date (str | None): 期間の終了日 "%Y-%m-%d"形式（この日を含む）、None なら最後まで
+            record_type (str | None): レコードタイプ ["actual", "forecast"]、None なら両方
+            chunk_size (int): 1回に返すレコード数
+
+        Yields:
+            tuple[list[str], list[Row]]: (列名のリスト, 行のリスト（各行は列名の並びのタプルとして扱える）)
+        """
+        table = Weather.__table__
+        stmt = select(table).order_by(table.c.id)
+        if start_date is not None:
+            stmt = stmt.where(table.c.target_date >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(table.c.target_date <= end_date)
+        if record_type is not None:
+            stmt = stmt.where(table.c.record_type == record_type)
+
+        with self.engine.connect() as conn:
+            result = conn.execution_options(yield_per=chunk_size).execute(stmt)
+            keys = list(result.keys())
+            for partition in result.partitions():
+                yield keys, partition
+
+    def select_page(
+        self,
+        after: tuple[str, int] | None = None,
+        page_size: int = 1000,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        record_type: str | None = None,
+        is_perfect: bool | None = None,
+    ) -> list[Row]:
+        """Weather のレコードを (target_date, id) 順に、after の次から page_size 件取得する
+
+        Notes:
+            キーセットページングのため、何ページ目であっても ix_weather_target_date を after の位置から読むだけで済む
+            （OFFSET のように読み飛ばす行は無い）
+            次のページは、返り値の最後の行の (target_date, id) を after に指定して取得する
+            f"select * from Weather where (target_date, id) > {after} and target_date between {start_date}
+              and {end_date} and record_type = {record_type} and is_perfect = {is_perfect}
+              order by target_date, id limit {page_size}"
+
+        Args:
+            after (tuple[str, int] | None): 前のページの最後の行の (target_date, id)、None なら最初のページ
+            page_size (int): 1ページのレコード数
+            start_date (str | None): 期間の開始日 "%Y-%m-%d"形式、None なら最初から
+            end_date (str | None): 期間の終了日 "%Y-%m-%d"形式（この日を含む）、None なら最後まで
+            record_type (str | None): レコードタイプ ["actual", "forecast"]、None なら両方
+            is_perfect (bool | None): "完璧な気候" かどうか、None なら両方
+
+        Returns:
+            list[Row]: 行のリスト（列名の属性で値を参照できる）、最後のページの次は空リスト
+        """
+        table = Weather.__table__
+        stmt = select(table).order_by(table.c.target_date, table.c.id).limit(page_size)
+        if after is not None:
+            stmt = stmt.where(tuple_(table.c.target_date, table.c.id) > tuple_(*after))
+        if start_date is not None:
+            stmt = stmt.where(table.c.target_date >= start_date)
+        if end_date is not None:
+            stmt = stmt.where(table.c.target_date <= end_date)
+        if record_type is not None:
+            stmt = stmt.where(table.c.record_type == record_type)
+        if is_perfect is not None:
+            stmt = stmt.where(table.c.is_perfect.is_(is_perfect))
+        with self.engine.connect() as conn:
+            return conn.execute(stmt).all()
+
+    def iter_records(
+        self,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        record_type: str | None = None,
+        is_perfect: bool | None = None,
+        page_size: int = 1000,
+    ) -> Iterator[Row]:
+        """Weather のレコードを (target_date, id) 順にすべて返す
+
+        Notes:
+            select_page でページごとに取得する
+            ページごとに接続を取り直すため、全件を読む間も読み取りのトランザクションを保持し続けない
+            （読んでいる間に登録されたレコードも、まだ読んでいない位置であれば返る）
+
+        Args:
+            select_page と同じ
+
+        Yields:
+            Row: 行（列名の属性で値を参照できる）
+        """
+        after = None
+        while True:
+            row_list = self.select_page(after, page_size, start_date, end_date, record_type, is_perfect)
+            yield from row_list
+            if len(row_list) < page_size:
+                return
+            after = (row_list[-1].target_date, row_list[-1].id)
 
     def select(self, limit=300) -> list[dict]:
         """WeatherからSELECTする
@@ -82,72 +491,470 @@ class WeatherDBController(DBControllerBase):
         Returns:
             list[dict]: SELECTしたレコードの辞書リスト
         """
-        Session = sessionmaker(bind=self.engine)
-        session = Session()
+        return [record.to_dict() for record in self.select_records(limit)]
+
+    def select_records(self, limit=300) -> list[WeatherRecord]:
+        """WeatherからSELECTする
+
+        Notes:
+            ORM オブジェクトや辞書を作らず、Core で読んだ行を WeatherRecord にして返す
+            f"select * from Weather order by id desc limit {limit}"
 
-        res = session.query(Weather).order_by(desc(Weather.id)).limit(limit).all()
-        res_dict = [r.to_dict() for r in res]  # 辞書リストに変換
+        Args:
+            limit (int): 取得レコード数上限
 
-        session.close()
-        return res_dict
+        Returns:
+            list[WeatherRecord]: SELECTしたレコードのリスト
+        """
+        table = Weather.__table__
+        stmt = select(table).order_by(desc(table.c.id)).limit(limit)
+        with self.engine.connect() as conn:
+            return list(map(WeatherRecord._make, conn.execute(stmt)))
 
-    def select_by_target_date(self, target_date: str, record_type: str) -> list[dict]:
-        """特定の日付の結果or予測レコードをSELECTする
+    def select_by_target_date(self, target_date: str, record_type: str, location: str = "") -> list[dict]:
+        """特定の地点・日付の結果or予測レコードをSELECTする
 
         Note:
-            f"select * from Weather where target_date == {registered_date} and record_type = {record_type}"
+            f"select * from Weather where target_date == {registered_date} and record_type = {record_type}
+              and location = {location}"
 
         Args:
             target_date (str): 取得対象の日付 "%Y-%m-%d"形式
             record_type (str): レコードタイプ ["actual", "forecast"]
+            location (str): 観測地点名
 
         Returns:
             list[dict]: SELECTしたレコードの辞書リスト
         """
-        Session = sessionmaker(bind=self.engine)
-        session = Session()
+        table = Weather.__table__
+        stmt = select(table).where(
+            table.c.location == location,
+            table.c.target_date == target_date,
+            table.c.record_type == record_type,
+        )
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(stmt).mappings()]
+
+    def select_target_dates(
+        self, location_list: list[str], record_type: str, start_date: str, end_date: str
+    ) -> dict[str, set[str]]:
+        """期間内に登録済の target_date を地点ごとに取得する
+
+        Note:
+            f"select location, target_date from Weather where location in {location_list}
+              and record_type = {record_type} and target_date between {start_date} and {end_date}"
+
+        Args:
+            location_list (list[str]): 観測地点名のリスト
+            record_type (str): レコードタイプ ["actual", "forecast"]
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
 
-        res = (
-            session.query(Weather)
-            .filter(and_(Weather.target_date == target_date, Weather.record_type == record_type))
-            .all()
+        Returns:
+            dict[str, set[str]]: 観測地点名をキー、登録済の target_date の集合を値に持つ辞書
+        """
+        stmt = select(Weather.location, Weather.target_date).where(
+            Weather.location.in_(location_list),
+            Weather.record_type == record_type,
+            Weather.target_date.between(start_date, end_date),
         )
-        res_dict = [r.to_dict() for r in res]  # 辞書リストに変換
+        result = {location: set() for location in location_list}
+        with self.engine.connect() as conn:
+            for location, target_date in conn.execute(stmt):
+                result[location].add(target_date)
+        return result
 
-        session.close()
-        return res_dict
+    def select_done_locations(self, location_list: list[str], target_date1: str, target_date2: str) -> set[str]:
+        """target_date1 の実測値と target_date2 の予報値の両方が登録済の地点を取得する
 
-    def is_perfect(self, target_date: str, record_type: str) -> bool:
-        """特定の日付の結果or予測が "完璧な気候" かを取得する
+        Note:
+            f"select location from Weather where location in {location_list}
+              and ((target_date = {target_date1} and record_type = 'actual')
+                or (target_date = {target_date2} and record_type = 'forecast'))
+              and is_stale is 0
+              group by location having count(*) = 2"
+            最新で無い値(stale)で登録したレコードは登録済としない（次回の実行で取得し直す）
+
+        Args:
+            location_list (list[str]): 観測地点名のリスト
+            target_date1 (str): 実測値の日付 "%Y-%m-%d"形式
+            target_date2 (str): 予報値の日付 "%Y-%m-%d"形式
+
+        Returns:
+            set[str]: 両方が登録済の観測地点名の集合
+        """
+        stmt = (
+            select(Weather.location)
+            .where(
+                Weather.location.in_(location_list),
+                or_(
+                    and_(Weather.target_date == target_date1, Weather.record_type == "actual"),
+                    and_(Weather.target_date == target_date2, Weather.record_type == "forecast"),
+                ),
+                Weather.is_stale.is_(False),
+            )
+            .group_by(Weather.location)
+            .having(func.count() == 2)
+        )
+        with self.engine.connect() as conn:
+            return set(conn.execute(stmt).scalars())
+
+    def is_perfect(self, target_date: str, record_type: str, location: str = "") -> bool:
+        """特定の地点・日付の結果or予測が "完璧な気候" かを取得する
 
         Note:
-            f"select * from Weather where record_type={record_type} and target_date={target_date}"
+            f"select * from Weather where record_type={record_type} and target_date={target_date}
+              and location={location}"
         """
-        result = False
-        Session = sessionmaker(bind=self.engine)
-        session = Session()
+        stmt = select(Weather.is_perfect).where(
+            Weather.location == location,
+            Weather.record_type == record_type,
+            Weather.target_date == target_date,
+        )
+        with self.engine.connect() as conn:
+            result = conn.execute(stmt).scalars().all()
 
-        records = (
-            session.query(Weather)
-            .filter(
-                and_(
-                    Weather.record_type == record_type,
-                    Weather.target_date == target_date,
-                )
+        if len(result) != 1:
+            return False
+        return result[0]
+
+    def build_perfect_days_stmt(
+        self,
+        start_date: str,
+        end_date: str,
+        location: str | None = None,
+        record_type: str = "actual",
+        base: dict | None = None,
+    ) -> Select:
+        """期間内の "完璧な気候" の日を検索する SELECT 文を返す
+
+        Notes:
+            期間での絞り込みは ix_weather_target_date（地点を指定した場合は ux_weather_key）で行い、
+            閾値の判定は絞り込んだ行に対して DB 上で行う
+
+        Args:
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
+            location (str | None): 観測地点名、None なら全地点
+            record_type (str): レコードタイプ ["actual", "forecast"]
+            base (dict | None): 判定の閾値辞書（一部のみ指定可）、None なら PW_BASE
+
+        Returns:
+            Select: Weather の WHERE 句まで組み立てた SELECT 文
+        """
+        condition_list = [
+            Weather.record_type == record_type,
+            Weather.target_date.between(start_date, end_date),
+            build_perfection_predicate(base),
+        ]
+        if location is not None:
+            condition_list.insert(0, Weather.location == location)
+        return select(Weather.__table__).where(*condition_list)
+
+    def select_perfect_days(
+        self,
+        start_date: str,
+        end_date: str,
+        location: str | None = None,
+        record_type: str = "actual",
+        base: dict | None = None,
+    ) -> list[dict]:
+        """期間内の "完璧な気候" の日のレコードを、指定の閾値で判定して取得する
+
+        Note:
+            f"select * from Weather where location = {location} and record_type = {record_type}
+              and target_date between {start_date} and {end_date} and ({predicate})
+              order by location, target_date"
+
+        Args:
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
+            location (str | None): 観測地点名、None なら全地点
+            record_type (str): レコードタイプ ["actual", "forecast"]
+            base (dict | None): 判定の閾値辞書（一部のみ指定可）、None なら PW_BASE
+
+        Returns:
+            list[dict]: SELECTしたレコードの辞書リスト
+        """
+        stmt = self.build_perfect_days_stmt(start_date, end_date, location, record_type, base)
+        stmt = stmt.order_by(Weather.location, Weather.target_date)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(stmt).mappings()]
+
+    def count_perfect_days(
+        self,
+        start_date: str,
+        end_date: str,
+        location: str | None = None,
+        record_type: str = "actual",
+        base: dict | None = None,
+    ) -> dict[str, int]:
+        """期間内の "完璧な気候" の日数を、指定の閾値で判定して地点ごとに数える
+
+        Note:
+            f"select location, count(*) from Weather where ... group by location"
+
+        Args:
+            select_perfect_days と同じ
+
+        Returns:
+            dict[str, int]: 観測地点名をキー、日数を値に持つ辞書（0日の地点は含まない）
+        """
+        stmt = self.build_perfect_days_stmt(start_date, end_date, location, record_type, base)
+        stmt = stmt.with_only_columns(Weather.location, func.count()).group_by(Weather.location)
+        with self.engine.connect() as conn:
+            return {location: count for location, count in conn.execute(stmt)}
+
+    def select_forecast_pairs(
+        self, start_date: str, end_date: str, columns: list[str], location: str | None = None
+    ) -> dict[str, list]:
+        """期間内の予報値と、同じ地点・日付の実測値の組を列ごとのリストで取得する
+
+        Notes:
+            予報値を期間で絞り込み、実測値を ux_weather_key で1つの JOIN で結合する（実測値の無い予報値は含まない）
+            NumPy でまとめて計算できるよう、レコードの辞書リストではなく列ごとのリストで返す
+            f"select f.location, f.target_date, f.{column} as forecast_{column}, a.{column} as actual_{column}, ...
+              from Weather f join Weather a on a.location = f.location and a.target_date = f.target_date
+              and a.record_type = 'actual'
+              where f.record_type = 'forecast' and f.target_date between {start_date} and {end_date}
+              order by f.location, f.target_date"
+
+        Args:
+            start_date (str): 期間の開始日 "%Y-%m-%d"形式
+            end_date (str): 期間の終了日 "%Y-%m-%d"形式（この日を含む）
+            columns (list[str]): 取得する Weather の列名のリスト
+            location (str | None): 観測地点名、None なら全地点
+
+        Returns:
+            dict[str, list]: "location", "target_date", "forecast_{列名}", "actual_{列名}" をキー、
+                             同じ長さのリストを値に持つ辞書
+        """
+        f = Weather.__table__.alias("forecast")
+        a = Weather.__table__.alias("actual")
+        stmt = (
+            select(
+                f.c.location,
+                f.c.target_date,
+                *[f.c[column].label(f"forecast_{column}") for column in columns],
+                *[a.c[column].label(f"actual_{column}") for column in columns],
+            )
+            .join(
+                a,
+                and_(a.c.location == f.c.location, a.c.target_date == f.c.target_date, a.c.record_type == "actual"),
             )
-            .all()
+            .where(f.c.record_type == "forecast", f.c.target_date.between(start_date, end_date))
+            .order_by(f.c.location, f.c.target_date)
+        )
+        if location is not None:
+            stmt = stmt.where(f.c.location == location)
+
+        with self.engine.connect() as conn:
+            result = conn.execute(stmt)
+            keys = list(result.keys())
+            row_list = result.all()
+        return (
+            {key: list(values) for key, values in zip(keys, zip(*row_list))} if row_list else {key: [] for key in keys}
         )
 
+    def rescore(self, base: dict) -> int:
+        """保存済の集計値から is_perfect を再判定する
+
+        Notes:
+            判定基準を SQL の条件式に変換し、1つの UPDATE 文で再判定する
+            criteria_version が現行の基準と異なるレコードのみを対象とする
+            f"update Weather set is_perfect = ({predicate}), criteria_version = {version}
+              where criteria_version != {version}"
+
+        Args:
+            base (dict): 判定の閾値辞書（Manager.PW_BASE と同じキーを持つ）
+
+        Returns:
+            int: 再判定したレコード数
+        """
+        version = criteria_version(base)
+        stmt = (
+            update(Weather)
+            .where(Weather.criteria_version != version)
+            .values(is_perfect=build_perfection_predicate(base), criteria_version=version)
+        )
+        with self.engine.begin() as conn:
+            count = conn.execute(stmt).rowcount
+            if count:
+                self.rebuild_monthly_stats(conn)
+                self.rebuild_streaks(conn)
+        self.write_count += 1
+        return count
+
+    def update_stats(self, conn: Connection, records: list[dict]) -> None:
+        """UPSERTしたレコードに関係する集計テーブルの行を更新する
+
+        Notes:
+            WeatherMonthlyStats は、レコードの (地点, 月) の組のみを集計し直す
+            （1地点・1か月あたり高々 31日 × 2行の集計のため、記録済の期間の長さによらない）
+            WeatherStreak は、記録済の最新の実測値より後の日付の実測値のみであれば、保存済の連続日数に加算する
+            過去の日付の実測値を登録し直した場合（replay, backfill 等）は、その地点のみ集計し直す
+
+        Args:
+            conn (Connection): UPSERTを実行したトランザクションの接続
+            records (list[dict]): UPSERTしたレコードの辞書リスト
+        """
         if not records:
-            return False
-        if len(records) != 1:
-            return False
-        result = records[0].is_perfect
+            return
 
-        session.commit()
-        session.close()
+        self.rebuild_monthly_stats(conn, sorted({(r["location"], r["target_date"][:7]) for r in records}))
 
-        return result
+        # 地点ごとに、実測値の (日付, is_perfect) を日付順に並べる
+        actual_dict: dict[str, list[tuple[str, bool]]] = {}
+        for r in records:
+            if r["record_type"] == "actual":
+                actual_dict.setdefault(r["location"], []).append((r["target_date"], r["is_perfect"]))
+        if not actual_dict:
+            return
+
+        table = WeatherStreak.__table__
+        stmt = select(table).where(table.c.location.in_(list(actual_dict)))
+        streak_dict = {row.location: row for row in conn.execute(stmt)}
+
+        value_list = []
+        rebuild_list = []
+        for location, day_list in actual_dict.items():
+            if location not in streak_dict:
+                rebuild_list.append(location)
+                continue
+            streak = streak_dict[location]
+            last_date = streak.last_date
+            current = streak.current_streak
+            longest, longest_end_date = streak.longest_streak, streak.longest_streak_end_date
+            for target_date, is_perfect in sorted(day_list):
+                if target_date <= last_date:
+                    # 過去の日付を登録し直した場合は加算では求まらない
+                    rebuild_list.append(location)
+                    break
+                if date.fromisoformat(target_date) - date.fromisoformat(last_date) != timedelta(days=1):
+                    current = 0
+                current = current + 1 if is_perfect else 0
+                if current > 0 and current >= longest:
+                    longest, longest_end_date = current, target_date
+                last_date = target_date
+            else:
+                value_list.append({
+                    "location": location,
+                    "last_date": last_date,
+                    "current_streak": current,
+                    "longest_streak": longest,
+                    "longest_streak_end_date": longest_end_date,
+                })
+
+        if value_list:
+            stmt = sqlite_insert(WeatherStreak)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["location"],
+                set_={c: stmt.excluded[c] for c in value_list[0] if c != "location"},
+            )
+            conn.execute(stmt, value_list)
+        if rebuild_list:
+            self.rebuild_streaks(conn, rebuild_list)
+
+    def rebuild_monthly_stats(self, conn: Connection, key_list: list[tuple[str, str]] | None = None) -> None:
+        """Weather から WeatherMonthlyStats を集計し直す
+
+        Args:
+            conn (Connection): 実行するトランザクションの接続
+            key_list (list[tuple[str, str]] | None): 対象の (観測地点名, 月 "%Y-%m") のリスト、None なら全体
+        """
+        if key_list is None:
+            for stmt in self.monthly_stats_stmt[False]:
+                conn.execute(stmt)
+            return
+        for key_chunk in chunked(key_list, WeatherDBController.STATS_KEY_CHUNK_SIZE):
+            month_list = [month for _, month in key_chunk]
+            params = {
+                "key_list": list(key_chunk),
+                "location_list": sorted({location for location, _ in key_chunk}),
+                "start_month": min(month_list),
+                "end_month": max(month_list),
+            }
+            for stmt in self.monthly_stats_stmt[True]:
+                conn.execute(stmt, params)
+
+    def rebuild_streaks(self, conn: Connection, location_list: list[str] | None = None) -> None:
+        """Weather から WeatherStreak を集計し直す
+
+        Args:
+            conn (Connection): 実行するトランザクションの接続
+            location_list (list[str] | None): 対象の観測地点名のリスト、None なら全地点
+        """
+        if location_list is None:
+            for stmt in self.streak_stmt[False]:
+                conn.execute(stmt)
+            return
+        for location_chunk in chunked(location_list, WeatherDBController.STATS_KEY_CHUNK_SIZE):
+            for stmt in self.streak_stmt[True]:
+                conn.execute(stmt, {"location_list": list(location_chunk)})
+
+    def rebuild_stats(self) -> int:
+        """全レコードから集計テーブルを作り直す
+
+        Returns:
+            int: 集計した地点・月の数
+        """
+        with self.engine.begin() as conn:
+            self.rebuild_monthly_stats(conn)
+            self.rebuild_streaks(conn)
+            return conn.execute(select(func.count()).select_from(WeatherMonthlyStats)).scalar()
+
+    def select_monthly_stats(
+        self, location: str, start_month: str | None = None, end_month: str | None = None
+    ) -> list[dict]:
+        """地点の月ごとの集計を取得する
+
+        Note:
+            f"select * from WeatherMonthlyStats where location = {location}
+              and month between {start_month} and {end_month} order by month"
+
+        Args:
+            location (str): 観測地点名
+            start_month (str | None): 開始月 "%Y-%m"形式、None なら最初から
+            end_month (str | None): 終了月 "%Y-%m"形式（この月を含む）、None なら最後まで
+
+        Returns:
+            list[dict]: 集計の辞書リスト、以下の割合を付加する（分母が0なら None）
+                "actual_perfect_rate": 実測値が "完璧な気候" だった日の割合
+                "forecast_accuracy": 予報の is_perfect が実測と一致した日の割合
+        """
+        stats = WeatherMonthlyStats.__table__
+        stmt = select(stats).where(stats.c.location == location)
+        if start_month is not None:
+            stmt = stmt.where(stats.c.month >= start_month)
+        if end_month is not None:
+            stmt = stmt.where(stats.c.month <= end_month)
+        with self.engine.connect() as conn:
+            row_list = [dict(row) for row in conn.execute(stmt.order_by(stats.c.month)).mappings()]
+
+        for row in row_list:
+            paired = row["forecast_tp"] + row["forecast_fp"] + row["forecast_fn"] + row["forecast_tn"]
+            row["actual_perfect_rate"] = (
+                row["actual_perfect_days"] / row["actual_days"] if row["actual_days"] else None
+            )
+            row["forecast_accuracy"] = (row["forecast_tp"] + row["forecast_tn"]) / paired if paired else None
+        return row_list
+
+    def select_streak(self, location: str) -> dict | None:
+        """地点の "完璧な気候" の連続日数を取得する
+
+        Note:
+            f"select * from WeatherStreak where location = {location}"
+
+        Args:
+            location (str): 観測地点名
+
+        Returns:
+            dict | None: 連続日数の辞書、実測値が未登録の地点なら None
+        """
+        table = WeatherStreak.__table__
+        with self.engine.connect() as conn:
+            row = conn.execute(select(table).where(table.c.location == location)).mappings().first()
+        return dict(row) if row else None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,289 @@
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import flatbuffers
+import numpy as np
+from openmeteo_sdk.Variable import Variable
+
+from we_wish_the_perfect_weather.model import Weather
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+# 合成データの基準日と乱数シード（同じ引数なら常に同じデータを生成する）
+BASE_DATE = date(2025, 6, 1)
+SEED = 4869
+UTC_OFFSET_SECONDS = 9 * 3600  # Asia/Tokyo
+
+# OpenMeteoFetcher.HOURLY_VARIABLES と同じ並び
+OPEN_METEO_VARIABLES = [
+    Variable.temperature,
+    Variable.relative_humidity,
+    Variable.precipitation,
+    Variable.precipitation_probability,
+    Variable.wind_speed,
+]
+
+
+def get_locations(n_locations: int) -> list[dict]:
+    """合成用の観測地点辞書のリストを返す（util.get_locations の返り値と同じ形式）"""
+    return [
+        {
+            "name": f"location_{i:05d}",
+            "latitude": 20.0 + (i % 200) * 0.1,
+            "longitude": 120.0 + (i // 200) * 0.1,
+            "citycode": f"{13101 + i % 100}",
+            "timezone": "Asia/Tokyo",
+        }
+        for i in range(n_locations)
+    ]
+
+
+def build_hourly_values(n_hours: int, rng: np.random.Generator) -> list[np.ndarray]:
+    """OPEN_METEO_VARIABLES の並びで、1時間ごとの合成値を返す"""
+    return [
+        rng.uniform(15.0, 30.0, n_hours).astype(np.float32),
+        rng.uniform(30.0, 80.0, n_hours).round().astype(np.float32),
+        rng.choice(np.array([0.0, 0.0, 0.0, 0.5], dtype=np.float32), n_hours),
+        rng.integers(0, 30, n_hours).astype(np.float32),
+        rng.uniform(0.0, 15.0, n_hours).astype(np.float32),
+    ]
+
+
+def build_weather_api_response(location_id: int, start: int, values: list[np.ndarray]) -> bytes:
+    """1地点分の WeatherApiResponse を FlatBuffers でシリアライズする
+
+    Notes:
+        openmeteo_sdk は読み出し用のクラスしか提供していないため、
+        benchmark で参照するフィールドのみスキーマのスロット番号を直接指定して組み立てる
+        WeatherApiResponse: location_id(4), utc_offset_seconds(6), hourly(11)
+        VariablesWithTime: time(0), time_end(1), interval(2), variables(3)
+        VariableWithValues: variable(0), values(3)
+
+    Args:
+        location_id (int): リクエストした地点の並びでのインデックス
+        start (int): 最初の時刻 (unixtime)
+        values (list[np.ndarray]): OPEN_METEO_VARIABLES の並びの float32 配列のリスト
+
+    Returns:
+        bytes: シリアライズしたバッファ（長さのプレフィックスは含まない）
+    """
+    builder = flatbuffers.Builder(1024)
+    variable_offset_list = []
+    for variable, array in zip(OPEN_METEO_VARIABLES, values):
+        values_offset = builder.CreateNumpyVector(array)
+        builder.StartObject(4)
+        builder.PrependUOffsetTRelativeSlot(3, values_offset, 0)
+        builder.PrependUint8Slot(0, variable, 0)
+        variable_offset_list.append(builder.EndObject())
+
+    builder.StartVector(4, len(variable_offset_list), 4)
+    for variable_offset in reversed(variable_offset_list):
+        builder.PrependUOffsetTRelative(variable_offset)
+    variables_offset = builder.EndVector()
+
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + 3600 * len(values[0]), 0)
+    builder.PrependInt32Slot(2, 3600, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variables_offset, 0)
+    hourly_offset = builder.EndObject()
+
+    builder.StartObject(12)
+    builder.PrependInt64Slot(4, location_id, 0)
+    builder.PrependInt32Slot(6, UTC_OFFSET_SECONDS, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly_offset, 0)
+    builder.Finish(builder.EndObject())
+    return bytes(builder.Output())
+
+
+def build_open_meteo_payload(n_locations: int, n_days: int = 3, seed: int = SEED) -> bytes:
+    """n_locations 地点分のレスポンスボディを返す
+
+    Notes:
+        API と同じく、各地点のメッセージの前に4バイトのリトルエンディアンで長さを付けて連結する
+        既定の n_days=3 は OpenMeteoFetcher.api_params の past_days=1, forecast_days=2 に相当する
+
+    Args:
+        n_locations (int): 地点数
+        n_days (int): 日数
+        seed (int): 乱数シード
+
+    Returns:
+        bytes: format=flatbuffers のレスポンスボディ
+    """
+    rng = np.random.default_rng(seed)
+    start_at = datetime.combine(BASE_DATE - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    start = int(start_at.timestamp()) - UTC_OFFSET_SECONDS
+    payload = bytearray()
+    for location_id in range(n_locations):
+        message = build_weather_api_response(location_id, start, build_hourly_values(n_days * 24, rng))
+        payload += len(message).to_bytes(4, byteorder="little")
+        payload += message
+    return bytes(payload)
+
+
+class PayloadResponse:
+    """openmeteo_requests.Client が参照する範囲のみを持つ HTTP レスポンス"""
+
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self) -> None:
+        return None
+
+
+class PayloadSession:
+    """リクエストした地点数分の合成レスポンスを返す HTTP セッション
+
+    Notes:
+        openmeteo_requests.Client(session=PayloadSession()) として使い、
+        ネットワークを介さずに FlatBuffers の解釈以降を計測する
+        地点数ごとのレスポンスボディは初回に生成して使い回す
+    """
+
+    def __init__(self, n_days: int = 3, seed: int = SEED):
+        self.n_days = n_days
+        self.seed = seed
+        self.payload_dict: dict[int, bytes] = {}
+
+    def get(self, url: str, params: dict, **kwargs) -> PayloadResponse:
+        n_locations = len(str(params["latitude"]).split(","))
+        if n_locations not in self.payload_dict:
+            self.payload_dict[n_locations] = build_open_meteo_payload(n_locations, self.n_days, self.seed)
+        return PayloadResponse(self.payload_dict[n_locations])
+
+
+def build_pollen_csv(n_days: int, citycode: str = "13104", seed: int = SEED) -> str:
+    """花粉飛散数APIと同じ形式の csv を返す
+
+    Args:
+        n_days (int): 日数（1日あたり24行）
+        citycode (str): 市区町村コード
+        seed (int): 乱数シード
+
+    Returns:
+        str: "citycode,date,pollen" 形式の csv 文字列
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime.combine(BASE_DATE - timedelta(days=n_days - 1), datetime.min.time())
+    pollen_count_list = rng.integers(0, 50, n_days * 24).tolist()
+    line_list = ["citycode,date,pollen"]
+    for i, pollen_count in enumerate(pollen_count_list):
+        # 各時刻はその時刻までの1時間の値を表す
+        time_at = start + timedelta(hours=i + 1)
+        line_list.append(f"{citycode},{time_at.isoformat()}+09:00,{pollen_count}")
+    return "\n".join(line_list) + "\n"
+
+
+def build_records(n_records: int, start_index: int = 0, n_days: int = 365, seed: int = SEED) -> list[dict]:
+    """WeatherDBController.upsert_many に渡すレコード辞書のリストを返す
+
+    Notes:
+        地点ごとに n_days 日 × ["actual", "forecast"] のレコードを並べた通し番号で、
+        start_index 番目から n_records 件を返す
+
+    Args:
+        n_records (int): レコード数
+        start_index (int): 先頭のレコードの通し番号
+        n_days (int): 1地点あたりの日数
+        seed (int): 乱数シード
+
+    Returns:
+        list[dict]: レコード辞書のリスト
+    """
+    rng = np.random.default_rng([seed, start_index])
+    maximum_temperature = rng.uniform(15.0, 32.0, n_records).round(1).tolist()
+    minimum_temperature = rng.uniform(10.0, 22.0, n_records).round(1).tolist()
+    maximum_humidity = rng.integers(40, 95, n_records).tolist()
+    minimum_humidity = rng.integers(20, 60, n_records).tolist()
+    maximum_precipitation_probability = rng.integers(0, 100, n_records).tolist()
+    maximum_precipitation = rng.choice([0.0, 0.0, 0.5, 2.0], n_records).tolist()
+    maximum_wind_speed = rng.uniform(0.0, 8.0, n_records).round(1).tolist()
+    maximum_pollen_count = rng.integers(0, 50, n_records).tolist()
+    is_perfect = (rng.random(n_records) < 0.05).tolist()
+
+    record_type_list = ["actual", "forecast"]
+    start = BASE_DATE - timedelta(days=n_days - 1)
+    date_list = [(start + timedelta(days=i)).isoformat() for i in range(n_days)]
+    per_location = n_days * len(record_type_list)
+
+    record_list = []
+    for i in range(n_records):
+        location_index, j = divmod(start_index + i, per_location)
+        day_index, record_type_index = divmod(j, len(record_type_list))
+        record_list.append({
+            "location": f"location_{location_index:05d}",
+            "target_date": date_list[day_index],
+            "record_type": record_type_list[record_type_index],
+            "is_perfect": is_perfect[i],
+            "maximum_temperature": maximum_temperature[i],
+            "minimum_temperature": minimum_temperature[i],
+            "maximum_humidity": maximum_humidity[i],
+            "minimum_humidity": minimum_humidity[i],
+            "maximum_precipitation_probability": maximum_precipitation_probability[i],
+            "maximum_precipitation": maximum_precipitation[i],
+            "maximum_wind_speed": maximum_wind_speed[i],
+            "maximum_pollen_count": maximum_pollen_count[i],
+            "registered_at": f"{date_list[day_index]} 07:00:00",
+            "criteria_version": "",
+            "is_stale": False,
+        })
+    return record_list
+
+
+def build_weather_db(db_fullpath: Path, n_rows: int, seed: int = SEED) -> Path:
+    """n_rows 件のレコードを持つDBを作成する
+
+    Notes:
+        スキーマは WeatherDBController で作成し、データは件数が多い場合（~10M）でも
+        短時間で作れるよう標準ライブラリの sqlite3 で分割して executemany する
+        集計テーブルは最後にまとめて作り直す
+        同じパスに作成済のDBがあり件数が一致する場合はそのまま使う
+
+    Args:
+        db_fullpath (Path): 作成するDBのパス
+        n_rows (int): レコード数
+        seed (int): 乱数シード
+
+    Returns:
+        Path: 作成したDBのパス
+    """
+    db_fullpath = Path(db_fullpath)
+    if db_fullpath.exists():
+        with sqlite3.connect(db_fullpath) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM Weather").fetchone()
+        conn.close()
+        if count == n_rows:
+            return db_fullpath
+        db_fullpath.unlink()
+
+    db_fullpath.parent.mkdir(parents=True, exist_ok=True)
+    WeatherDBController(db_fullpath).engine.dispose()
+
+    columns = [c.name for c in Weather.__table__.columns if c.name != "id"]
+    query = f"INSERT INTO Weather ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    chunk_size = 100_000
+    conn = sqlite3.connect(db_fullpath)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        for offset in range(0, n_rows, chunk_size):
+            record_list = build_records(min(chunk_size, n_rows - offset), start_index=offset, seed=seed)
+            conn.executemany(query, [tuple(record[c] for c in columns) for record in record_list])
+            conn.commit()
+    finally:
+        conn.close()
+
+    weather_db = WeatherDBController(db_fullpath)
+    weather_db.rebuild_stats()
+    weather_db.engine.dispose()
+    return db_fullpath
+
+
+if __name__ == "__main__":
+    payload = build_open_meteo_payload(2)
+    print(len(payload))
+    print(build_pollen_csv(1)[:200])
+    print(build_records(3))
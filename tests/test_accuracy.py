@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.fixtures import build_records
+from we_wish_the_perfect_weather.accuracy import ACCURACY_COLUMNS, ForecastAccuracy, evaluate_accuracy
+from we_wish_the_perfect_weather.criteria import MISSING_VALUE
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+
+class TestEvaluateAccuracy(unittest.TestCase):
+    def build_pairs(self, row_list: list[tuple]) -> dict[str, list]:
+        """(地点, 予報の最高気温, 実測の最高気温, 予報の is_perfect, 実測の is_perfect) のリストから組を作る"""
+        pairs = {
+            "location": [row[0] for row in row_list],
+            "forecast_is_perfect": [row[3] for row in row_list],
+            "actual_is_perfect": [row[4] for row in row_list],
+        }
+        for column in ACCURACY_COLUMNS:
+            pairs[f"forecast_{column}"] = [row[1] if column == "maximum_temperature" else 0 for row in row_list]
+            pairs[f"actual_{column}"] = [row[2] if column == "maximum_temperature" else 0 for row in row_list]
+        return pairs
+
+    def test_evaluate_accuracy(self):
+        pairs = self.build_pairs([
+            ("tokyo", 25.0, 24.0, True, True),
+            ("tokyo", 20.0, 23.0, True, False),
+            ("osaka", 30.0, 30.0, False, True),
+            ("osaka", MISSING_VALUE, 28.0, False, False),
+            ("osaka", 26.0, 24.0, False, False),
+        ])
+        result = evaluate_accuracy(pairs)
+
+        self.assertEqual(result["n_pairs"], 5)
+        # 欠測値を含む組は誤差の評価から除く（誤差: +1, -3, 0, +2）
+        field = result["fields"]["maximum_temperature"]
+        self.assertEqual(field["n"], 4)
+        self.assertAlmostEqual(field["bias"], 0.0)
+        self.assertAlmostEqual(field["mae"], 1.5)
+        self.assertAlmostEqual(field["rmse"], (14 / 4) ** 0.5)
+        self.assertAlmostEqual(field["max_abs_error"], 3.0)
+        self.assertEqual(result["fields"]["minimum_humidity"]["mae"], 0.0)
+
+        self.assertEqual(
+            result["perfection"],
+            {"tp": 1, "fp": 1, "fn": 1, "tn": 2, "precision": 0.5, "recall": 0.5, "accuracy": 0.6},
+        )
+        tokyo = result["locations"]["tokyo"]
+        self.assertEqual(tokyo["n_pairs"], 2)
+        self.assertEqual(tokyo["fields"]["maximum_temperature"], {"n": 2, "bias": -1.0, "mae": 2.0})
+        osaka = result["locations"]["osaka"]
+        self.assertEqual(osaka["fields"]["maximum_temperature"], {"n": 2, "bias": 1.0, "mae": 1.0})
+        # 予報が "完璧な気候" だった日が無い地点の適合率は None
+        self.assertEqual(osaka["perfection"]["precision"], None)
+        self.assertEqual(osaka["perfection"]["recall"], 0.0)
+
+    def test_empty(self):
+        result = evaluate_accuracy(self.build_pairs([]))
+        self.assertEqual(result["n_pairs"], 0)
+        self.assertEqual(result["fields"]["maximum_temperature"]["mae"], None)
+        self.assertEqual(result["perfection"]["accuracy"], None)
+        self.assertEqual(result["locations"], {})
+
+
+class TestForecastAccuracy(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.weather_db = WeatherDBController(Path(self.tmp_dir.name) / "PW_DB.db")
+        # 2地点 × 30日分、予報値と実測値がそろった組
+        self.weather_db.upsert_many(build_records(2 * 60, n_days=30))
+        self.accuracy = ForecastAccuracy(self.weather_db)
+
+    def tearDown(self):
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_evaluate(self):
+        result = self.accuracy.evaluate("2025-05-01", "2025-06-01")
+        self.assertEqual(
+            (result["start_date"], result["end_date"], result["location"]), ("2025-05-01", "2025-06-01", None)
+        )
+        self.assertEqual(result["n_pairs"], 2 * 30)
+        self.assertEqual(set(result["locations"]), {"location_00000", "location_00001"})
+        result = self.accuracy.evaluate("2025-05-10", "2025-05-19", "location_00001")
+        self.assertEqual((result["n_pairs"], list(result["locations"])), (10, ["location_00001"]))
+
+    def test_cache(self):
+        result = self.accuracy.evaluate("2025-05-01", "2025-06-01")
+        self.assertIs(self.accuracy.evaluate("2025-05-01", "2025-06-01"), result)
+
+        # このプロセスから書き込んだ場合は計算し直す
+        record = build_records(1, n_days=30)[0] | {"is_perfect": True, "maximum_temperature": 99.0}
+        self.weather_db.upsert(record)
+        updated = self.accuracy.evaluate("2025-05-01", "2025-06-01")
+        self.assertIsNot(updated, result)
+        self.assertNotEqual(updated["fields"]["maximum_temperature"], result["fields"]["maximum_temperature"])
+
+        self.accuracy.clear()
+        self.assertIsNot(self.accuracy.evaluate("2025-05-01", "2025-06-01"), updated)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from tests.fixtures import UTC_OFFSET_SECONDS, build_weather_api_response
+from we_wish_the_perfect_weather.backfill import Backfiller
+from we_wish_the_perfect_weather.criteria import PW_BASE
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Open-Meteo の archive API のスタブ
+
+    Notes:
+        リクエストした地点数・期間分の、OpenMeteoArchiveFetcher.HOURLY_VARIABLES の並びの一定値を返す
+        受け取ったリクエストのクエリパラメータを request_list に残す
+    """
+
+    request_list: list[dict] = []
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlsplit(self.path).query).items()}
+        ArchiveHandler.request_list.append(params)
+        start_date, end_date = date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"])
+        n_hours = ((end_date - start_date).days + 1) * 24
+        start_at = datetime.combine(start_date, datetime.min.time(), tzinfo=timezone.utc)
+        start = int(start_at.timestamp()) - UTC_OFFSET_SECONDS
+        # 気温, 湿度, 降水量, 風速[km/h]
+        values = [np.full(n_hours, value, dtype=np.float32) for value in [20.0, 50.0, 0.0, 3.6]]
+
+        body = bytearray()
+        for location_id in range(len(params["latitude"].split(","))):
+            message = build_weather_api_response(location_id, start, values)
+            body += len(message).to_bytes(4, byteorder="little") + message
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return None
+
+
+class TestBackfiller(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        ArchiveHandler.request_list = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.weather_db = WeatherDBController(self.tmp_path / "PW_DB.db")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def build_backfiller(self, cache_name: str) -> Backfiller:
+        """3地点を2地点ずつ取得する Backfiller を返す（cache_name ごとに別の HTTP キャッシュを使う）"""
+        config = {
+            "locations": [{"name": name, "latitude": str(35 + i), "longitude": "139"} for i, name in enumerate("abc")],
+            "open_meteo": {
+                "archive_url": f"http://127.0.0.1:{self.server.server_port}/v1/archive",
+                "chunk_size": 2,
+            },
+            "cache": {"path": str(self.tmp_path / f"{cache_name}.db")},
+            "circuit_breaker": {"path": str(self.tmp_path / "circuit_breaker.db")},
+            "db": {"save_path": str(self.tmp_path), "save_file_name": "PW_DB.db", "is_store_hourly": True},
+        }
+        return Backfiller(config, self.weather_db, PW_BASE, "2025-03-01 00:00:00")
+
+    def select_rows(self) -> list[tuple]:
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            row_list = conn.execute(
+                "SELECT location, target_date, record_type, registered_at FROM Weather ORDER BY location, target_date"
+            ).fetchall()
+        conn.close()
+        return row_list
+
+    def test_chunking(self):
+        count = self.build_backfiller("cache").run("2025-01-30", "2025-02-02")
+        self.assertEqual(count, 3 * 4)
+
+        # 月ごと × 2地点ずつに分割して取得する
+        request_list = [
+            (r["start_date"], r["end_date"], len(r["latitude"].split(","))) for r in ArchiveHandler.request_list
+        ]
+        self.assertEqual(
+            request_list,
+            [
+                ("2025-01-30", "2025-01-31", 2),
+                ("2025-01-30", "2025-01-31", 1),
+                ("2025-02-01", "2025-02-02", 2),
+                ("2025-02-01", "2025-02-02", 1),
+            ],
+        )
+        row_list = self.select_rows()
+        self.assertEqual(len(row_list), 3 * 4)
+        self.assertEqual({row[2] for row in row_list}, {"actual"})
+        self.assertEqual(row_list[0][:2], ("a", "2025-01-30"))
+        self.assertEqual(row_list[-1][:2], ("c", "2025-02-02"))
+
+    def test_resume_and_rerun(self):
+        # 1か月目の途中（最初のチャンク）まで記録した後に中断した状態を作る
+        backfiller = self.build_backfiller("cache_first")
+        backfiller.fetcher.set_date_range("2025-01-30", "2025-01-31")
+        self.assertEqual(backfiller.backfill_chunk(backfiller.locations[:2], "2025-01-30", "2025-01-31"), 2 * 2)
+
+        # 再実行すると、記録済のチャンクは取得せずに続きから記録する（キャッシュを分けてDBのみで判断させる）
+        ArchiveHandler.request_list = []
+        count = self.build_backfiller("cache_second").run("2025-01-30", "2025-02-02")
+        self.assertEqual(count, 3 * 4 - 2 * 2)
+        self.assertEqual(
+            [(r["start_date"], r["latitude"]) for r in ArchiveHandler.request_list],
+            [("2025-01-30", "37.0"), ("2025-02-01", "35.0,36.0"), ("2025-02-01", "37.0")],
+        )
+        row_list = self.select_rows()
+        self.assertEqual(len(row_list), 3 * 4)
+
+        # 記録済の期間を再実行しても、取得も書き込みもしない
+        ArchiveHandler.request_list = []
+        self.assertEqual(self.build_backfiller("cache_third").run("2025-01-30", "2025-02-02"), 0)
+        self.assertEqual(ArchiveHandler.request_list, [])
+        self.assertEqual(self.select_rows(), row_list)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from we_wish_the_perfect_weather.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+ENDPOINT = "https://example.com/api"
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "circuit_breaker.db"
+        self.breaker = CircuitBreaker(self.path, failure_threshold=3, reset_timeout=0.2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_after_consecutive_failures(self):
+        self.assertEqual(self.breaker.state(ENDPOINT), CLOSED)
+        for _ in range(2):
+            self.breaker.record_failure(ENDPOINT)
+        self.assertEqual(self.breaker.state(ENDPOINT), CLOSED)
+        self.assertTrue(self.breaker.allow_request(ENDPOINT))
+
+        # 成功すると連続失敗回数は数え直す
+        self.breaker.record_success(ENDPOINT)
+        for _ in range(2):
+            self.breaker.record_failure(ENDPOINT)
+        self.assertEqual(self.breaker.state(ENDPOINT), CLOSED)
+        self.breaker.record_failure(ENDPOINT)
+        self.assertEqual(self.breaker.state(ENDPOINT), OPEN)
+        self.assertFalse(self.breaker.allow_request(ENDPOINT))
+        # 他のエンドポイントには影響しない
+        self.assertTrue(self.breaker.allow_request("https://example.com/other"))
+
+    def test_half_open_probe(self):
+        for _ in range(3):
+            self.breaker.record_failure(ENDPOINT)
+        time.sleep(0.3)
+
+        # reset_timeout 秒経ったら1つだけ試行を通す
+        self.assertTrue(self.breaker.allow_request(ENDPOINT))
+        self.assertEqual(self.breaker.state(ENDPOINT), HALF_OPEN)
+        self.assertFalse(self.breaker.allow_request(ENDPOINT))
+
+        # 試行が失敗したら open に戻す
+        self.breaker.record_failure(ENDPOINT)
+        self.assertEqual(self.breaker.state(ENDPOINT), OPEN)
+        self.assertFalse(self.breaker.allow_request(ENDPOINT))
+
+        # 試行が成功したら closed に戻す
+        time.sleep(0.3)
+        self.assertTrue(self.breaker.allow_request(ENDPOINT))
+        self.breaker.record_success(ENDPOINT)
+        self.assertEqual(self.breaker.state(ENDPOINT), CLOSED)
+        self.assertTrue(self.breaker.allow_request(ENDPOINT))
+
+    def test_late_failure_keeps_open_time(self):
+        for _ in range(3):
+            self.breaker.record_failure(ENDPOINT)
+        time.sleep(0.3)
+        # open にする前に送信したリクエストの失敗は、試行を通すまでの時間を延ばさない
+        self.breaker.record_failure(ENDPOINT)
+        self.assertTrue(self.breaker.allow_request(ENDPOINT))
+
+    def test_shared_between_instances(self):
+        # 状態はディスクに保存し、別のインスタンス（プロセス）と共有する
+        for _ in range(3):
+            self.breaker.record_failure(ENDPOINT)
+        other = CircuitBreaker(self.path, failure_threshold=3, reset_timeout=0.2)
+        self.assertEqual(other.state(ENDPOINT), OPEN)
+        self.assertFalse(other.allow_request(ENDPOINT))
+
+    def test_unavailable_store(self):
+        # 状態を保存できない場合は、ブレーカーが無い場合と同じくリクエストを通す
+        (Path(self.tmp_dir.name) / "file").write_text("")
+        with self.assertLogs("we_wish_the_perfect_weather.circuit_breaker", "WARNING"):
+            breaker = CircuitBreaker(Path(self.tmp_dir.name) / "file" / "circuit_breaker.db", failure_threshold=1)
+            breaker.record_failure(ENDPOINT)
+            self.assertTrue(breaker.allow_request(ENDPOINT))
+            self.assertEqual(breaker.state(ENDPOINT), CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from tests.fixtures import build_records
+from we_wish_the_perfect_weather.criteria import CRITERIA_COLUMNS, MISSING_VALUE, PW_BASE, evaluate_perfection
+from we_wish_the_perfect_weather.criteria import evaluate_perfection_one
+
+
+class TestEvaluatePerfection(unittest.TestCase):
+    def test_one_matches_batch(self):
+        record_list = [record | {"is_stale": False} for record in build_records(1000)]
+        # 境界値と欠測値のレコードも含める
+        boundary = {column: PW_BASE[column] for column in CRITERIA_COLUMNS} | {"is_stale": False}
+        record_list.append(boundary)
+        record_list.append(boundary | {"maximum_pollen_count": MISSING_VALUE})
+        record_list.append(boundary | {"maximum_pollen_count": MISSING_VALUE, "is_stale": True})
+        record_list.append(boundary | {"minimum_humidity": MISSING_VALUE, "is_stale": True})
+        record_list.append(boundary | {"maximum_precipitation": float("nan")})
+
+        columns = {column: [record[column] for record in record_list] for column in [*CRITERIA_COLUMNS, "is_stale"]}
+        check_matrix, _ = evaluate_perfection(columns, PW_BASE)
+        self.assertEqual([evaluate_perfection_one(record, PW_BASE) for record in record_list], check_matrix.tolist())
+
+    def test_missing_value(self):
+        record = {
+            "maximum_temperature": 25.0,
+            "minimum_temperature": 20.0,
+            "maximum_humidity": 60,
+            "minimum_humidity": 45,
+            "maximum_precipitation_probability": 0,
+            "maximum_precipitation": 0.0,
+            "maximum_wind_speed": 1.0,
+            "maximum_pollen_count": MISSING_VALUE,
+        }
+        # 取得元が提供しない値（明日の花粉飛散数など）の基準は判定しない
+        self.assertEqual(evaluate_perfection_one(record, PW_BASE), [True] * 8)
+        self.assertEqual(evaluate_perfection_one(record | {"is_stale": False}, PW_BASE), [True] * 8)
+        # 取得に失敗した値の基準は満たさない
+        self.assertEqual(evaluate_perfection_one(record | {"is_stale": True}, PW_BASE), [True] * 7 + [False])
+
+
+if __name__ == "__main__":
+    unittest.main()
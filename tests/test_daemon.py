@@ -0,0 +1,116 @@
+import signal
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from we_wish_the_perfect_weather.daemon import Daemon
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.util import Result
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        config = {
+            "locations": [
+                {"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "timezone": "Asia/Tokyo"},
+                {"name": "osaka", "latitude": "34.6937", "longitude": "135.5023", "timezone": "Asia/Tokyo"},
+                {"name": "new_york", "latitude": "40.7128", "longitude": "-74.0060", "timezone": "America/New_York"},
+            ],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+            "db": {"save_path": str(tmp_path), "save_file_name": "PW_DB.db"},
+            "daemon": {"run_times": ["07:00", "13:00"], "poll_interval": 0.05},
+        }
+        self.manager = Manager(config)
+        # Manager.run の呼び出しを (地点名のリスト, 基準日時) として記録する
+        self.call_list = []
+        self.manager.run = self.record_run
+        self.daemon = Daemon(self.manager)
+        # run_forever が設定するシグナルハンドラを元に戻す
+        self.handler_dict = {signum: signal.getsignal(signum) for signum in [signal.SIGTERM, signal.SIGINT]}
+
+    def record_run(self, locations: list[dict], now: datetime) -> Result:
+        self.call_list.append(([location["name"] for location in locations], now))
+        return Result.success
+
+    def tearDown(self):
+        for signum, handler in self.handler_dict.items():
+            signal.signal(signum, handler)
+        self.tmp_dir.cleanup()
+
+    def test_location_dict(self):
+        self.assertEqual(
+            {
+                timezone: [location["name"] for location in locations]
+                for timezone, locations in self.daemon.location_dict.items()
+            },
+            {"Asia/Tokyo": ["tokyo", "osaka"], "America/New_York": ["new_york"]},
+        )
+        self.assertEqual(self.daemon.poll_interval, 0.05)
+
+    def test_get_next_run_at(self):
+        tz = ZoneInfo("Asia/Tokyo")
+        for now, expected in [
+            (datetime(2025, 6, 1, 6, 59, tzinfo=tz), datetime(2025, 6, 1, 7, 0, tzinfo=tz)),
+            (datetime(2025, 6, 1, 7, 0, tzinfo=tz), datetime(2025, 6, 1, 13, 0, tzinfo=tz)),
+            (datetime(2025, 6, 1, 13, 0, tzinfo=tz), datetime(2025, 6, 2, 7, 0, tzinfo=tz)),
+            (datetime(2025, 12, 31, 23, 0, tzinfo=tz), datetime(2026, 1, 1, 7, 0, tzinfo=tz)),
+        ]:
+            self.assertEqual(self.daemon.get_next_run_at("Asia/Tokyo", now), expected)
+
+        # 基準日時のタイムゾーンによらず、地点の現地時刻で次の実行日時を返す
+        next_run_at = self.daemon.get_next_run_at("America/New_York", datetime(2025, 6, 1, 21, 0, tzinfo=tz))
+        self.assertEqual(next_run_at, datetime(2025, 6, 1, 13, 0, tzinfo=ZoneInfo("America/New_York")))
+        # 夏時間の切り替え日も現地時刻の 07:00 とする
+        next_run_at = self.daemon.get_next_run_at(
+            "America/New_York", datetime(2025, 3, 9, 1, 0, tzinfo=ZoneInfo("America/New_York"))
+        )
+        self.assertEqual(next_run_at.isoformat(), "2025-03-09T07:00:00-04:00")
+
+    def test_run_once(self):
+        self.assertEqual(self.daemon.run_once("Asia/Tokyo"), Result.success)
+        names, now = self.call_list[0]
+        self.assertEqual(names, ["tokyo", "osaka"])
+        # Manager.run には現地時刻をタイムゾーン無しで渡す
+        self.assertIsNone(now.tzinfo)
+        self.assertLess(abs(now - datetime.now(ZoneInfo("Asia/Tokyo")).replace(tzinfo=None)).total_seconds(), 60)
+
+        # 実行が例外を送出しても常駐は続ける
+        def run_failing(locations, now):
+            raise RuntimeError("unexpected")
+
+        self.manager.run = run_failing
+        with self.assertLogs("we_wish_the_perfect_weather.daemon", "ERROR"):
+            self.assertEqual(self.daemon.run_once("America/New_York"), Result.failed)
+
+    def test_run_forever(self):
+        # 起動直後に全タイムゾーンについて一度実行し、停止を要求されたら終了する
+        threading.Timer(0.3, self.daemon.stop).start()
+        self.assertEqual(self.daemon.run_forever(), Result.success)
+        self.assertEqual([names for names, _ in self.call_list], [["tokyo", "osaka"], ["new_york"]])
+        self.assertEqual(set(self.daemon.next_run_at), {"Asia/Tokyo", "America/New_York"})
+
+    def test_run_forever_schedule(self):
+        # 次の実行日時を過ぎたタイムゾーンのみ実行する（New York のみ 0.1秒ごとに実行日時を迎えるものとする）
+        class ScheduledDaemon(Daemon):
+            def get_next_run_at(self, timezone: str, now: datetime) -> datetime:
+                if timezone == "America/New_York":
+                    return now + timedelta(seconds=0.1)
+                return super().get_next_run_at(timezone, now)
+
+        daemon = ScheduledDaemon(self.manager)
+        threading.Timer(0.5, daemon.stop).start()
+        daemon.run_forever()
+        name_list = [names for names, _ in self.call_list]
+        self.assertEqual(name_list[:2], [["tokyo", "osaka"], ["new_york"]])
+        self.assertGreaterEqual(len(name_list), 4)
+        self.assertEqual(name_list[2:], [["new_york"]] * (len(name_list) - 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
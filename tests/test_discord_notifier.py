@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+from we_wish_the_perfect_weather.discord_notifier import DiscordNotifier
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Discord の webhook のスタブ
+
+    Notes:
+        受け取った content と時刻を request_list に残す
+        response_list に積んだ (ステータスコード, ヘッダ, ボディ) を順に返し、無くなったら 204 を返す
+    """
+
+    request_list: list[tuple[float, str]] = []
+    response_list: list[tuple[int, dict, bytes]] = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        WebhookHandler.request_list.append((time.monotonic(), orjson.loads(body)["content"]))
+        status, headers, content = (
+            WebhookHandler.response_list.pop(0) if WebhookHandler.response_list else (204, {}, b"")
+        )
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        return None
+
+
+class TestDiscordNotifierCoalesce(unittest.TestCase):
+    def setUp(self):
+        self.notifier = DiscordNotifier("http://127.0.0.1:9/webhook")
+
+    def tearDown(self):
+        self.notifier.close(timeout=5)
+
+    def test_coalesce(self):
+        content_list = self.notifier.coalesce(["a", "b", "c"])
+        self.assertEqual(content_list, ["```a\nb\nc```"])
+
+        # 上限文字数を超える場合は、メッセージの区切りで分ける
+        message = "x" * 900
+        content_list = self.notifier.coalesce([message] * 3)
+        self.assertEqual(content_list, [f"```{message}\n{message}```", f"```{message}```"])
+
+    def test_split_long_message(self):
+        # 1つで上限文字数を超えるメッセージは、行の区切りで分け、長すぎる行はさらに分ける
+        line = "y" * 1500
+        long_line = "z" * 4500
+        content_list = self.notifier.coalesce([f"{line}\n{line}\n{long_line}", "tail"])
+        self.assertTrue(all(len(content) <= DiscordNotifier.MAX_CONTENT_LENGTH for content in content_list))
+        body_list = [content.removeprefix("```").removesuffix("```") for content in content_list]
+        self.assertEqual("\n".join(body_list).replace("\n", ""), line * 2 + long_line + "tail")
+        self.assertEqual(body_list[:2], [line, line])
+
+
+class TestDiscordNotifierSend(unittest.TestCase):
+    def setUp(self):
+        WebhookHandler.request_list = []
+        WebhookHandler.response_list = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), WebhookHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.notifier = DiscordNotifier(f"http://127.0.0.1:{self.server.server_port}/webhook")
+
+    def tearDown(self):
+        self.notifier.close(timeout=5)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_after(self):
+        # 429 の Retry-After ヘッダ、無ければボディの retry_after 秒だけ待ってから送り直す
+        WebhookHandler.response_list = [
+            (429, {"Retry-After": "0.3"}, b"{}"),
+            (429, {}, orjson.dumps({"retry_after": 0.2})),
+        ]
+        start = time.monotonic()
+        self.notifier.post("message")
+        self.assertTrue(self.notifier.flush(timeout=5))
+
+        self.assertEqual([content for _, content in WebhookHandler.request_list], ["```message```"] * 3)
+        time_list = [at for at, _ in WebhookHandler.request_list]
+        self.assertGreaterEqual(time_list[1] - time_list[0], 0.3)
+        self.assertGreaterEqual(time_list[2] - time_list[1], 0.2)
+        self.assertLess(time_list[2] - start, 3.0)
+
+    def test_rate_limit_remaining(self):
+        # 残り回数が 0 になった場合は、X-RateLimit-Reset-After 秒だけ次の送信を待つ
+        WebhookHandler.response_list = [(204, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.3"}, b"")]
+        self.notifier.send("first")
+        self.notifier.send("second")
+        time_list = [at for at, _ in WebhookHandler.request_list]
+        self.assertGreaterEqual(time_list[1] - time_list[0], 0.3)
+
+    def test_long_message(self):
+        self.notifier.post("\n".join(["w" * 100] * 50))
+        self.assertTrue(self.notifier.flush(timeout=5))
+        self.assertEqual(len(WebhookHandler.request_list), 3)
+        self.assertTrue(
+            all(len(content) <= DiscordNotifier.MAX_CONTENT_LENGTH for _, content in WebhookHandler.request_list)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import csv
+import importlib.util
+import tempfile
+import unittest
+from pathlib import Path
+
+import orjson
+
+from tests.fixtures import build_records
+from we_wish_the_perfect_weather.exporter import WeatherExporter
+from we_wish_the_perfect_weather.model import Weather
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+
+class TestWeatherExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.weather_db = WeatherDBController(self.tmp_path / "PW_DB.db")
+        self.weather_db.upsert_many(build_records(2 * 60, n_days=30))
+        # chunk の区切りをまたいで書き出す
+        self.exporter = WeatherExporter(self.weather_db, chunk_size=7)
+        self.column_list = [c.name for c in Weather.__table__.columns]
+        self.record_list = [
+            dict(zip(self.column_list, row)) for _, row_list in self.weather_db.iter_chunks() for row in row_list
+        ]
+
+    def tearDown(self):
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def assert_no_temp_file(self, directory: Path):
+        self.assertEqual([path.name for path in directory.iterdir() if path.name.endswith(".tmp")], [])
+
+    def test_csv(self):
+        path = self.tmp_path / "export" / "weather.csv"
+        self.assertEqual(self.exporter.export(path, "csv"), len(self.record_list))
+        with path.open(encoding="utf-8", newline="") as f:
+            row_list = list(csv.reader(f))
+        self.assertEqual(row_list[0], self.column_list)
+        self.assertEqual(
+            row_list[1:],
+            [[str(record[column]) for column in self.column_list] for record in self.record_list],
+        )
+        self.assert_no_temp_file(path.parent)
+
+    def test_jsonl(self):
+        path = self.tmp_path / "weather.jsonl"
+        count = self.exporter.export(path, "jsonl", "2025-05-20", "2025-05-25", "actual")
+        expected_list = [
+            record
+            for record in self.record_list
+            if "2025-05-20" <= record["target_date"] <= "2025-05-25" and record["record_type"] == "actual"
+        ]
+        self.assertEqual(count, 2 * 6)
+        self.assertEqual([orjson.loads(line) for line in path.read_bytes().splitlines()], expected_list)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        path = self.tmp_path / "weather.parquet"
+        self.assertEqual(self.exporter.export(path, "parquet"), len(self.record_list))
+        parquet_file = pq.ParquetFile(path)
+        # chunk ごとに1つの row group とする
+        self.assertEqual(parquet_file.num_row_groups, -(-len(self.record_list) // 7))
+        self.assertEqual(parquet_file.read().to_pylist(), self.record_list)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.exporter.export(self.tmp_path / "weather.xml", "xml")
+
+        # 書き出しに失敗した場合は、既存のファイルを残して一時ファイルを消す
+        path = self.tmp_path / "weather.csv"
+        path.write_text("previous", encoding="utf-8")
+
+        def write_failing(chunks, temp_path):
+            temp_path.write_text("partial", encoding="utf-8")
+            raise OSError("disk full")
+
+        self.exporter.write_csv = write_failing
+        with self.assertRaises(OSError):
+            self.exporter.export(path, "csv")
+        self.assertEqual(path.read_text(encoding="utf-8"), "previous")
+        self.assert_no_temp_file(self.tmp_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import orjson
+
+from we_wish_the_perfect_weather.instrumentation import Instrumentation
+
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.instrumentation = Instrumentation()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def record(self, instrumentation: Instrumentation) -> None:
+        instrumentation.observe("fetch", 0.5, fetcher="OpenMeteoFetcher")
+        instrumentation.observe("fetch", 1.5, fetcher="OpenMeteoFetcher")
+        instrumentation.add("rows_written", 2)
+        instrumentation.add("fetch_failures", status="404")
+
+    def test_to_dict(self):
+        self.record(self.instrumentation)
+        with self.instrumentation.span("upsert"):
+            pass
+        report = self.instrumentation.to_dict({"result": "success"})
+
+        span_dict = {span["name"]: span for span in report["spans"]}
+        self.assertEqual(span_dict["fetch"]["labels"], {"fetcher": "OpenMeteoFetcher"})
+        self.assertEqual(
+            (span_dict["fetch"]["count"], span_dict["fetch"]["total"], span_dict["fetch"]["max"]), (2, 2.0, 1.5)
+        )
+        self.assertEqual(span_dict["upsert"]["count"], 1)
+        self.assertEqual(
+            sorted(report["counters"], key=lambda counter: counter["name"]),
+            [
+                {"name": "fetch_failures", "labels": {"status": "404"}, "value": 1},
+                {"name": "rows_written", "labels": {}, "value": 2},
+            ],
+        )
+        self.assertEqual(report["result"], "success")
+
+        self.instrumentation.reset()
+        report = self.instrumentation.to_dict()
+        self.assertEqual((report["spans"], report["counters"]), ([], []))
+
+    def test_merge(self):
+        # ワーカープロセスの集計を加える
+        self.record(self.instrumentation)
+        worker = Instrumentation()
+        self.record(worker)
+        worker.observe("fetch", 3.0, fetcher="OpenMeteoFetcher")
+        self.instrumentation.merge(orjson.loads(orjson.dumps(worker.to_dict())))
+
+        report = self.instrumentation.to_dict()
+        span = report["spans"][0]
+        self.assertEqual((span["count"], span["total"], span["max"]), (5, 7.0, 3.0))
+        counter_dict = {counter["name"]: counter["value"] for counter in report["counters"]}
+        self.assertEqual(counter_dict, {"rows_written": 4, "fetch_failures": 2})
+
+    def test_export(self):
+        self.record(self.instrumentation)
+        config = {
+            "instrumentation": {
+                "report_path": str(self.tmp_path / "report" / "run_report.jsonl"),
+                "prometheus_path": str(self.tmp_path / "prom" / "run_report.prom"),
+            }
+        }
+        self.instrumentation.export(config, {"degraded": {"PollenCountFetcher": "timeout"}})
+        self.instrumentation.export(config)
+
+        # JSON Lines には実行ごとに1行追記する
+        line_list = (self.tmp_path / "report" / "run_report.jsonl").read_bytes().splitlines()
+        self.assertEqual(len(line_list), 2)
+        self.assertEqual(orjson.loads(line_list[0])["degraded"], {"PollenCountFetcher": "timeout"})
+
+        # Prometheus のファイルは最後の実行の内容で置き換える
+        prom = (self.tmp_path / "prom" / "run_report.prom").read_text(encoding="utf-8")
+        self.assertIn('pw_stage_seconds{stage="fetch",fetcher="OpenMeteoFetcher"} 2\n', prom)
+        self.assertIn('pw_stage_max_seconds{stage="fetch",fetcher="OpenMeteoFetcher"} 1.5\n', prom)
+        self.assertIn("# HELP pw_rows_written Weather rows upserted in the last run.\n", prom)
+        self.assertIn("pw_rows_written 2\n", prom)
+        self.assertIn('pw_fetch_failures{status="404"} 1\n', prom)
+        self.assertNotIn("pw_fetcher_degraded", prom)
+        self.assertEqual([path.name for path in (self.tmp_path / "prom").iterdir()], ["run_report.prom"])
+
+    def test_export_failure(self):
+        # 書き出しに失敗しても例外は送出しない
+        (self.tmp_path / "file").write_text("")
+        config = {"instrumentation": {"report_path": str(self.tmp_path / "file" / "run_report.jsonl")}}
+        with self.assertLogs("we_wish_the_perfect_weather.instrumentation", "WARNING"):
+            self.instrumentation.export(config)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import orjson
+
+from we_wish_the_perfect_weather.process_lock import ProcessLock
+from we_wish_the_perfect_weather.util import get_target_dates
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+REPOSITORY_PATH = Path(__file__).resolve().parents[1]
+# main.py の記録済判定（fast path）では読み込まないモジュール
+IMPORT_FORBIDDEN_MODULES = ["sqlalchemy", "numpy", "httpx"]
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        # main.py はカレントディレクトリの log/logging.ini を読み、log.txt に書き出すため、一時ディレクトリで実行する
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        (self.tmp_path / "log").mkdir()
+        shutil.copy(REPOSITORY_PATH / "log" / "logging.ini", self.tmp_path / "log" / "logging.ini")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_python(self, code: str, *args: str) -> str:
+        env = os.environ | {"PYTHONPATH": str(REPOSITORY_PATH / "src")}
+        completed = subprocess.run(
+            [sys.executable, "-c", code, *args], cwd=self.tmp_path, env=env, capture_output=True, check=True, text=True
+        )
+        return completed.stdout
+
+    def test_fast_path_imports(self):
+        # 記録済のDBを用意する（done_check が参照する列のみ）
+        target_date1, target_date2 = get_target_dates(datetime.now())
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            conn.execute("CREATE TABLE Weather (location, target_date, record_type, is_stale)")
+            conn.executemany(
+                "INSERT INTO Weather VALUES (?, ?, ?, 0)",
+                [("tokyo", target_date1, "actual"), ("tokyo", target_date2, "forecast")],
+            )
+        conn.close()
+        config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917"}],
+            "db": {"save_path": str(self.tmp_path), "save_file_name": "PW_DB.db"},
+        }
+
+        code = "\n".join([
+            "import sys",
+            "import orjson",
+            "import main",
+            "done = main.is_already_done(orjson.loads(sys.argv[1]))",
+            f"loaded = [m for m in {IMPORT_FORBIDDEN_MODULES!r} if m in sys.modules]",
+            "print(orjson.dumps({'done': done, 'loaded': loaded}).decode())",
+        ])
+        output = orjson.loads(self.run_python(code, orjson.dumps(config).decode()).splitlines()[-1])
+        self.assertTrue(output["done"])
+        self.assertEqual(output["loaded"], [])
+
+    def test_suppress_library_log(self):
+        # main の読み込み後に作られるライブラリのロガーのログも出力しない
+        code = "\n".join([
+            "from logging import getLogger",
+            "import main",
+            "getLogger('httpx').info('HTTP Request: GET https://example.com')",
+            "getLogger('we_wish_the_perfect_weather.manager').info('own log')",
+        ])
+        output = self.run_python(code)
+        self.assertIn("own log", output)
+        self.assertNotIn("HTTP Request", output)
+        self.assertIn("own log", (self.tmp_path / "log.txt").read_text())
+        self.assertNotIn("HTTP Request", (self.tmp_path / "log.txt").read_text())
+
+    def test_readonly_command_migration(self):
+        # 以前のスキーマのDBを用意する
+        WeatherDBController(self.tmp_path / "PW_DB.db").engine.dispose()
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            conn.execute("PRAGMA user_version = 4")
+        conn.close()
+        (self.tmp_path / "config").mkdir()
+        config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917"}],
+            "db": {"save_path": str(self.tmp_path), "save_file_name": "PW_DB.db"},
+        }
+        (self.tmp_path / "config" / "config.json").write_bytes(orjson.dumps(config))
+        code = (
+            "import runpy, sys; sys.argv = ['main.py', *sys.argv[1:]]; runpy.run_module('main', run_name='__main__')"
+        )
+        query_args = ["query", "--from", "2025-01-01", "--to", "2025-12-31"]
+
+        # 他の実行がロックを保持している間は、読み取りのみのサブコマンドでもスキーマを移行しない
+        lock = ProcessLock(self.tmp_path / "prevent_multiple_run")
+        self.assertTrue(lock.acquire())
+        try:
+            output = self.run_python(code, *query_args)
+        finally:
+            lock.release()
+        self.assertIn("DB schema migration is required", output)
+        self.assertTrue(WeatherDBController.is_migration_needed(self.tmp_path / "PW_DB.db"))
+
+        # ロックを取得できれば移行してから実行する
+        output = self.run_python(code, *query_args)
+        self.assertIn("0 perfect day(s) found.", output)
+        self.assertFalse(WeatherDBController.is_migration_needed(self.tmp_path / "PW_DB.db"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from we_wish_the_perfect_weather.fetcher_base import FetcherBase
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher
+from we_wish_the_perfect_weather.util import Result
+
+
+class TestManagerReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        self.config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "citycode": "13104"}],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+            "db": {"save_path": str(tmp_path), "save_file_name": "PW_DB.db"},
+        }
+        self.manager = Manager(self.config)
+
+    def tearDown(self):
+        self.manager.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def build_hourly_records(self, target_date: str, nan_hour: int | None = None) -> list[dict]:
+        """target_date の1日分の、"完璧な気候" の一定値の HourlyObservation レコードを返す
+
+        nan_hour を指定した場合は、その時間の気温を欠測(NaN)とする
+        """
+        # 気温, 湿度, 降水量, 降水確率, 風速[km/h], 花粉飛散数
+        value_list = [20.0, 50.0, 0.0, 0.0, 3.6, 0.0]
+        hourly_values = {
+            variable: np.full(24, value, dtype=FetcherBase.HOURLY_DTYPE)
+            for variable, value in zip([*OpenMeteoFetcher.HOURLY_VARIABLES, "pollen_count"], value_list)
+        }
+        if nan_hour is not None:
+            hourly_values["temperature_2m"][nan_hour] = np.nan
+        return [
+            {
+                "location": "tokyo",
+                "target_date": target_date,
+                "record_type": "actual",
+                "variable": variable,
+                "hourly_values": values.tobytes(),
+                "registered_at": "2025-03-01 00:00:00",
+            }
+            for variable, values in hourly_values.items()
+        ]
+
+    def test_replay_skips_day_with_gap(self):
+        hourly_record_list = self.build_hourly_records("2025-02-01")
+        hourly_record_list += self.build_hourly_records("2025-02-02", nan_hour=12)
+        hourly_record_list += self.build_hourly_records("2025-02-03")
+        self.manager.weather_db.upsert_hourly_many(hourly_record_list)
+
+        # 欠測を含む日は登録せず、前後の日の再生は続ける
+        self.assertEqual(self.manager.replay("2025-02-01", "2025-02-03"), Result.success)
+        weather_db = self.manager.weather_db
+        self.assertEqual(
+            weather_db.select_target_dates(["tokyo"], "actual", "2025-02-01", "2025-02-03"),
+            {"tokyo": {"2025-02-01", "2025-02-03"}},
+        )
+        perfect_day_list = weather_db.select_perfect_days("2025-02-01", "2025-02-03", "tokyo")
+        self.assertEqual([record["target_date"] for record in perfect_day_list], ["2025-02-01", "2025-02-03"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+from datetime import UTC, datetime
+from pathlib import Path
+
+from we_wish_the_perfect_weather.open_meteo_fetcher import OpenMeteoFetcher
+
+
+class TestOpenMeteoFetcherCacheKey(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        config = {
+            "locations": [
+                {"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "timezone": "Asia/Tokyo"},
+                {"name": "new_york", "latitude": "40.7128", "longitude": "-74.006", "timezone": "America/New_York"},
+            ],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+        }
+        self.fetcher = OpenMeteoFetcher(config)
+        self.url = self.fetcher.api_endpoint_url()
+        self.params = self.fetcher.api_params()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_key_changes_at_local_midnight(self):
+        # 東京の 2025-03-01 23:00, 23:59, 2025-03-02 00:01（ニューヨークはいずれも 2025-03-01 の 9時, 10時台）
+        before = self.fetcher.location_cache_keys(self.url, self.params, datetime(2025, 3, 1, 14, 0, tzinfo=UTC))
+        just_before = self.fetcher.location_cache_keys(self.url, self.params, datetime(2025, 3, 1, 14, 59, tzinfo=UTC))
+        after = self.fetcher.location_cache_keys(self.url, self.params, datetime(2025, 3, 1, 15, 1, tzinfo=UTC))
+        self.assertEqual(before, just_before)
+        self.assertNotEqual(just_before[0], after[0])
+        self.assertEqual(just_before[1], after[1])
+
+    def test_resolve_date_window(self):
+        now = datetime(2025, 3, 1, 15, 1, tzinfo=UTC)
+        params = {"timezone": "Asia/Tokyo", "past_days": 1, "forecast_days": 2}
+        self.assertEqual(
+            OpenMeteoFetcher.resolve_date_window(params, now),
+            {"window_start_date": "2025-03-01", "window_end_date": "2025-03-03"},
+        )
+        # 期間を直接指定する場合（archive）はキーを変えない
+        self.assertEqual(OpenMeteoFetcher.resolve_date_window({"start_date": "2025-03-01"}, now), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
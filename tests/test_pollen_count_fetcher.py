@@ -0,0 +1,191 @@
+import tempfile
+import threading
+import unittest
+from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from we_wish_the_perfect_weather.criteria import MISSING_VALUE, resolve_base
+from we_wish_the_perfect_weather.fetcher_base import FetcherBase, FetchResult
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.pollen_count_fetcher import PollenCountFetcher
+from we_wish_the_perfect_weather.util import get_locations, get_now, get_tomorrow
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """受け取ったリクエストを数えて、常に 503 を返す"""
+
+    count = 0
+
+    def do_GET(self):
+        CountingHandler.count += 1
+        self.send_response(503)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        return None
+
+
+class PerfectWeatherFetcher(FetcherBase):
+    """花粉飛散数以外は常に "完璧な気候" の値を返す fetcher"""
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.locations = get_locations(config)
+
+    def api_endpoint_url(self) -> str:
+        return ""
+
+    def api_params(self) -> dict:
+        return {}
+
+    def fetch_data(self, locations: list[dict] | None = None) -> FetchResult:
+        return FetchResult({}, {location["name"]: {} for location in locations or self.locations}, {}, {})
+
+    def interpret(self, target_date: str, record_type: str, location: str = "") -> dict:
+        return {
+            "location": location,
+            "target_date": target_date,
+            "record_type": record_type,
+            "maximum_temperature": 25.0,
+            "minimum_temperature": 20.0,
+            "maximum_humidity": 60,
+            "minimum_humidity": 45,
+            "maximum_precipitation_probability": 0,
+            "maximum_precipitation": 0.0,
+            "maximum_wind_speed": 1.0,
+        }
+
+
+class TestPollenCountFetcherCircuitOpen(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        CountingHandler.count = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/pollen"
+        self.config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "citycode": "13104"}],
+            "pollen_count": {"url": self.url, "retries": 0, "timeout": 5},
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db"), "failure_threshold": 2},
+            "db": {"save_path": str(tmp_path), "save_file_name": "PW_DB.db"},
+        }
+        self.fetcher = PollenCountFetcher(self.config)
+        for _ in range(2):
+            self.fetcher.circuit_breaker.record_failure(self.url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_fetch_data_without_request(self):
+        result = self.fetcher.fetch_data()
+        self.assertEqual(CountingHandler.count, 0)
+        self.assertEqual(result.failed, {"tokyo": "circuit_open"})
+        self.assertEqual(result.fetched_data, {})
+
+    def test_missing_record_is_stale_and_imperfect(self):
+        manager = Manager(self.config)
+        manager.fetcher_list = [PerfectWeatherFetcher(self.config), self.fetcher]
+        manager.fetch_all(manager.locations)
+        self.assertEqual(manager.degraded, {})
+
+        target_date = get_now()[:10]
+        target_list = [(target_date, "actual", "tokyo"), (target_date, "forecast", "tokyo")]
+        record_list, check_matrix = manager.build_records(target_list)
+        self.assertEqual(len(record_list), 2)
+        for record, check in zip(record_list, check_matrix):
+            self.assertEqual(record["maximum_pollen_count"], MISSING_VALUE)
+            self.assertTrue(record["is_stale"])
+            self.assertFalse(record["is_perfect"])
+            self.assertEqual(check.tolist(), [True] * 7 + [False])
+            self.assertFalse(all(manager.check_perfection(record)))
+
+        # DB 上の判定でも "完璧な気候" とせず、記録済にもしない（次回の実行で取得し直す）
+        manager.weather_db.upsert_many(record_list)
+        self.assertEqual(manager.weather_db.select_perfect_days(target_date, target_date, "tokyo"), [])
+        self.assertEqual(manager.weather_db.select_done_locations(["tokyo"], target_date, target_date), set())
+
+
+class TestPollenCountFetcherNotProvided(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        self.config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "citycode": "13104"}],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+            "db": {"save_path": str(tmp_path), "save_file_name": "PW_DB.db"},
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_tomorrow_forecast_is_perfect(self):
+        # 花粉飛散数は今日の分まで取得できており、明日の分は提供されない
+        today = get_now()[:10]
+        tomorrow = get_tomorrow()[:10]
+        fetcher = PollenCountFetcher(self.config)
+        fetcher.load_hourly(today, "tokyo", {"pollen_count": np.zeros(24, dtype=np.float32)})
+        manager = Manager(self.config)
+        manager.fetcher_list = [PerfectWeatherFetcher(self.config), fetcher]
+
+        record_list, check_matrix = manager.build_records([(tomorrow, "forecast", "tokyo")])
+        self.assertEqual(len(record_list), 1)
+        record = record_list[0]
+        self.assertEqual(record["maximum_pollen_count"], MISSING_VALUE)
+        self.assertFalse(record["is_stale"])
+        self.assertTrue(record["is_perfect"])
+        self.assertEqual(check_matrix[0].tolist(), [True] * 8)
+        self.assertEqual(manager.check_perfection(record), [True] * 8)
+
+        # DB 上の判定（検索・再判定）でも "完璧な気候" とする
+        weather_db = manager.weather_db
+        weather_db.upsert_many(record_list)
+        self.assertEqual(len(weather_db.select_perfect_days(tomorrow, tomorrow, "tokyo", "forecast")), 1)
+        weather_db.rescore(resolve_base({"maximum_wind_speed": 2}))
+        self.assertEqual(len(weather_db.select_perfect_days(tomorrow, tomorrow, "tokyo", "forecast")), 1)
+        weather_db.engine.dispose()
+
+
+class TestPollenCountFetcherDateWindow(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        self.fetcher = PollenCountFetcher({
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917", "citycode": "13104"}],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_api_params_list_uses_local_date(self):
+        # UTC 2025-03-01 02:00 は、東京では 3/1 11:00、ニューヨークでは 2/28 21:00
+        now = datetime(2025, 3, 1, 2, 0, tzinfo=UTC)
+        date_list = [(params["start"], params["end"]) for params in self.fetcher.api_params_list("13104", now=now)]
+        self.assertEqual(date_list, [("20250228", "20250228"), ("20250301", "20250301")])
+        date_list = [
+            (params["start"], params["end"])
+            for params in self.fetcher.api_params_list("13104", "America/New_York", now)
+        ]
+        self.assertEqual(date_list, [("20250227", "20250227"), ("20250228", "20250228")])
+        # 解決できないタイムゾーンは日本時間とする
+        self.assertEqual(self.fetcher.api_params_list("13104", "auto", now)[1]["end"], "20250301")
+
+    def test_response_ttl_uses_local_date(self):
+        # 現地の今日の分は確定していないものとする
+        for timezone in ["Asia/Tokyo", "America/New_York", "Pacific/Kiritimati", "Pacific/Pago_Pago"]:
+            yesterday_params, today_params = self.fetcher.api_params_list("13104", timezone)
+            self.assertEqual(self.fetcher.response_ttl(yesterday_params, timezone), self.fetcher.ttl_finalized)
+            self.assertEqual(self.fetcher.response_ttl(today_params, timezone), self.fetcher.ttl_forecast)
+
+
+if __name__ == "__main__":
+    unittest.main()
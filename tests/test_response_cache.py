@@ -0,0 +1,37 @@
+import unittest
+
+from we_wish_the_perfect_weather.response_cache import ResponseCache
+
+URL = "https://example.com/api"
+
+
+class TestResponseCacheMakeKey(unittest.TestCase):
+    def test_coordinate(self):
+        # 緯度・経度は表記が違うだけの同じ値を同じキーにする
+        key = ResponseCache.make_key(URL, {"latitude": "35.6895", "longitude": "139.6917", "hourly": ["a", "b"]})
+        self.assertEqual(
+            ResponseCache.make_key(URL + "/", {"hourly": ("a", "b"), "longitude": 139.6917, "latitude": 35.68950}),
+            key,
+        )
+        self.assertEqual(
+            ResponseCache.make_key(URL, {"latitude": ["35.6895", "40.7128"]}),
+            ResponseCache.make_key(URL, {"latitude": [35.6895, 40.7128]}),
+        )
+        self.assertNotEqual(ResponseCache.make_key(URL, {"latitude": "35.6896", "longitude": "139.6917"}), key)
+
+    def test_string(self):
+        # それ以外の値は表記のまま比較する
+        self.assertNotEqual(
+            ResponseCache.make_key(URL, {"citycode": "01101"}), ResponseCache.make_key(URL, {"citycode": "1101"})
+        )
+        self.assertNotEqual(
+            ResponseCache.make_key(URL, {"start_date": "20250601"}),
+            ResponseCache.make_key(URL, {"start_date": "20250601.0"}),
+        )
+        self.assertEqual(
+            ResponseCache.make_key(URL, {"is_past": True}), ResponseCache.make_key(URL, {"is_past": "true"})
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
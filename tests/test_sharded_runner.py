@@ -0,0 +1,105 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.fixtures import build_records
+from we_wish_the_perfect_weather.instrumentation import instrumentation
+from we_wish_the_perfect_weather.manager import Manager
+from we_wish_the_perfect_weather.sharded_runner import ShardedRunner, ShardResult
+
+
+class TestShardedRunnerWrite(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_path = Path(self.tmp_dir.name)
+        config = {
+            "locations": [{"name": "tokyo", "latitude": "35.6895", "longitude": "139.6917"}],
+            "cache": {"path": str(tmp_path / "http_cache.db")},
+            "circuit_breaker": {"path": str(tmp_path / "circuit_breaker.db")},
+            "db": {"save_path": str(tmp_path), "save_file_name": "PW_DB.db"},
+        }
+        self.manager = Manager(config)
+        # 1シャードずつ書き込む
+        self.runner = ShardedRunner(self.manager, workers=1, batch_size=1)
+        instrumentation.reset()
+
+    def tearDown(self):
+        self.manager.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def build_result(self, start_index: int) -> ShardResult:
+        """2地点 × 1日 × [実測値, 予報値] のレコードを持つシャードの結果を返す"""
+        record_list = build_records(4, start_index=start_index, n_days=1)
+        return ShardResult(record_list, [], [None] * len(record_list), {}, {})
+
+    def test_write_batches(self):
+        weather_db = self.manager.weather_db
+        upsert_many = weather_db.upsert_many
+        batch_list = []
+
+        def upsert_many_recording(record_list, hourly_record_list=None):
+            batch_list.append(sorted({record["location"] for record in record_list}))
+            return upsert_many(record_list, hourly_record_list)
+
+        message_list = []
+        weather_db.upsert_many = upsert_many_recording
+        self.manager.post_discord_notify = message_list.append
+        # キューに溜まった結果を batch_size 件程度ずつまとめて書き込み、書き込んだ結果の通知文のみ送る
+        self.runner.batch_size = 8
+        for start_index in [0, 4, 8]:
+            result = self.build_result(start_index)
+            self.runner.result_queue.put(result._replace(message_list=[f"message_{start_index}", None, None, None]))
+        self.runner.result_queue.put(None)
+        self.runner.write_loop()
+
+        self.assertEqual(
+            batch_list,
+            [
+                ["location_00000", "location_00001", "location_00002", "location_00003"],
+                ["location_00004", "location_00005"],
+            ],
+        )
+        self.assertEqual(message_list, ["message_0", "message_4", "message_8"])
+        self.assertEqual((self.runner.written_count, self.runner.skipped_locations), (12, []))
+        counter_dict = {counter["name"]: counter["value"] for counter in instrumentation.to_dict()["counters"]}
+        self.assertEqual(counter_dict["rows_written"], 12)
+
+    def test_write_failure_skips_locations(self):
+        weather_db = self.manager.weather_db
+        upsert_many = weather_db.upsert_many
+
+        def upsert_many_failing(record_list, hourly_record_list=None):
+            if record_list[0]["location"] == "location_00002":
+                raise RuntimeError("disk I/O error")
+            return upsert_many(record_list, hourly_record_list)
+
+        weather_db.upsert_many = upsert_many_failing
+        result_list = [self.build_result(0), self.build_result(4), self.build_result(8)]
+        for result in result_list:
+            self.runner.result_queue.put(result)
+        self.runner.result_queue.put(None)
+        with self.assertLogs("we_wish_the_perfect_weather.sharded_runner", "ERROR"):
+            self.runner.write_loop()
+
+        # 失敗したバッチの地点のみ skipped_locations に加え、前後のバッチは書き込む
+        self.assertEqual(self.runner.skipped_locations, ["location_00002", "location_00003"])
+        self.assertEqual(self.runner.written_count, 8)
+        counter_dict = {counter["name"]: counter["value"] for counter in instrumentation.to_dict()["counters"]}
+        self.assertEqual(counter_dict["locations_skipped"], 2)
+        target_date = result_list[0].record_list[0]["target_date"]
+        registered = weather_db.select_target_dates(
+            [f"location_{i:05d}" for i in range(6)], "actual", target_date, target_date
+        )
+        self.assertEqual(
+            {location for location, date_set in registered.items() if date_set},
+            {
+                "location_00000",
+                "location_00001",
+                "location_00004",
+                "location_00005",
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
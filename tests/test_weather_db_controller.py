@@ -0,0 +1,203 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.fixtures import build_records
+from we_wish_the_perfect_weather.criteria import CRITERIA_COLUMNS, PW_BASE, criteria_version, evaluate_perfection
+from we_wish_the_perfect_weather.model import Weather
+from we_wish_the_perfect_weather.weather_db_controller import WeatherDBController
+
+
+class TestWeatherDBControllerStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+        self.weather_db = WeatherDBController(self.tmp_path / "PW_DB.db")
+        # 5地点 × 1年分を、地点ごとに日付が前後する順（過去の日付の実測値を含む）で登録する
+        self.record_list = build_records(5 * 365)[::-1]
+        self.location_list = sorted({record["location"] for record in self.record_list})
+
+    def tearDown(self):
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def select_stats(self) -> list:
+        return [
+            (self.weather_db.select_monthly_stats(location), self.weather_db.select_streak(location))
+            for location in self.location_list
+        ]
+
+    def assert_stats_rebuilt(self):
+        """集計テーブルが、全レコードから集計し直した場合と一致すること"""
+        stats_list = self.select_stats()
+        self.assertTrue(all(monthly_stats for monthly_stats, _ in stats_list))
+        self.weather_db.rebuild_stats()
+        self.assertEqual(stats_list, self.select_stats())
+
+    def test_upsert_each(self):
+        for record in self.record_list[:200]:
+            self.weather_db.upsert(record)
+        self.weather_db.upsert_many(self.record_list[200:])
+        self.assert_stats_rebuilt()
+
+    def test_deferred_stats(self):
+        with self.weather_db.deferred_stats():
+            for record in self.record_list[:200]:
+                self.weather_db.upsert(record)
+            with self.weather_db.deferred_stats():
+                self.weather_db.upsert_many(self.record_list[200:])
+            # 抜けるまでは集計しない
+            self.assertEqual(self.select_stats(), [([], None)] * len(self.location_list))
+        self.assert_stats_rebuilt()
+
+    def test_index_set(self):
+        # 以前のスキーマのインデックスが残ったDBを開き直すと、モデルで定義したインデックスのみになる
+        self.weather_db.engine.dispose()
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            conn.execute("DROP INDEX ix_weather_target_date")
+            conn.execute("CREATE INDEX ix_weather_record_type_date ON Weather (record_type, target_date)")
+            conn.execute("PRAGMA user_version = 3")
+        conn.close()
+        self.weather_db = WeatherDBController(self.tmp_path / "PW_DB.db")
+
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            name_set = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Weather' AND sql IS NOT NULL"
+                )
+            }
+        conn.close()
+        self.assertEqual(name_set, {index.name for index in Weather.__table__.indexes})
+
+    def test_migrate_duplicates(self):
+        # 一意制約の無い以前のスキーマのDBに重複レコードがある場合は、最後に登録されたものを残して件数をログに残す
+        self.weather_db.upsert_many(self.record_list[:10])
+        self.weather_db.engine.dispose()
+        with sqlite3.connect(self.tmp_path / "PW_DB.db") as conn:
+            conn.execute("DROP INDEX ux_weather_key")
+            columns = ", ".join(c.name for c in Weather.__table__.columns if c.name != "id")
+            conn.execute(f"INSERT INTO Weather ({columns}) SELECT {columns} FROM Weather ORDER BY id LIMIT 3")
+            conn.execute("UPDATE Weather SET maximum_temperature = -1 WHERE id > 10")
+            conn.execute("PRAGMA user_version = 4")
+        conn.close()
+        with self.assertLogs("we_wish_the_perfect_weather.db_controller_base", "WARNING") as cm:
+            self.weather_db = WeatherDBController(self.tmp_path / "PW_DB.db")
+        self.assertIn("removed 3 duplicate Weather row(s)", cm.output[0])
+
+        record_list = self.weather_db.select(limit=100)
+        self.assertEqual(len(record_list), 10)
+        self.assertEqual(sum(record["maximum_temperature"] == -1 for record in record_list), 3)
+
+
+class TestWeatherDBControllerPage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.weather_db = WeatherDBController(Path(self.tmp_dir.name) / "PW_DB.db")
+        # 3地点 × 30日分、同じ日付のレコードが複数あり、ページの区切りが日付の途中になる
+        self.weather_db.upsert_many(build_records(3 * 60, n_days=30))
+        self.row_list = self.weather_db.select_page(page_size=1000)
+
+    def tearDown(self):
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_select_page(self):
+        self.assertEqual(len(self.row_list), 3 * 60)
+        self.assertEqual(
+            [(row.target_date, row.id) for row in self.row_list],
+            sorted((row.target_date, row.id) for row in self.row_list),
+        )
+
+        # 前のページの最後の行の次から、重複も抜けも無く続く
+        page_list = []
+        after = None
+        while page := self.weather_db.select_page(after, page_size=7):
+            page_list.append(page)
+            after = (page[-1].target_date, page[-1].id)
+        self.assertEqual(len(page_list), -(-len(self.row_list) // 7))
+        self.assertEqual([row for page in page_list for row in page], self.row_list)
+
+    def test_iter_records(self):
+        # ページの大きさによらず、1回で取得した場合と同じ行を返す
+        for page_size in [1, 6, 180, 1000]:
+            self.assertEqual(list(self.weather_db.iter_records(page_size=page_size)), self.row_list)
+
+        row_list = list(
+            self.weather_db.iter_records("2025-05-10", "2025-05-20", "forecast", is_perfect=False, page_size=4)
+        )
+        expected_list = [
+            row
+            for row in self.row_list
+            if "2025-05-10" <= row.target_date <= "2025-05-20" and row.record_type == "forecast" and not row.is_perfect
+        ]
+        self.assertTrue(expected_list)
+        self.assertEqual(row_list, expected_list)
+
+        # 読んでいる間に登録されたレコードも、まだ読んでいない位置であれば返る
+        row_iter = self.weather_db.iter_records(page_size=10)
+        head_list = [next(row_iter) for _ in range(10)]
+        self.weather_db.upsert_many(build_records(2, start_index=3 * 60 + 58, n_days=30))
+        self.assertEqual(len(head_list) + len(list(row_iter)), 3 * 60 + 2)
+
+
+class TestWeatherDBControllerRescore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.weather_db = WeatherDBController(Path(self.tmp_dir.name) / "PW_DB.db")
+        # is_perfect は閾値と無関係な乱数、criteria_version は空文字列のレコード
+        self.record_list = build_records(3 * 365)
+        self.weather_db.upsert_many(self.record_list)
+
+    def tearDown(self):
+        self.weather_db.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def assert_rescored(self, base: dict):
+        """is_perfect が evaluate_perfection の判定と、集計テーブルが全レコードから集計し直した場合と一致すること"""
+        row_list = list(self.weather_db.iter_records())
+        columns = {column: [getattr(row, column) for row in row_list] for column in [*CRITERIA_COLUMNS, "is_stale"]}
+        _, is_perfect = evaluate_perfection(columns, base)
+        self.assertEqual([row.is_perfect for row in row_list], is_perfect.tolist())
+        self.assertEqual({row.criteria_version for row in row_list}, {criteria_version(base)})
+
+        location_list = sorted({row.location for row in row_list})
+        stats_list = [
+            (self.weather_db.select_monthly_stats(location), self.weather_db.select_streak(location))
+            for location in location_list
+        ]
+        self.weather_db.rebuild_stats()
+        self.assertEqual(
+            stats_list,
+            [
+                (self.weather_db.select_monthly_stats(location), self.weather_db.select_streak(location))
+                for location in location_list
+            ],
+        )
+
+    def test_rescore(self):
+        self.assertEqual(self.weather_db.rescore(PW_BASE), len(self.record_list))
+        self.assert_rescored(PW_BASE)
+        # 現行の基準で判定済のレコードは再判定しない
+        self.assertEqual(self.weather_db.rescore(PW_BASE), 0)
+
+        # 閾値を変更した場合は全レコードを再判定する
+        # （降水量の基準のみで判定し、"完璧な気候" の日と否の日が混在する閾値とする）
+        base = PW_BASE | {
+            "maximum_temperature": 40,
+            "minimum_temperature": 0,
+            "maximum_humidity": 100,
+            "minimum_humidity": 0,
+            "maximum_precipitation_probability": 100,
+            "maximum_wind_speed": 10,
+            "maximum_pollen_count": 100,
+        }
+        self.assertEqual(self.weather_db.rescore(base), len(self.record_list))
+        self.assert_rescored(base)
+        n_perfect = len(list(self.weather_db.iter_records(is_perfect=True)))
+        self.assertTrue(0 < n_perfect < len(self.record_list))
+
+
+if __name__ == "__main__":
+    unittest.main()